@@ -1,10 +1,13 @@
 # Python 3 server example
 import logging
 import re
+import functools
 from server.navdata.loader import NavDatabase
 from server.navdata.builder import build_3d
 import server.navdata.point_builder as point_builder
 from server.server import *
+from server.serving import make_server
+from server.buildpool import BuildPool
 
 logger = logging.getLogger("cifp-viewer")
 logging.basicConfig(format='[%(asctime)s] %(name)s (%(levelname)s): %(message)s')
@@ -38,13 +41,29 @@ serverPort = int(cfg["port"])
 set_config(cfg)
 if navdata_dir.endswith("/"): navdata_dir = navdata_dir[:-1]
 logger.info("Loading navdata from " + navdata_dir + ".")
-navdata = NavDatabase(navdata_dir)
+# the build workers load the navdata the same way
+load_navdata = functools.partial(
+  NavDatabase,
+  navdata_dir,
+  cache_entries=int(cfg.get("procedure_cache_entries", "256")),
+  cache_bytes=int(cfg.get("procedure_cache_bytes", "0")))
+navdata = load_navdata()
 set_navdata(navdata)
 logger.info("Navdata loaded.")
 
+set_build_cache(BuildCache(max_bytes=int(cfg.get("build_cache_bytes", "268435456"))))
+
+build_workers = int(cfg.get("build_workers", "2"))
+pool = None
+if build_workers > 0:
+  pool = BuildPool(build_workers, int(cfg.get("build_queue", "32")), load_navdata)
+  set_build_pool(pool)
+  logger.info(f"Started {build_workers} build workers.")
+
 def start_server():
-  webServer = HTTPServer((hostName, serverPort), CIFPServer)
-  logger.info("Server started http://%s:%s" % (hostName, serverPort))
+  mode = cfg.get("server_mode", "threaded")
+  webServer = make_server(mode, (hostName, serverPort), CIFPServer, int(cfg.get("server_workers", "16")))
+  logger.info("Server started http://%s:%s (%s)" % (hostName, serverPort, mode))
 
   try:
     webServer.serve_forever()
@@ -52,6 +71,7 @@ def start_server():
     pass
 
   webServer.server_close()
+  if pool: pool.shutdown()
   logger.info("Server stopped.")
 
 DEBUG = False
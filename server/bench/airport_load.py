@@ -0,0 +1,44 @@
+# Measures the memory used by an airport's parsed procedures, with and without sharing
+# identical fixes/courses/restrictions between legs, and the time until the first
+# /airport/ICAO request for it can be answered (parse, or load the precompiled artifact).
+#
+# Usage: python -m server.bench.airport_load [data_dir] [ICAO ...]
+import sys
+import time
+import tempfile
+import tracemalloc
+from server.navdata.loader import NavDatabase
+import server.navdata.artifacts as artifacts
+
+DEFAULT_AIRPORTS = ["KSFO", "KJFK", "EGLL", "KDEN"]
+
+def measure_memory(navdata: NavDatabase, airport: str, intern: bool) -> int:
+  tracemalloc.start()
+  procs = navdata.parse_airport(airport, intern)
+  size = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  del procs
+  return size
+
+def measure_first_request(navdata: NavDatabase, airport: str) -> float:
+  navdata.procedure_cache.clear()
+  start = time.perf_counter()
+  navdata.get_airport_data(airport)
+  return time.perf_counter() - start
+
+if __name__ == "__main__":
+  dir = sys.argv[1] if len(sys.argv) > 1 else "navdata"
+  airports = sys.argv[2:] or DEFAULT_AIRPORTS
+
+  navdata = NavDatabase(dir)
+  # keep the benchmark's artifacts away from the real ones
+  artifacts.ARTIFACT_DIR = tempfile.mkdtemp()
+
+  print(f"{'airport':8}{'plain KiB':>12}{'interned KiB':>14}{'parse ms':>10}{'artifact ms':>13}")
+  for airport in airports:
+    plain = measure_memory(navdata, airport, False)
+    interned = measure_memory(navdata, airport, True)
+    # the first call parses and writes the artifact, the second one loads it
+    parse = measure_first_request(navdata, airport)
+    load = measure_first_request(navdata, airport)
+    print(f"{airport:8}{plain / 1024:>12.0f}{interned / 1024:>14.0f}{parse * 1000:>10.1f}{load * 1000:>13.1f}")
@@ -0,0 +1,120 @@
+# Regression check of point_builder.build_alt_constr against the nested loops it replaced,
+# on the legs of every combination of every procedure of a set of airports, in both
+# directions. The altitude windows of every leg must be the same.
+# Also reports the time taken by each, and on one long list of legs made from all of them.
+# Exits with status 1 if any window differs.
+#
+# Usage: python -m server.bench.alt_constr [data_dir] [ICAO ... | ALL]
+import sys
+import time
+import server.navdata.builder as builder
+from server.navdata.point_builder import build_alt_constr
+from server.navdata.defns import *
+from server.bench.corpus import load_navdata, parse_airports
+
+# the longest list of legs made for the time of a single build
+LONG_LEGS = 2000
+
+# the version before it was made linear: the below pass runs again for every leg
+def build_alt_constr_nested(legs: list[Leg], ascending: bool):
+  aboves: list[float] = [-float('inf')] * len(legs)
+  belows: list[float] = [float('inf')] * len(legs)
+
+  cur_min: float = -float('inf')
+
+  above_iter = legs if ascending else reversed(legs)
+  below_iter = reversed(legs) if ascending else legs
+
+  for i, leg in enumerate(above_iter):
+    match leg.info.alt:
+      case None: pass
+      case AtAlt(at) | StepDownAt(at):
+        cur_min = at
+      case AltRange(above, below):
+        if not above is None: cur_min = above
+      case GlideslopeAlt(_, alt, is_above) | GlideslopeIntc(_, alt, is_above):
+        cur_min = alt
+      case StepDownAboveBelow(alt, _, is_above):
+        if is_above:
+          cur_min = alt
+      case AltRestr(): pass
+
+    if ascending:
+      aboves[i] = cur_min
+    else:
+      aboves[len(legs) - i - 1] = cur_min
+
+    cur_max: float = float('inf')
+
+    for i, leg in enumerate(below_iter):
+      match leg.info.alt:
+        case None: pass
+        case AtAlt(at) | StepDownAt(at):
+          cur_max = at
+        case AltRange(above, below):
+          if not below is None: cur_max = below
+        case StepDownAboveBelow(alt, _, is_above):
+          if not is_above:
+            cur_max = alt
+        case AltRestr(): pass
+
+      if ascending:
+        belows[len(legs) - i - 1] = cur_max
+      else:
+        belows[i] = cur_max
+
+  cstrs = list(zip(aboves, belows))
+  for i in range(len(cstrs)):
+    a, b = cstrs[i]
+    cstrs[i] = (a, max(a, b))
+
+  return cstrs
+
+# the lists of legs that build_proc gives to build_points for a combination
+def combination_legs(proc: SID | STAR | Approach, rwy: str | None, trans: str | None) -> list[list[Leg]]:
+  transition = builder.get_transition(proc, trans) if trans else []
+  match proc:
+    case SID():
+      return [proc.rwys[rwy] + transition]
+    case STAR():
+      return [transition + proc.rwys[rwy]]
+    case Approach():
+      legs = proc.legs
+      for i, leg in enumerate(legs):
+        if leg.info.fmap:
+          return [transition + legs[:i], legs[i:]]
+      return [transition + legs, []]
+
+def timed(f, inputs: list[list[Leg]]) -> float:
+  start = time.perf_counter()
+  for legs in inputs:
+    f(legs, True)
+    f(legs, False)
+  return time.perf_counter() - start
+
+def main():
+  dir = sys.argv[1] if len(sys.argv) > 1 else "navdata"
+  navdata = load_navdata(dir)
+
+  inputs = []
+  for airport in parse_airports(navdata, sys.argv[2:]):
+    data = navdata.get_airport_data(airport)
+    if data is None: continue
+    for _, proc, rwy, trans in builder.iter_combinations(*data):
+      inputs += combination_legs(proc, rwy, trans)
+
+  differ = 0
+  for legs in inputs:
+    for ascending in (True, False):
+      differ += build_alt_constr(legs, ascending) != build_alt_constr_nested(legs, ascending)
+
+  legs_count = sum(len(legs) for legs in inputs)
+  print(f"{len(inputs)} lists of legs, {legs_count} legs, {differ} differ")
+  print(f"nested {timed(build_alt_constr_nested, inputs) * 1000:.1f}ms, linear {timed(build_alt_constr, inputs) * 1000:.1f}ms")
+
+  long_legs = [[leg for legs in inputs for leg in legs][:LONG_LEGS]]
+  print(f"{len(long_legs[0])} legs at once: nested {timed(build_alt_constr_nested, long_legs) * 1000:.1f}ms, linear {timed(build_alt_constr, long_legs) * 1000:.1f}ms")
+  sys.exit(1 if differ else 0)
+
+if __name__ == "__main__":
+  main()
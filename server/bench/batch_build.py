@@ -0,0 +1,66 @@
+# Compares building every procedure of a set of airports through the batch endpoint,
+# /procs/ICAO, with requesting every combination through /proc/ like the QA job used to.
+# Each way starts with an empty build cache, in a server started in a separate process.
+#
+# Usage: python -m server.bench.batch_build [data_dir] [ICAO ...]
+import sys
+import json
+import time
+import tempfile
+import urllib.request
+import urllib.error
+import multiprocessing
+import server.navdata.builder as builder
+import server.server as server
+from server.navdata.buildcache import BuildCache
+from server.serving import make_server
+from server.bench.corpus import load_navdata, parse_airports, iter_procedures, proc_url
+
+def serve(dir: str, cache_dir: str, ports):
+  server.set_navdata(load_navdata(dir))
+  server.set_build_cache(BuildCache(cache_dir))
+  httpd = make_server("threaded", ("127.0.0.1", 0), server.CIFPServer)
+  httpd.handle_error = lambda request, client_address: None # procedures that cannot be built are counted
+  ports.put(httpd.server_address[1])
+  httpd.serve_forever()
+
+def start_server(dir: str):
+  ports = multiprocessing.Queue()
+  proc = multiprocessing.Process(target=serve, args=(dir, tempfile.mkdtemp(), ports), daemon=True)
+  proc.start()
+  return proc, f"http://127.0.0.1:{ports.get()}/"
+
+if __name__ == "__main__":
+  dir = sys.argv[1] if len(sys.argv) > 1 else "navdata"
+  navdata = load_navdata(dir)
+  airports = parse_airports(navdata, sys.argv[2:])
+
+  proc, base = start_server(dir)
+  start = time.perf_counter()
+  built = failed = 0
+  for airport in airports:
+    for proc_, rwy, trans in iter_procedures(navdata, airport):
+      try:
+        with urllib.request.urlopen(base + proc_url(proc_, rwy, trans, "points.json")) as res:
+          res.read()
+        built += 1
+      except (urllib.error.URLError, ConnectionError):
+        failed += 1
+  single = time.perf_counter() - start
+  proc.terminate()
+  print(f"/proc/  {single:>8.2f}s {built} built, {failed} failed")
+
+  proc, base = start_server(dir)
+  start = time.perf_counter()
+  built = failed = 0
+  build_ms = 0.0
+  for airport in airports:
+    with urllib.request.urlopen(base + f"procs/{airport}") as res:
+      for line in res:
+        result = json.loads(line)
+        build_ms += result["ms"]
+        if "error" in result: failed += 1
+        else: built += 1
+  batch = time.perf_counter() - start
+  proc.terminate()
+  print(f"/procs/ {batch:>8.2f}s {built} built, {failed} failed, {build_ms / 1000:.2f}s building")
@@ -0,0 +1,168 @@
+# Differential check of the batched tube builder, builder.build_3d, against the
+# per-section builder it replaced, build_3d_sections, on every procedure of a set of airports.
+# The meshes must have the same faces and vertices within TOLERANCE nm, and end at the same point.
+# Also reports the time taken by each. Exits with status 1 if any mesh differs.
+#
+# Usage: python -m server.bench.build_3d_check [data_dir] [ICAO ...]
+import sys
+import time
+import numpy as np
+import server.navdata.builder as builder
+from dataclasses import dataclass
+from server.navdata.mathhelpers import Vec3, to_xyz_earth
+from server.navdata.defns import *
+from server.bench.corpus import load_args, record_calls
+
+TOLERANCE = 1e-9
+
+@dataclass
+class Rect3D:
+  top_left: Vec3
+  top_right: Vec3
+  bottom_right: Vec3
+  bottom_left: Vec3
+
+@dataclass
+class SectionObject:
+  start: Vec3
+  end: Vec3
+
+  tangent: Vec3 # points forward
+  normal: Vec3 # points up
+  binormal: Vec3 # tangent * normal, points rigt
+
+  top: float # normal dot xyz = top
+  left: float # binormal dot xyz = left
+  bottom: float
+  right: float
+
+  start_rect: Rect3D
+
+def make_section_obj(p1: Vec3, p2: Vec3) -> SectionObject:
+  tangent = (p2 - p1).normalize()
+  normal = (p1 + p2).normalize()
+  normal = normal - tangent * tangent.dot(normal)
+  binormal = tangent.cross(normal)
+
+  top_left_point = p1 - binormal * builder.WIDTH + normal * builder.HEIGHT
+  top_right_point = p1 + binormal * builder.WIDTH + normal * builder.HEIGHT
+  bottom_right_point = p1 + binormal * builder.WIDTH - normal * builder.HEIGHT
+  bottom_left_point = p1 - binormal * builder.WIDTH - normal * builder.HEIGHT
+
+  top = top_left_point.dot(normal)
+  left = top_left_point.dot(binormal)
+  right = bottom_right_point.dot(binormal)
+  bottom = bottom_right_point.dot(normal)
+
+  # Was previously trying to do something fancier, but it didn't work out
+  return SectionObject(
+    p1, p2, tangent, normal, binormal, top, left, bottom, right,
+    Rect3D(top_left_point, top_right_point, bottom_right_point, bottom_left_point))
+
+# the per-section builder that build_3d replaced: one SectionObject per pair of points
+def build_3d_sections(leg_points: list[tuple[Leg, PathArray]]) -> list[tuple[Leg, builder.Object3D, PathPoint]]:
+  # leg, (sections, previous leg's end rectangle, current leg's end point)
+  objs: list[tuple[Leg, tuple[list[SectionObject], Rect3D | None, PathPoint]]] = []
+
+  prev: PathPoint | None = None
+  for leg, points in leg_points:
+    sections: list[SectionObject] = []
+    for p in points:
+      if prev is None:
+        prev = p
+        continue
+
+      prev_xyz = to_xyz_earth(*prev.latlon(), prev.altitude)
+      xyz = to_xyz_earth(*p.latlon(), p.altitude)
+
+      if (prev_xyz - xyz).mag2() < 0.000001:
+        prev = p
+        continue
+
+      sections.append(make_section_obj(prev_xyz, xyz))
+      prev = p
+    assert prev
+    end_pt = points[-1] if points else prev
+    if not sections:
+      objs.append((leg, (sections, None, end_pt)))
+      continue
+
+    # endpoint
+    last = sections[-1]
+    tl = last.end - last.binormal * builder.WIDTH + last.normal * builder.HEIGHT
+    tr = last.end + last.binormal * builder.WIDTH + last.normal * builder.HEIGHT
+    br = last.end + last.binormal * builder.WIDTH - last.normal * builder.HEIGHT
+    bl = last.end - last.binormal * builder.WIDTH - last.normal * builder.HEIGHT
+
+    objs.append((leg, (sections, Rect3D(tl, tr, br, bl), end_pt)))
+
+  ret: list[tuple[Leg, builder.Object3D, PathPoint]] = []
+
+  for leg, (sections, last, endpt) in objs:
+    if not last:
+      ret.append((leg, builder.Object3D.empty(), endpt))
+      continue
+
+    assert (len(sections) >= 1)
+
+    vertices: list[Vec3] = []
+    polygons: list[list[int]] = []
+    for i in range(len(sections)):
+      s = sections[i]
+      vertices += [s.start_rect.top_left, s.start_rect.bottom_left, s.start_rect.bottom_right, s.start_rect.top_right]
+      tl, bl, br, tr = 4*i + 1, 4*i + 2, 4*i + 3, 4*i + 4
+      tln, bln, brn, trn = tl + 4, bl + 4, br + 4, tr + 4
+      if i == 0:
+        polygons.append([tl, bl, br, tr])
+
+      polygons.append([tln, tl, tr, trn]) # top
+      polygons.append([tln, bln, bl, tl]) # left
+      polygons.append([bln, brn, br, bl]) # bottom
+      polygons.append([tr, br, brn, trn]) # right
+
+    n = len(sections)
+    tl, bl, br, tr = 4*n + 1, 4*n + 2, 4*n + 3, 4*n + 4
+
+    vertices += [last.top_left, last.bottom_left, last.bottom_right, last.top_right]
+    polygons.append([tl, tr, br, bl])
+
+    ret.append((leg, builder.Object3D(np.array([v.as_arr() for v in vertices]), np.array(polygons)), endpt))
+
+  return ret
+
+def main():
+  navdata, airports = load_args(sys.argv[1:])
+
+  # the input of build_3d for every procedure
+  recorded, skipped = record_calls(navdata, airports, builder, "build_3d")
+  inputs = [args[0] for _, calls in recorded for args in calls]
+
+  start = time.perf_counter()
+  expected = [build_3d_sections(x) for x in inputs]
+  reference_time = time.perf_counter() - start
+
+  start = time.perf_counter()
+  actual = [builder.build_3d(x) for x in inputs]
+  batched_time = time.perf_counter() - start
+
+  worst = 0.0
+  failed = 0
+  vertices = 0
+  for a, b in zip(expected, actual):
+    for (leg_a, obj_a, end_a), (leg_b, obj_b, end_b) in zip(a, b, strict=True):
+      same = leg_a is leg_b and end_a == end_b and np.array_equal(obj_a.polygons, obj_b.polygons) \
+        and obj_a.vertices.shape == obj_b.vertices.shape
+      if same and len(obj_a.vertices):
+        error = np.abs(obj_a.vertices - obj_b.vertices).max()
+        worst = max(worst, error)
+        same = error <= TOLERANCE
+      failed += not same
+      vertices += len(obj_b.vertices)
+
+  print(f"{len(inputs)} procedures, {vertices} vertices, {skipped} could not be built")
+  print(f"reference {reference_time:.3f}s, batched {batched_time:.3f}s")
+  print(f"max vertex error {worst:.3e}, {failed} legs differ")
+  sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+  main()
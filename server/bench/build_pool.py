@@ -0,0 +1,73 @@
+# Compares building procedures on threads of the server process with building them on a
+# BuildPool. Every procedure of the given airports is built once, by `clients` threads at a time.
+# With the pool's queue as long as the number of clients no build is refused.
+#
+# Usage: python -m server.bench.build_pool [data_dir] [--clients N] [--workers N] [ICAO ...]
+import os
+import time
+import argparse
+import functools
+import threading
+from queue import Queue, Empty
+import server.navdata.builder as builder
+from server.buildpool import BuildPool
+from server.navdata.defns import *
+from server.navdata.loader import NavDatabase
+from server.navdata.point_builder import PointCheckpoints
+from server.bench.corpus import load_navdata, parse_airports, iter_procedures
+
+def run(jobs: list, clients: int, build) -> tuple[float, int]:
+  queue = Queue()
+  for job in jobs: queue.put(job)
+  failed = 0
+
+  def client():
+    nonlocal failed
+    while True:
+      try:
+        job = queue.get_nowait()
+      except Empty:
+        return
+      try:
+        build(job)
+      except Exception:
+        failed += 1
+
+  start = time.perf_counter()
+  threads = [threading.Thread(target=client) for _ in range(clients)]
+  for t in threads: t.start()
+  for t in threads: t.join()
+  return (time.perf_counter() - start, failed)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog="python -m server.bench.build_pool")
+  parser.add_argument("data_dir", nargs="?", default="navdata")
+  parser.add_argument("airports", nargs="*")
+  parser.add_argument("--clients", type=int, default=16)
+  parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+  args = parser.parse_args()
+
+  navdata = load_navdata(args.data_dir)
+  config = AircraftConfig()
+  jobs = []
+  for airport in parse_airports(navdata, args.airports):
+    for proc, rwy, trans in iter_procedures(navdata, airport):
+      kind = "sid" if isinstance(proc, SID) else "star" if isinstance(proc, STAR) else "approach"
+      jobs.append((proc, (airport, kind, proc.ident, rwy, trans, builder.START_ALT, config, 0)))
+
+  # the threads share one checkpoint cache, as the server's do
+  checkpoints = PointCheckpoints()
+  def in_thread(job):
+    proc, (_, _, _, rwy, trans, alt, config, _) = job
+    builder.export_files(builder.build_proc(proc, config, rwy, trans, alt, checkpoints))
+
+  pool = BuildPool(args.workers, args.clients, functools.partial(NavDatabase, args.data_dir))
+  def in_pool(job):
+    pool.build(job[1])
+
+  print(f"{len(jobs)} builds, {args.clients} clients, {args.workers} workers on {os.cpu_count()} cpus")
+  for name, build in [("threads", in_thread), ("pool", in_pool)]:
+    elapsed, failed = run(jobs, args.clients, build)
+    print(f"{name:8}{elapsed:>8.2f}s{len(jobs) / elapsed:>9.1f} builds/s{failed:>6} failed")
+  print(pool.stats())
+  pool.shutdown()
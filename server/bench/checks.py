@@ -0,0 +1,93 @@
+# Quick checks on fixed inputs, which need no navdata and take about ten seconds:
+# - the batched geometry kernel against the scalar functions (server.bench.vecmath_check)
+# - the closed-form turn_towards against the reference sweep
+# - build_alt_constr against the nested loops it replaced (server.bench.alt_constr)
+# Exits with status 1 if any check fails. The corpus checks in the README cover real procedures.
+#
+# Usage: python -m server.bench.checks
+import sys
+import random
+from math import pi
+import server.navdata.mathhelpers as mh
+from server.navdata.point_builder import build_alt_constr
+from server.navdata.defns import *
+from server.bench.vecmath_check import check as check_vecmath
+from server.bench.alt_constr import build_alt_constr_nested
+
+SEED = 1
+
+# the sweep turns in steps of half a degree, which is about 0.017nm on a 2nm turn
+TURN_RADIUS = 2
+TURN_END_TOLERANCE = 0.02 # nm
+SWEEP_COURSE_TOLERANCE = 0.5 * pi / 180
+SOLVE_COURSE_TOLERANCE = 1e-6
+
+def report(name: str, failures: int, total: int) -> bool:
+  print(f"{name:16} {total - failures}/{total} ok")
+  return failures == 0
+
+# how far the course at the end of the turn is from the course to the destination
+def course_error(points: PathArray, dest: tuple[float, float]) -> float:
+  end = points[-1]
+  req_crs = mh.get_course_between(end.latlon(), dest)
+  if req_crs == -1: return 0
+  d = abs(end.course - req_crs) % (2 * pi)
+  return min(d, 2 * pi - d)
+
+# starts away from the poles and from courses along the meridians, where the sweep's course is not defined
+def check_turn_towards() -> bool:
+  failures = 0
+  total = 0
+  for lat in (0.1, 0.6, -1.0):
+    for crs in range(7, 360, 60):
+      for bearing in range(11, 360, 90):
+        for dist in (3, 10, 40):
+          for turn_right in (True, False):
+            start = PathPoint(lat, 0.3, crs * pi / 180)
+            dest = mh.go_dist_from(start.latlon(), bearing * pi / 180, dist)
+            sweep = mh.turn_towards(start, start.course, dest, TURN_RADIUS, 32, turn_right, sweep=True)
+            solve = mh.turn_towards(start, start.course, dest, TURN_RADIUS, 32, turn_right, sweep=False)
+            total += 1
+            if bool(sweep) != bool(solve):
+              failures += 1
+            elif solve:
+              failures += mh.earth_distance(sweep[-1].latlon(), solve[-1].latlon()) > TURN_END_TOLERANCE \
+                or course_error(sweep, dest) > SWEEP_COURSE_TOLERANCE \
+                or course_error(solve, dest) > SOLVE_COURSE_TOLERANCE
+  return report("turn_towards", failures, total)
+
+def random_alt(rng: random.Random) -> AltRestr | None:
+  alt = rng.randrange(0, 20000, 500)
+  match rng.randrange(8):
+    case 0: return AtAlt(alt)
+    case 1: return AltRange(alt, None)
+    case 2: return AltRange(None, alt)
+    case 3: return AltRange(alt, alt + rng.randrange(0, 5000, 500))
+    case 4: return GlideslopeAlt(alt, alt, rng.random() < 0.5)
+    case 5: return StepDownAt(alt, alt)
+    case 6: return StepDownAboveBelow(alt, alt, rng.random() < 0.5)
+    case _: return None
+
+def random_leg(rng: random.Random, seq: int) -> Leg:
+  info = LegInfo(seq, ProcKind.SID, "A", "CHECK", "", None, False, False, False, False, False, random_alt(rng), None, None)
+  return InitialFix(info, Waypoint(f"W{seq}", 0, 0, "", ""))
+
+def check_alt_constr() -> bool:
+  rng = random.Random(SEED)
+  failures = 0
+  total = 0
+  for _ in range(500):
+    legs = [random_leg(rng, i) for i in range(rng.randrange(0, 30))]
+    for ascending in (True, False):
+      total += 1
+      failures += build_alt_constr(legs, ascending) != build_alt_constr_nested(legs, ascending)
+  return report("build_alt_constr", failures, total)
+
+def main():
+  ok = check_vecmath(500)
+  ok &= check_turn_towards()
+  ok &= check_alt_constr()
+  sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+  main()
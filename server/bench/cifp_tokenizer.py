@@ -0,0 +1,53 @@
+# Measures how many CIFP records per second the tokenizer gets through,
+# compared with the old approach of scanning the file twice and stripping every field.
+#
+# Usage: python -m server.bench.cifp_tokenizer [data_dir] [ICAO ...]
+import sys
+import time
+import server.navdata.cifp as cifp
+
+DEFAULT_AIRPORTS = ["KSFO", "KJFK", "EGLL"]
+REPEAT = 50
+
+def legacy_tokenize(text: str):
+  data = text.split(";\n")
+  runways = []
+  for ln in data:
+    ln = ln.strip()
+    if not ln: continue
+    kind, ln = ln.split(":")
+    if kind != "RWY": continue
+    runways.append(ln.split(";")[0].split(","))
+
+  legs = []
+  for ln in data:
+    ln = ln.strip()
+    if not ln: continue
+    kind, ln = ln.split(":")
+    if kind == "RWY" or kind == "PRDAT": continue
+    ln = ln.split(",")
+    desc = ln[8]
+    ln = [x.strip() for x in ln]
+    ln[8] = desc
+    legs.append(ln)
+  return runways, legs
+
+def measure(fn, text: str) -> float:
+  start = time.perf_counter()
+  for _ in range(REPEAT):
+    fn(text)
+  return (time.perf_counter() - start) / REPEAT
+
+if __name__ == "__main__":
+  dir = sys.argv[1] if len(sys.argv) > 1 else "navdata"
+  airports = sys.argv[2:] or DEFAULT_AIRPORTS
+
+  print(f"{'airport':8}{'records':>10}{'legacy rec/s':>16}{'tokenizer rec/s':>18}{'speedup':>10}")
+  for airport in airports:
+    with open(f"{dir}/CIFP/{airport}.dat") as f:
+      text = f.read()
+    records = sum(1 for x in text.split(";\n") if x.strip())
+
+    legacy = measure(legacy_tokenize, text)
+    new = measure(cifp.tokenize, text)
+    print(f"{airport:8}{records:>10}{records / legacy:>16.0f}{records / new:>18.0f}{legacy / new:>9.2f}x")
@@ -0,0 +1,76 @@
+# Helpers shared by the benchmarks that build every procedure of a set of airports.
+import os
+import server.navdata.builder as builder
+import server.server as server
+from server.navdata.loader import NavDatabase
+from server.navdata.point_builder import PointCheckpoints
+from server.navdata.defns import *
+
+DEFAULT_AIRPORTS = ["KSFO", "KJFK", "EGLL", "KLAX", "KDEN", "KSEA", "PHNL", "KBOS"]
+
+# what build_proc raises for a combination that it cannot build
+BUILD_ERRORS = (ValueError, AssertionError)
+
+def load_navdata(dir: str) -> NavDatabase:
+  navdata = NavDatabase(dir)
+  server.set_navdata(navdata)
+  return navdata
+
+# the navdata and airports of the arguments [data_dir] [ICAO ... | ALL]
+def load_args(args: list[str]) -> tuple[NavDatabase, list[str]]:
+  navdata = load_navdata(args[0] if args else "navdata")
+  return (navdata, parse_airports(navdata, args[1:]))
+
+# `ALL` stands for every airport that has a CIFP file
+def parse_airports(navdata: NavDatabase, args: list[str]) -> list[str]:
+  if args == ["ALL"]:
+    return sorted(x for x in navdata.airports if os.path.exists(navdata.cifp_path(x)))
+  return args or DEFAULT_AIRPORTS
+
+# yields (procedure, runway, transition) for every combination that can be built
+def iter_procedures(navdata: NavDatabase, airport: str):
+  data = navdata.get_airport_data(airport)
+  if data is None: return
+  for _, proc, rwy, trans in builder.iter_combinations(*data):
+    yield (proc, rwy, trans)
+
+# shared by the builds of a benchmark, as the server's are shared by its builds
+checkpoints = PointCheckpoints()
+
+# builds a procedure the same way /proc/ does
+def build(proc: SID | STAR | Approach, rwy: str | None, trans: str | None) -> builder.BuiltProc:
+  return builder.build_proc(proc, AircraftConfig(), rwy, trans, builder.START_ALT, checkpoints)
+
+# Builds every combination of the airports and records the arguments of every call to
+# `module.name` made by each build. Returns (combination, calls) for every combination that
+# was built, and how many could not be built.
+def record_calls(navdata: NavDatabase, airports: list[str], module, name: str) -> tuple[list[tuple[tuple, list[tuple]]], int]:
+  recorded = []
+  skipped = 0
+  calls = []
+  original = getattr(module, name)
+  def record(*args):
+    calls.append(args)
+    return original(*args)
+  setattr(module, name, record)
+  try:
+    for airport in airports:
+      for combo in iter_procedures(navdata, airport):
+        calls.clear()
+        try:
+          build(*combo)
+        except BUILD_ERRORS:
+          skipped += 1
+          continue
+        recorded.append((combo, list(calls)))
+  finally:
+    setattr(module, name, original)
+  return (recorded, skipped)
+
+# path of a file of a built procedure, as requested by the viewer
+def proc_url(proc: SID | STAR | Approach, rwy: str | None, trans: str | None, file: str) -> str:
+  match proc:
+    case SID(): kind = "sid"
+    case STAR(): kind = "star"
+    case Approach(): kind = "approach"
+  return f"proc/{proc.airport}/{kind}/{proc.ident}/{trans or 'none'}/{rwy or 'none'}/{file}"
@@ -0,0 +1,43 @@
+# Compares the interpolated declination grid with the full magnetic model at random points,
+# and reports the interpolation error and the time taken by both.
+#
+# Usage: python -m server.bench.declination [points] [res]
+import sys
+import time
+import random
+from server.navdata.mathhelpers import geo_mag, year
+from server.navdata.declination import DeclinationGrid
+
+SEED = 1
+
+def main():
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  res = float(sys.argv[2]) if len(sys.argv) > 2 else 0.25
+
+  rng = random.Random(SEED)
+  points = [(rng.uniform(-85, 85), rng.uniform(-180, 180)) for _ in range(n)]
+
+  grid = DeclinationGrid(geo_mag, year, res, persist=False)
+
+  start = time.perf_counter()
+  exact = [grid.calculate(lat, lon) for lat, lon in points]
+  model_time = time.perf_counter() - start
+
+  start = time.perf_counter()
+  cold = [grid.get(lat, lon) for lat, lon in points]
+  cold_time = time.perf_counter() - start
+
+  start = time.perf_counter()
+  for lat, lon in points:
+    grid.get(lat, lon)
+  warm_time = time.perf_counter() - start
+
+  errors = sorted(abs(a - b) for a, b in zip(exact, cold))
+  print(f"{n} points, {res} deg grid, epoch {year}")
+  print(f"model:      {model_time / n * 1e6:10.1f} us/lookup")
+  print(f"grid, cold: {cold_time / n * 1e6:10.1f} us/lookup")
+  print(f"grid, warm: {warm_time / n * 1e6:10.1f} us/lookup")
+  print(f"error: mean {sum(errors) / n:.4f} deg, p99 {errors[int(n * 0.99) - 1]:.4f} deg, max {errors[-1]:.4f} deg")
+
+if __name__ == "__main__":
+  main()
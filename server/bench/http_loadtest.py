@@ -0,0 +1,82 @@
+# Load test for the HTTP front-end. Starts the server in a separate process in each serving mode,
+# and reports requests per second and latency for 1, 16 and 64 concurrent clients. The requests
+# are a mix of airport listings, nearby queries and the files of already built procedures.
+#
+# Usage: python -m server.bench.http_loadtest [data_dir] [--modes single,threaded] [--workers N] [ICAO ...]
+import time
+import argparse
+import tempfile
+import multiprocessing
+import server.navdata.builder as builder
+import server.server as server
+from server.navdata.buildcache import BuildCache
+from server.serving import make_server
+from server.bench.corpus import load_navdata, parse_airports, iter_procedures, proc_url
+from server.bench.loadgen import fetch, percentile, run_clients
+
+CLIENTS = [1, 16, 64]
+REQUESTS_PER_CLIENT = 16
+MIN_REQUESTS = 200
+PROCS_PER_AIRPORT = 8
+
+def serve(mode: str, dir: str, workers: int, cache_dir: str, ports):
+  server.set_navdata(load_navdata(dir))
+  server.set_build_cache(BuildCache(cache_dir))
+  httpd = make_server(mode, ("127.0.0.1", 0), server.CIFPServer, workers)
+  ports.put(httpd.server_address[1])
+  httpd.serve_forever()
+
+def make_paths(dir: str, airports: list[str]) -> list[str]:
+  navdata = load_navdata(dir)
+  paths = []
+  for airport in parse_airports(navdata, airports):
+    info = navdata.airports[airport]
+    paths.append(f"airport/{airport}")
+    paths.append(f"nearby/{info.lat}/{info.lon}/50")
+    combos = list(iter_procedures(navdata, airport))
+    for proc, rwy, trans in combos[::max(1, len(combos) // PROCS_PER_AIRPORT)]:
+      paths.append(proc_url(proc, rwy, trans, "points.json"))
+      paths.append(proc_url(proc, rwy, trans, "tiles.json"))
+      legs = proc.legs if isinstance(proc, builder.Approach) else proc.rwys[rwy]
+      for leg in legs:
+        paths.append(proc_url(proc, rwy, trans, f"{leg.info.qual}{leg.info.seq}.obj"))
+  return paths
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog="python -m server.bench.http_loadtest")
+  parser.add_argument("data_dir", nargs="?", default="navdata")
+  parser.add_argument("airports", nargs="*")
+  parser.add_argument("--modes", default="single,threaded")
+  parser.add_argument("--workers", type=int, default=16)
+  args = parser.parse_args()
+
+  paths = make_paths(args.data_dir, args.airports)
+  cache_dir = tempfile.mkdtemp()
+
+  print(f"{'mode':10}{'clients':>8}{'requests':>9}{'errors':>7}{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}")
+  for mode in args.modes.split(","):
+    ports = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=serve, args=(mode, args.data_dir, args.workers, cache_dir, ports), daemon=True)
+    proc.start()
+    base = f"http://127.0.0.1:{ports.get()}/"
+
+    # build every procedure once, so that only serving is measured
+    ok = []
+    for path in paths:
+      try:
+        fetch(base, path)
+        ok.append(path)
+      except Exception:
+        pass # cannot be built
+    paths = ok
+
+    for clients in CLIENTS:
+      requests = max(MIN_REQUESTS, clients * REQUESTS_PER_CLIENT)
+      batch = (paths * (requests // len(paths) + 1))[:requests]
+      elapsed, latencies, errors = run_clients(base, batch, clients)
+      print(f"{mode:10}{clients:>8}{requests:>9}{errors:>7}{len(latencies) / elapsed:>8.1f}"
+        f"{percentile(latencies, 0.5) * 1000:>9.1f}{percentile(latencies, 0.99) * 1000:>9.1f}")
+      time.sleep(0.5)
+
+    proc.terminate()
+    proc.join()
@@ -0,0 +1,43 @@
+# Helpers shared by the HTTP load tests.
+import time
+import threading
+import urllib.request
+import urllib.error
+from queue import Queue, Empty
+
+def fetch(base: str, path: str) -> float:
+  start = time.perf_counter()
+  with urllib.request.urlopen(base + path) as res:
+    res.read()
+  return time.perf_counter() - start
+
+def percentile(values: list[float], p: float) -> float:
+  if not values: return float("nan")
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p))]
+
+# `clients` threads fetch `paths` from a shared queue until it is empty
+# returns (elapsed seconds, latency of every successful request, number of failed requests)
+def run_clients(base: str, paths: list[str], clients: int) -> tuple[float, list[float], int]:
+  queue: Queue[str] = Queue()
+  for path in paths: queue.put(path)
+  latencies: list[float] = []
+  errors = 0
+
+  def client():
+    nonlocal errors
+    while True:
+      try:
+        path = queue.get_nowait()
+      except Empty:
+        return
+      try:
+        latencies.append(fetch(base, path))
+      except (urllib.error.URLError, ConnectionError):
+        errors += 1
+
+  start = time.perf_counter()
+  threads = [threading.Thread(target=client) for _ in range(clients)]
+  for t in threads: t.start()
+  for t in threads: t.join()
+  return (time.perf_counter() - start, latencies, errors)
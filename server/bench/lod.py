@@ -0,0 +1,39 @@
+# Reports the size of every level of detail of the paths of every procedure of a set of
+# airports: points, vertices, faces and the bytes of the path meshes and OBJ files,
+# with the time taken to simplify them and to build the mesh of each level.
+#
+# Usage: python -m server.bench.lod [data_dir] [ICAO ...]
+import sys
+import time
+import server.navdata.builder as builder
+from server.navdata.simplify import simplify_levels
+from server.navdata.mesh import encode_mesh
+from server.bench.corpus import load_args, record_calls
+
+def main():
+  navdata, airports = load_args(sys.argv[1:])
+
+  # the input of build_3d for the full path of every procedure
+  recorded, skipped = record_calls(navdata, airports, builder, "build_3d")
+  inputs = [args[0] for _, calls in recorded for args in calls]
+
+  start = time.perf_counter()
+  simplified = [simplify_levels(x, builder.LOD_TOLERANCES[1:]) for x in inputs]
+  print(f"{len(inputs)} procedures, {skipped} could not be built, simplified in {time.perf_counter() - start:.3f}s")
+
+  print(f"{'lod':>3}{'feet':>6}{'points':>10}{'vertices':>10}{'faces':>10}{'mesh bytes':>12}{'obj bytes':>12}{'build s':>9}")
+  for level, tolerance in enumerate(builder.LOD_TOLERANCES):
+    leg_points = inputs if level == 0 else [x[level - 1] for x in simplified]
+    start = time.perf_counter()
+    built = [builder.build_3d(x) for x in leg_points]
+    elapsed = time.perf_counter() - start
+
+    points = sum(len(p) for x in leg_points for _, p in x)
+    vertices = sum(len(obj.vertices) for objects in built for _, obj, _ in objects)
+    faces = sum(len(obj.polygons) for objects in built for _, obj, _ in objects)
+    mesh_bytes = sum(len(encode_mesh([(f"{l.info.qual}{l.info.seq}", obj.vertices, obj.polygons) for l, obj, _ in objects])) for objects in built)
+    obj_bytes = sum(len(obj.to_obj("Path")) for objects in built for _, obj, _ in objects)
+    print(f"{level:>3}{tolerance:>6}{points:>10}{vertices:>10}{faces:>10}{mesh_bytes:>12}{obj_bytes:>12}{elapsed:>9.3f}")
+
+if __name__ == "__main__":
+  main()
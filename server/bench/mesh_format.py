@@ -0,0 +1,67 @@
+# Compares the per-leg OBJ files with the binary path mesh of every procedure of a set of
+# airports: bytes on the wire, raw and gzipped, and the time to encode and to parse them.
+# Parsing the OBJ files is done line by line into float and index arrays, like the viewer's
+# OBJ loader; the path mesh is only viewed as arrays, like the viewer's parseMesh.
+#
+# Usage: python -m server.bench.mesh_format [data_dir] [ICAO ...]
+import sys
+import gzip
+import time
+import numpy as np
+import server.navdata.builder as builder
+from server.navdata.mesh import encode_mesh, decode_mesh
+from server.bench.corpus import load_args, iter_procedures, build, BUILD_ERRORS
+
+def parse_obj(text: str) -> tuple[np.ndarray, np.ndarray]:
+  vertices = []
+  indices = []
+  for line in text.splitlines():
+    parts = line.split()
+    if not parts: continue
+    if parts[0] == "v":
+      vertices += (float(parts[1]), float(parts[2]), float(parts[3]))
+    elif parts[0] == "f":
+      face = [int(x) - 1 for x in parts[1:]]
+      for i in range(1, len(face) - 1):
+        indices += (face[0], face[i], face[i + 1])
+  return (np.array(vertices, dtype=np.float32), np.array(indices, dtype=np.uint32))
+
+if __name__ == "__main__":
+  navdata, airports = load_args(sys.argv[1:])
+
+  builds = []
+  skipped = 0
+  for airport in airports:
+    for proc, rwy, trans in iter_procedures(navdata, airport):
+      try:
+        builds.append(build(proc, rwy, trans))
+      except BUILD_ERRORS:
+        skipped += 1
+
+  start = time.perf_counter()
+  objs = [[obj.to_obj("Path").encode() for _, obj, _ in b.objects] for b in builds]
+  obj_encode = time.perf_counter() - start
+
+  start = time.perf_counter()
+  meshes = [encode_mesh([(f"{l.info.qual}{l.info.seq}", obj.vertices, obj.polygons) for l, obj, _ in b.objects]) for b in builds]
+  mesh_encode = time.perf_counter() - start
+
+  start = time.perf_counter()
+  for files in objs:
+    for f in files: parse_obj(f.decode())
+  obj_parse = time.perf_counter() - start
+
+  start = time.perf_counter()
+  for mesh in meshes: decode_mesh(mesh)
+  mesh_parse = time.perf_counter() - start
+
+  obj_bytes = sum(len(f) for files in objs for f in files)
+  obj_gzip = sum(len(gzip.compress(f)) for files in objs for f in files)
+  obj_requests = sum(len(files) for files in objs)
+  mesh_bytes = sum(len(m) for m in meshes)
+  mesh_gzip = sum(len(gzip.compress(m)) for m in meshes)
+
+  print(f"{len(builds)} procedures, {skipped} could not be built")
+  print(f"{'format':8}{'files':>9}{'bytes':>12}{'gzipped':>12}{'encode s':>10}{'parse s':>10}")
+  print(f"{'obj':8}{obj_requests:>9}{obj_bytes:>12}{obj_gzip:>12}{obj_encode:>10.3f}{obj_parse:>10.3f}")
+  print(f"{'mesh':8}{len(meshes):>9}{mesh_bytes:>12}{mesh_gzip:>12}{mesh_encode:>10.3f}{mesh_parse:>10.3f}")
@@ -0,0 +1,77 @@
+# Memory and time of the path points as PathArrays against lists of PathPoint, on the
+# procedures of a set of airports with the most points, which are the ones with long arcs.
+# Reports the memory taken by the points of those procedures in each form, the time taken
+# to convert them to XYZ and to measure their length in each form, and the time taken
+# to build them.
+#
+# Usage: python -m server.bench.path_arrays [data_dir] [ICAO ...]
+import sys
+import time
+import tracemalloc
+import numpy as np
+import server.navdata.builder as builder
+import server.navdata.mathhelpers as mh
+import server.navdata.vecmath as vecmath
+from server.navdata.defns import *
+from server.bench.corpus import load_args, record_calls, build
+
+LONGEST = 50
+REPEATS = 20
+
+# memory allocated by make() and still held by what it returns, in bytes
+def allocated(make) -> tuple[object, int]:
+  tracemalloc.start()
+  ret = make()
+  size = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  return (ret, size)
+
+def timed(f, inputs: list) -> float:
+  start = time.perf_counter()
+  for _ in range(REPEATS):
+    for x in inputs:
+      f(x)
+  return (time.perf_counter() - start) / REPEATS
+
+# as the points were before PathArray: one dataclass per point, converted point by point
+def list_xyz(points: list[PathPoint]) -> np.ndarray:
+  return vecmath.to_xyz_earth([p.lat for p in points], [p.lon for p in points], [p.altitude for p in points])
+
+def list_length(points: list[PathPoint]) -> float:
+  return sum(mh.earth_distance(a.latlon(), b.latlon()) for a, b in zip(points, points[1:]))
+
+def array_xyz(points: PathArray) -> np.ndarray:
+  return vecmath.to_xyz_earth(points.lat, points.lon, points.altitude)
+
+def array_length(points: PathArray) -> float:
+  return vecmath.path_length(points.lat, points.lon)
+
+def point_count(leg_points: list[tuple[Leg, PathArray]]) -> int:
+  return sum(len(points) for _, points in leg_points)
+
+def main():
+  navdata, airports = load_args(sys.argv[1:])
+
+  # the points of every combination, as given to build_3d
+  recorded, skipped = record_calls(navdata, airports, builder, "build_3d")
+  found = [(point_count(args[0]), combo, args[0]) for combo, calls in recorded for args in calls]
+
+  found.sort(key=lambda x: -x[0])
+  found = found[:LONGEST]
+  total = sum(n for n, _, _ in found)
+  print(f"{len(found)} longest combinations, {total} points, {found[0][0]} in the longest, {skipped} could not be built")
+
+  arrays, array_bytes = allocated(lambda: [PathArray.concat(points for _, points in x) for _, _, x in found])
+  lists, list_bytes = allocated(lambda: [list(points) for points in arrays])
+  print(f"memory: PathArray {array_bytes / total:.1f} B/point, list of PathPoint {list_bytes / total:.1f} B/point")
+
+  for name, f_list, f_array in [("to xyz", list_xyz, array_xyz), ("length", list_length, array_length)]:
+    print(f"{name}: list of PathPoint {timed(f_list, lists) * 1000:.2f}ms, PathArray {timed(f_array, arrays) * 1000:.2f}ms")
+
+  start = time.perf_counter()
+  for _, combo, _ in found:
+    build(*combo)
+  print(f"build of these combinations: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,63 @@
+# Builds every combination of every procedure of a set of airports with and without the
+# checkpoints of build_points, and checks that both give the same files.
+# Reports the time taken by each, in total and in build_points, and how many legs were
+# resumed from a checkpoint.
+# Exits with status 1 if any combination differs.
+#
+# Usage: python -m server.bench.point_checkpoints [data_dir] [ICAO ...]
+import sys
+import time
+import hashlib
+import server.navdata.builder as builder
+from server.navdata.point_builder import PointCheckpoints
+from server.navdata.defns import *
+from server.bench.corpus import load_navdata, parse_airports, iter_procedures, BUILD_ERRORS
+
+def build_all(combos: list, checkpoints: PointCheckpoints | None) -> tuple[float, float, list[str]]:
+  digests = []
+
+  build_points = builder.build_points
+  points_time = 0.0
+  def timed(*args):
+    nonlocal points_time
+    start = time.perf_counter()
+    try:
+      return build_points(*args)
+    finally:
+      points_time += time.perf_counter() - start
+  builder.build_points = timed
+
+  start = time.perf_counter()
+  for proc, rwy, trans in combos:
+    try:
+      built = builder.build_proc(proc, AircraftConfig(), rwy, trans, builder.START_ALT, checkpoints)
+    except BUILD_ERRORS as e:
+      digests.append(type(e).__name__)
+      continue
+    h = hashlib.sha256()
+    for name, content in sorted(builder.export_files(built).items()):
+      h.update(name.encode())
+      h.update(content)
+    digests.append(h.hexdigest())
+  elapsed = time.perf_counter() - start
+  builder.build_points = build_points
+  return (elapsed, points_time, digests)
+
+def main():
+  dir = sys.argv[1] if len(sys.argv) > 1 else "navdata"
+  navdata = load_navdata(dir)
+  combos = [x for airport in parse_airports(navdata, sys.argv[2:]) for x in iter_procedures(navdata, airport)]
+
+  checkpoints = PointCheckpoints()
+  without, points_without, expected = build_all(combos, None)
+  with_, points_with, actual = build_all(combos, checkpoints)
+
+  differ = sum(a != b for a, b in zip(expected, actual))
+  print(f"{len(combos)} combinations, {differ} differ")
+  print(f"without checkpoints {without:.2f}s, {points_without:.2f}s in build_points")
+  print(f"with checkpoints    {with_:.2f}s, {points_with:.2f}s in build_points")
+  print(checkpoints.stats())
+  sys.exit(1 if differ else 0)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,86 @@
+# Load test for /proc/ builds, against an in-process pooled server with an empty build cache.
+#  - distinct: every client requests different procedures, none of which are built yet
+#  - same: every client requests the same procedure, which should only be built once
+#  - cached: latency of an already built procedure while the clients keep building others
+#
+# Usage: python -m server.bench.proc_loadtest [data_dir] [ICAO ...]
+import sys
+import time
+import tempfile
+import threading
+import server.navdata.builder as builder
+import server.server as server
+from server.navdata.buildcache import BuildCache
+from server.serving import PooledHTTPServer
+from server.bench.corpus import load_navdata, parse_airports, iter_procedures, build, proc_url, BUILD_ERRORS
+from server.bench.loadgen import fetch, percentile, run_clients
+
+CLIENTS = [1, 4, 16]
+REQUESTS = 48
+
+WORKERS = 64
+
+# counts calls to builder.build_proc
+builds = 0
+build_proc = builder.build_proc
+def counting_build_proc(*args):
+  global builds
+  builds += 1
+  return build_proc(*args)
+
+if __name__ == "__main__":
+  dir = sys.argv[1] if len(sys.argv) > 1 else "navdata"
+  navdata = load_navdata(dir)
+  airports = parse_airports(navdata, sys.argv[2:])
+  builder.build_proc = counting_build_proc
+
+  combos = [x for airport in airports for x in iter_procedures(navdata, airport)]
+  combos = combos[::max(1, len(combos) // (2 * REQUESTS * (len(CLIENTS) + 1)))]
+  paths = []
+  for proc, rwy, trans in combos:
+    try:
+      # only keep procedures that can be built
+      build(proc, rwy, trans)
+      paths.append(proc_url(proc, rwy, trans, "points.json"))
+    except BUILD_ERRORS:
+      pass
+
+  httpd = PooledHTTPServer(("127.0.0.1", 0), server.CIFPServer, WORKERS)
+  threading.Thread(target=httpd.serve_forever, daemon=True).start()
+  base = f"http://127.0.0.1:{httpd.server_address[1]}/"
+
+  print(f"{'scenario':12}{'clients':>8}{'requests':>9}{'builds':>7}{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}")
+  def report(name: str, clients: int, requests: int, elapsed: float, latencies: list[float]):
+    print(f"{name:12}{clients:>8}{requests:>9}{builds:>7}{requests / elapsed:>8.1f}"
+      f"{percentile(latencies, 0.5) * 1000:>9.1f}{percentile(latencies, 0.99) * 1000:>9.1f}")
+
+  for i, clients in enumerate(CLIENTS):
+    server.set_build_cache(BuildCache(tempfile.mkdtemp()))
+    builds = 0
+    batch = paths[i * REQUESTS:(i + 1) * REQUESTS]
+    elapsed, latencies, _ = run_clients(base, batch, clients)
+    report("distinct", clients, len(batch), elapsed, latencies)
+
+  for clients in CLIENTS:
+    server.set_build_cache(BuildCache(tempfile.mkdtemp()))
+    builds = 0
+    elapsed, latencies, _ = run_clients(base, [paths[-1]] * clients, clients)
+    report("same", clients, clients, elapsed, latencies)
+
+  # a built procedure should not have to wait for other builds
+  for clients in CLIENTS:
+    server.set_build_cache(BuildCache(tempfile.mkdtemp()))
+    fetch(base, paths[0])
+    builds = 0
+    done = threading.Event()
+    background = paths[len(CLIENTS) * REQUESTS:][:REQUESTS]
+    t = threading.Thread(target=lambda: (run_clients(base, background, clients), done.set()))
+    t.start()
+    start = time.perf_counter()
+    latencies = []
+    while not done.is_set():
+      latencies.append(fetch(base, paths[0]))
+    t.join()
+    report("cached", clients, len(latencies), time.perf_counter() - start, latencies)
+
+  httpd.shutdown()
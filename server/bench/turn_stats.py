@@ -0,0 +1,31 @@
+# Builds every procedure of the given airports and prints how much solver work
+# each turn primitive did (mathhelpers.turn_stats).
+#
+# Usage: python -m server.bench.turn_stats [data_dir] [ICAO ... | ALL]
+import sys
+import time
+import server.navdata.mathhelpers as mh
+from server.bench.corpus import load_args, iter_procedures, build, BUILD_ERRORS
+
+if __name__ == "__main__":
+  navdata, airports = load_args(sys.argv[1:])
+
+  mh.reset_turn_stats()
+  builds = 0
+  skipped = 0
+  start = time.perf_counter()
+  for airport in airports:
+    for proc, rwy, trans in iter_procedures(navdata, airport):
+      try:
+        build(proc, rwy, trans)
+        builds += 1
+      except BUILD_ERRORS:
+        skipped += 1
+  elapsed = time.perf_counter() - start
+
+  print(f"{builds} builds from {len(airports)} airports in {elapsed:.2f}s, {skipped} could not be built")
+  print(f"{'primitive':24}{'calls':>8}{'iter/call':>11}{'us/call':>10}{'total s':>9}")
+  for name, stats in sorted(mh.turn_stats.items()):
+    if not stats.calls: continue
+    print(f"{name:24}{stats.calls:>8}{stats.iterations / stats.calls:>11.2f}"
+      f"{stats.seconds / stats.calls * 1e6:>10.1f}{stats.seconds:>9.2f}")
@@ -0,0 +1,65 @@
+# Compares the closed-form turn_towards solver with the reference sweep.
+# Every turn_towards call made while building every procedure of the given airports is
+# recorded, then replayed with both methods. For each method, the error is the difference
+# between the course at the end of the turn and the course to the destination.
+#
+# Usage: python -m server.bench.turn_towards [data_dir] [ICAO ... | ALL]
+import sys
+import time
+from math import pi
+import server.navdata.point_builder as point_builder
+import server.navdata.mathhelpers as mh
+from server.bench.corpus import load_args, record_calls
+
+def end_error(points: list, dest: tuple[float, float]) -> float | None:
+  if not points: return None
+  end = points[-1]
+  req_crs = mh.get_course_between(end.latlon(), dest)
+  if req_crs == -1: return 0
+  d = abs(end.course - req_crs) % (2 * pi)
+  return min(d, 2 * pi - d)
+
+def replay(calls: list[tuple], sweep: bool) -> tuple[float, list]:
+  results = []
+  start = time.perf_counter()
+  for args in calls:
+    results.append(mh.turn_towards(*args, sweep=sweep))
+  return (time.perf_counter() - start, results)
+
+def summarize(name: str, elapsed: float, calls: list[tuple], results: list):
+  errors = sorted(e for e in (end_error(r, args[2]) for args, r in zip(calls, results)) if not e is None)
+  gave_up = sum(1 for r in results if not r)
+  print(f"{name:10}{elapsed / len(calls) * 1e6:>12.1f}{gave_up:>10}", end="")
+  if errors:
+    print(f"{errors[len(errors) // 2] * 180 / pi:>14.5f}{errors[-1] * 180 / pi:>14.5f}")
+  else:
+    print()
+
+if __name__ == "__main__":
+  navdata, airports = load_args(sys.argv[1:])
+
+  # only the calls of the combinations that could be built
+  recorded, skipped = record_calls(navdata, airports, point_builder, "turn_towards")
+  calls = [args for _, combo_calls in recorded for args in combo_calls]
+
+  if not calls:
+    print("No turn_towards calls were made.")
+    sys.exit(0)
+
+  sweep_time, sweep_results = replay(calls, True)
+  solve_time, solve_results = replay(calls, False)
+
+  # how far apart the two methods end their turns
+  diffs = []
+  for a, b in zip(sweep_results, solve_results):
+    if a and b: diffs.append(mh.earth_distance(a[-1].latlon(), b[-1].latlon()))
+  diffs.sort()
+  only_one = sum(1 for a, b in zip(sweep_results, solve_results) if bool(a) != bool(b))
+
+  print(f"{len(calls)} turn_towards calls from {len(airports)} airports, {skipped} combinations could not be built")
+  print(f"{'method':10}{'us/call':>12}{'gave up':>10}{'median err':>14}{'max err':>14}  (degrees)")
+  summarize("sweep", sweep_time, calls, sweep_results)
+  summarize("solve", solve_time, calls, solve_results)
+  if diffs:
+    print(f"turn end points differ by {diffs[len(diffs) // 2]:.4f}nm (median), {diffs[-1]:.4f}nm (max)")
+  print(f"{only_one} calls turned with only one of the methods")
@@ -0,0 +1,100 @@
+# Differential check of the batched geometry kernel in server.navdata.vecmath
+# against the scalar functions in server.navdata.mathhelpers, on random inputs.
+# Exits with status 1 if any function differs by more than TOLERANCE.
+#
+# Usage: python -m server.bench.vecmath_check [points]
+import sys
+import random
+from math import pi
+import numpy as np
+import server.navdata.mathhelpers as mh
+import server.navdata.vecmath as vecmath
+
+SEED = 1
+TOLERANCE = 1e-9
+
+def angle_diff(a: float, b: float) -> float:
+  d = abs(a - b) % (2 * pi)
+  return min(d, 2 * pi - d)
+
+def report(name: str, errors: list[float]) -> bool:
+  worst = max(errors)
+  ok = worst <= TOLERANCE
+  print(f"{name:16} max error {worst:.3e} {'ok' if ok else 'FAILED'}")
+  return ok
+
+# compares every function on n random inputs, returns whether all of them are within TOLERANCE
+def check(n: int) -> bool:
+  rng = random.Random(SEED)
+
+  # stay away from the poles, where the course is not defined
+  lats = [rng.uniform(-1.5, 1.5) for _ in range(n)]
+  lons = [rng.uniform(-pi, pi) for _ in range(n)]
+  lats2 = [x + rng.uniform(-0.05, 0.05) for x in lats]
+  lons2 = [x + rng.uniform(-0.05, 0.05) for x in lons]
+  alts = [rng.uniform(0, 40000) for _ in range(n)]
+  courses = [rng.uniform(0, 2 * pi) for _ in range(n)]
+  dists = [rng.uniform(0, 200) for _ in range(n)]
+  points = list(zip(lats, lons))
+
+  ok = True
+
+  xyz = vecmath.to_xyz(lats, lons)
+  ok &= report("to_xyz", [
+    max(abs(a - b) for a, b in zip(mh.to_xyz(*p).as_arr(), row)) for p, row in zip(points, xyz.tolist())])
+
+  xyz_earth = vecmath.to_xyz_earth(lats, lons, alts)
+  ok &= report("to_xyz_earth", [
+    max(abs(a - b) for a, b in zip(mh.to_xyz_earth(*p, alt).as_arr(), row)) / mh.EARTH_RAD
+    for p, alt, row in zip(points, alts, xyz_earth.tolist())])
+
+  lat_back, lon_back = vecmath.to_latlon(xyz)
+  ok &= report("to_latlon", [
+    max(abs(a - b) for a, b in zip(mh.to_latlon(mh.Vec3(*row)), (x, y)))
+    for row, x, y in zip(xyz.tolist(), lat_back.tolist(), lon_back.tolist())])
+
+  tangents = vecmath.get_sphere_tangent(lats, lons, courses)
+  ok &= report("sphere_tangent", [
+    max(abs(a - b) for a, b in zip(mh.get_sphere_tangent(p, c).as_arr(), row))
+    for p, c, row in zip(points, courses, tangents.tolist())])
+
+  crs = vecmath.get_course(lats, lons, tangents)
+  ok &= report("get_course", [
+    angle_diff(mh.get_course(p, mh.Vec3(*row)), x) for p, row, x in zip(points, tangents.tolist(), crs.tolist())])
+
+  dist = vecmath.earth_distance(lats, lons, lats2, lons2)
+  ok &= report("earth_distance", [
+    abs(mh.earth_distance(p, q) - x) / mh.EARTH_RAD for p, q, x in zip(points, zip(lats2, lons2), dist.tolist())])
+
+  length = vecmath.path_length(lats2, lons2)
+  scalar_length = sum(mh.earth_distance((lats2[i], lons2[i]), (lats2[i + 1], lons2[i + 1])) for i in range(n - 1))
+  ok &= report("path_length", [abs(length - scalar_length) / scalar_length])
+
+  dest_lat, dest_lon = vecmath.go_dist_from(lats, lons, courses, dists)
+  ok &= report("go_dist_from", [
+    max(abs(a - b) for a, b in zip(mh.go_dist_from(p, c, d), (x, y)))
+    for p, c, d, x, y in zip(points, courses, dists, dest_lat.tolist(), dest_lon.tolist())])
+
+  # arcs: compare the batched arc with the same points computed one at a time
+  errors = []
+  for i in range(min(n, 200)):
+    start = mh.PathPoint(lats[i], lons[i], courses[i])
+    center = mh.go_dist_from(start.latlon(), courses[i] + pi / 2, rng.uniform(0.5, 5))
+    l, _, v2, v3 = mh.get_turning_cirle(center, start.latlon(), True)
+    radius = np.sqrt((mh.to_xyz(*start.latlon()) - l).mag2())
+    angles = [rng.uniform(0, 2 * pi) for _ in range(8)]
+    arc_lat, arc_lon, arc_crs = vecmath.arc_points(l, v2, v3, radius, angles)
+    for a, x, y, c in zip(angles, arc_lat.tolist(), arc_lon.tolist(), arc_crs.tolist()):
+      e = v2 * radius * np.cos(a) + v3 * radius * np.sin(a) + l
+      lat, lon = mh.to_latlon(e)
+      tangent = -v2 * np.sin(a) + v3 * np.cos(a)
+      errors.append(max(abs(lat - x), abs(lon - y), angle_diff(mh.get_course((lat, lon), tangent), c)))
+  ok &= report("arc_points", errors)
+  return ok
+
+def main():
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+  sys.exit(0 if check(n) else 1)
+
+if __name__ == "__main__":
+  main()
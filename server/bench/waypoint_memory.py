@@ -0,0 +1,64 @@
+# Compares the memory used by the columnar WaypointStore with the old layout
+# of one dataclass per fix in a dict of dicts.
+#
+# Usage: python -m server.bench.waypoint_memory [data_dir]
+import sys
+import tracemalloc
+from collections import defaultdict
+from dataclasses import dataclass
+from server.navdata.datfile import iter_dat_records
+from server.navdata.waypoints import WaypointStore
+
+@dataclass
+class LegacyWaypoint:
+  name: str
+  lat: float
+  lon: float
+  region: str
+  airport: str
+
+def read_records(dir: str):
+  ret = []
+  for d in iter_dat_records(dir + "/earth_fix.dat"):
+    lat, lon, name, airport, region = d[:5]
+    ret.append((name, float(lat), float(lon), region, airport))
+  for d in iter_dat_records(dir + "/earth_nav.dat"):
+    if not d[0] in ["2", "3", "4", "5", "12", "13"]: continue
+    ret.append((d[7], float(d[1]), float(d[2]), d[9], d[8]))
+  return ret
+
+def build_legacy(records):
+  waypoints = defaultdict(lambda: {})
+  for name, lat, lon, region, airport in records:
+    waypoints[(region, airport)][name] = LegacyWaypoint(name, lat, lon, region, airport)
+  return waypoints
+
+def build_store(records):
+  store = WaypointStore()
+  for name, lat, lon, region, airport in records:
+    store.add(name, lat, lon, region, airport)
+  store.finalize()
+  return store
+
+def measure(fn, records):
+  # copy the strings so that both layouts pay for their own copies
+  records = [(n.encode().decode(), la, lo, r.encode().decode(), a.encode().decode()) for n, la, lo, r, a in records]
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  result = fn(records)
+  records.clear()
+  after = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  return result, after - before
+
+if __name__ == "__main__":
+  dir = sys.argv[1] if len(sys.argv) > 1 else "navdata"
+  records = read_records(dir)
+  print(f"{len(records)} fixes and navaids")
+
+  legacy, legacy_bytes = measure(build_legacy, records)
+  del legacy
+  store, store_bytes = measure(build_store, records)
+
+  print(f"dict of dataclasses: {legacy_bytes / 2**20:8.1f} MiB")
+  print(f"WaypointStore:       {store_bytes / 2**20:8.1f} MiB ({store_bytes / legacy_bytes:.0%})")
@@ -0,0 +1,118 @@
+import logging
+import threading
+import multiprocessing
+from typing import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import server.navdata.builder as builder
+import server.server as server
+from server.navdata.defns import AircraftConfig
+from server.navdata.loader import NavDatabase
+
+logger = logging.getLogger("cifp-viewer")
+
+# (airport, sid/star/approach, procedure ident, runway, transition, start altitude, aircraft config, level of detail)
+BuildRequest = tuple[str, str, str, str | None, str | None, int, AircraftConfig, int]
+
+class BuildPoolFull(Exception):
+  pass
+
+# a worker died during the build, e.g. killed for running out of memory
+class BuildPoolBroken(Exception):
+  pass
+
+# runs once in every worker before its first build
+def init_worker(load_navdata: Callable[[], NavDatabase]):
+  server.set_navdata(load_navdata())
+
+def build_in_worker(request: BuildRequest) -> dict[str, bytes]:
+  airport, kind, ident, runway, transition, start_alt, config, lod = request
+  data = server.get_navdata().get_airport_data(airport)
+  if data is None: raise KeyError(f"No procedures for airport `{airport}`.")
+
+  sids, stars, appches = data
+  procs = {"sid": sids, "star": stars, "approach": appches}[kind]
+  if not ident in procs: raise KeyError(f"No procedure `{ident}` at `{airport}`.")
+
+  built = builder.build_proc(procs[ident], config, runway, transition, start_alt, server.point_checkpoints, lod)
+  return builder.export_files(built)
+
+# Builds procedures in worker processes, so that builds are not limited to one core by the GIL.
+# Only the request and the exported files are sent between processes.
+# At most `workers` builds run at once, and at most `max_queue` more wait for a worker;
+# any build beyond that is refused with BuildPoolFull instead of queueing without bound.
+# Every build of a procedure goes to the same worker, so that its combinations reuse the
+# checkpoints of their shared legs, which each worker keeps for itself.
+# Workers are spawned as new processes rather than forked, as a fork of the threaded server could
+# inherit locks held by its other threads. Each one loads the navdata with `load_navdata`,
+# which must be picklable, e.g. a functools.partial of NavDatabase.
+# If a worker dies, the builds it broke fail with BuildPoolBroken and a new worker is spawned.
+class BuildPool:
+  def __init__(self, workers: int, max_queue: int, load_navdata: Callable[[], NavDatabase]):
+    self.workers = workers
+    self.max_queue = max_queue
+    self.load_navdata = load_navdata
+    self.slots = threading.BoundedSemaphore(workers + max_queue)
+
+    self.lock = threading.Lock()
+    self.pending = 0
+    self.rejected = 0
+    self.restarts = 0
+
+    # one executor per worker, so that a build can be sent to a given worker
+    self.pools = [self.spawn() for _ in range(workers)]
+    # starts every worker before the first build, instead of loading the navdata during it
+    for f in [pool.submit(int) for pool in self.pools]:
+      f.result()
+
+  # the worker is started by its first task
+  def spawn(self) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+      1,
+      mp_context=multiprocessing.get_context("spawn"),
+      initializer=init_worker,
+      initargs=(self.load_navdata,))
+
+  # replaces the worker if it is still the broken one, as other builds may have already replaced it
+  def restart(self, worker: int, broken: ProcessPoolExecutor):
+    with self.lock:
+      if not self.pools[worker] is broken: return
+      logger.warning("A build worker died, starting a new build worker.")
+      broken.shutdown(wait=False, cancel_futures=True)
+      self.pools[worker] = self.spawn()
+      self.restarts += 1
+
+  def build(self, request: BuildRequest) -> dict[str, bytes]:
+    if not self.slots.acquire(blocking=False):
+      with self.lock:
+        self.rejected += 1
+      raise BuildPoolFull()
+
+    airport, kind, ident = request[:3]
+    worker = hash((airport, kind, ident)) % self.workers
+    with self.lock:
+      self.pending += 1
+      pool = self.pools[worker]
+    try:
+      return pool.submit(build_in_worker, request).result()
+    except BrokenProcessPool:
+      self.restart(worker, pool)
+      raise BuildPoolBroken()
+    finally:
+      with self.lock:
+        self.pending -= 1
+      self.slots.release()
+
+  def shutdown(self):
+    for pool in self.pools:
+      pool.shutdown(cancel_futures=True)
+
+  def stats(self) -> dict[str, int]:
+    with self.lock:
+      return {
+        "workers": self.workers,
+        "max_queue": self.max_queue,
+        "pending": self.pending,
+        "rejected": self.rejected,
+        "restarts": self.restarts,
+      }
@@ -0,0 +1,47 @@
+import gc
+import os
+import pickle
+import logging
+from server.navdata.defns import AirportProcedures
+
+logger = logging.getLogger("cifp-viewer")
+
+# bump this whenever the parser or the procedure classes change
+ARTIFACT_VERSION = 3
+
+ARTIFACT_DIR = "cache/procedures"
+
+def artifact_path(airport: str) -> str:
+  return f"{ARTIFACT_DIR}/{airport}.pkl"
+
+# an artifact is only valid for the exact CIFP file and .dat files it was built from
+def artifact_key(navdata, airport: str) -> tuple:
+  st = os.stat(navdata.cifp_path(airport))
+  return (ARTIFACT_VERSION, navdata.source_key, st.st_mtime_ns, st.st_size)
+
+def load_artifact(navdata, airport: str) -> AirportProcedures | None:
+  path = artifact_path(airport)
+  if not os.path.exists(path): return None
+
+  # same as for the navdata snapshot, the collector only slows down loading many small objects
+  gc.disable()
+  try:
+    with open(path, "rb") as f:
+      if pickle.load(f) != artifact_key(navdata, airport):
+        return None
+      return pickle.load(f)
+  except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+    logger.warning(f"Could not read procedure artifact {path}: {e}")
+    return None
+  finally:
+    gc.enable()
+
+def save_artifact(navdata, airport: str, procs: AirportProcedures):
+  os.makedirs(ARTIFACT_DIR, exist_ok=True)
+
+  path = artifact_path(airport)
+  tmp = f"{path}.{os.getpid()}.tmp"
+  with open(tmp, "wb") as f:
+    pickle.dump(artifact_key(navdata, airport), f, protocol=pickle.HIGHEST_PROTOCOL)
+    pickle.dump(procs, f, protocol=pickle.HIGHEST_PROTOCOL)
+  os.replace(tmp, path)
@@ -0,0 +1,165 @@
+import os
+import pickle
+import struct
+import logging
+from threading import Lock
+
+logger = logging.getLogger("cifp-viewer")
+
+BUILD_CACHE_DIR = "cache/builds"
+
+# bump this whenever the layout of the artifact files changes
+BUILD_CACHE_VERSION = 1
+
+# <header length><pickled (version, {file name: (offset, length)})><file contents>
+HEADER = struct.Struct("<Q")
+
+# The files served for one built procedure, stored in a single artifact file.
+# The artifact is named after the digest of everything the build depends on,
+# so it never has to be invalidated: a change in the inputs gives a new name.
+class BuildArtifact:
+  def __init__(self, path: str, index: dict[str, tuple[int, int]], data_start: int):
+    self.path = path
+    self.index = index
+    self.data_start = data_start
+
+  def __contains__(self, name: str):
+    return name in self.index
+
+  def size(self) -> int:
+    return self.data_start + sum(x[1] for x in self.index.values())
+
+  # (offset in the artifact file, length) of a file, to send it without reading it
+  def locate(self, name: str) -> tuple[int, int] | None:
+    if not name in self.index: return None
+    offset, length = self.index[name]
+    return (self.data_start + offset, length)
+
+  def read(self, name: str) -> bytes | None:
+    if not name in self.index: return None
+    offset, length = self.index[name]
+    with open(self.path, "rb") as f:
+      f.seek(self.data_start + offset)
+      return f.read(length)
+
+# Build artifacts on disk, shared by every process that uses the same cache directory.
+# When the artifacts take up more than `max_bytes`, the least recently used ones are deleted.
+class BuildCache:
+  def __init__(self, dir: str = BUILD_CACHE_DIR, max_bytes: int = 0):
+    self.dir = dir
+    self.max_bytes = max_bytes # 0 = unlimited
+    self.size: int | None = None # estimate of the total size, other processes also write here
+    self.lock = Lock()
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def path(self, digest: str) -> str:
+    return f"{self.dir}/{digest}.bin"
+
+  def get(self, digest: str) -> BuildArtifact | None:
+    artifact = self.read(digest)
+    # the cache is shared by the server's threads
+    with self.lock:
+      if artifact is None: self.misses += 1
+      else: self.hits += 1
+    return artifact
+
+  def read(self, digest: str) -> BuildArtifact | None:
+    path = self.path(digest)
+    try:
+      with open(path, "rb") as f:
+        header_len, = HEADER.unpack(f.read(HEADER.size))
+        version, index = pickle.loads(f.read(header_len))
+      if version != BUILD_CACHE_VERSION:
+        return None
+      # recently used artifacts are evicted last
+      os.utime(path)
+    except FileNotFoundError:
+      return None
+    except (OSError, struct.error, pickle.UnpicklingError, EOFError, ValueError) as e:
+      logger.warning(f"Could not read build artifact {path}: {e}")
+      return None
+
+    return BuildArtifact(path, index, HEADER.size + header_len)
+
+  def put(self, digest: str, files: dict[str, bytes]) -> BuildArtifact:
+    os.makedirs(self.dir, exist_ok=True)
+
+    index: dict[str, tuple[int, int]] = {}
+    offset = 0
+    for name, content in files.items():
+      index[name] = (offset, len(content))
+      offset += len(content)
+    header = pickle.dumps((BUILD_CACHE_VERSION, index), protocol=pickle.HIGHEST_PROTOCOL)
+
+    path = self.path(digest)
+    tmp = f"{path}.{os.getpid()}.{id(files)}.tmp"
+    with open(tmp, "wb") as f:
+      f.write(HEADER.pack(len(header)))
+      f.write(header)
+      for content in files.values():
+        f.write(content)
+    os.replace(tmp, path)
+
+    artifact = BuildArtifact(path, index, HEADER.size + len(header))
+    if self.max_bytes:
+      with self.lock:
+        if self.size is None: self.size = self.scan_size()
+        else: self.size += artifact.size()
+        if self.size > self.max_bytes: self.evict()
+    return artifact
+
+  def entries(self) -> list[os.DirEntry]:
+    try:
+      return [x for x in os.scandir(self.dir) if x.name.endswith(".bin")]
+    except FileNotFoundError:
+      return []
+
+  def scan_size(self) -> int:
+    total = 0
+    for entry in self.entries():
+      try:
+        total += entry.stat().st_size
+      except FileNotFoundError:
+        pass # evicted by another process
+    return total
+
+  # deletes the least recently used artifacts until the cache is under 3/4 of its size limit,
+  # so that this does not have to happen again on every build
+  def evict(self):
+    entries = []
+    for entry in self.entries():
+      try:
+        st = entry.stat()
+      except FileNotFoundError:
+        continue
+      entries.append((st.st_mtime_ns, st.st_size, entry.path))
+    entries.sort()
+
+    total = sum(x[1] for x in entries)
+    target = self.max_bytes * 3 // 4
+    evicted = 0
+    for _, size, path in entries:
+      if total <= target: break
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass
+      total -= size
+      evicted += 1
+
+    self.size = total
+    self.evictions += evicted
+    logger.info(f"Evicted {evicted} procedure builds from {self.dir}.")
+
+  def stats(self) -> dict:
+    with self.lock:
+      return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "evictions": self.evictions,
+        "bytes": self.size,
+        "max_bytes": self.max_bytes,
+      }
@@ -1,165 +1,127 @@
 from server.navdata.defns import *
 from server.navdata.mathhelpers import *
 from server.navdata.point_builder import *
+import server.navdata.vecmath as vecmath
+import server.navdata.artifacts as artifacts
+from server.navdata.mesh import encode_mesh
+from server.navdata.simplify import simplify_levels
 from server.server import get_navdata
-from math import floor
+import numpy as np
+import hashlib
+import json
+import time
+from typing import Callable
+
+# bump this whenever a change to the builder changes its output,
+# so that procedures built by the previous version are not served from the build cache
+BUILDER_VERSION = 6
 
 WIDTH = 300 / NM_TO_FT
 HEIGHT = 100 / NM_TO_FT
 
+# how far in feet the path of each level of detail may be from the full path
+# level 0 is the full path, the coarser levels are only built as a path mesh, when first requested
+LOD_TOLERANCES = [0, 25, 100, 400]
+
+# the altitude that STARs and approaches start from, as it cannot be requested yet
+START_ALT = 10000
+
 @dataclass
 class Object3D:
-  vertices: list[Vec3]
-  polygons: list[list[int]]
+  vertices: np.ndarray # (n, 3)
+  polygons: np.ndarray # (m, 4), 1-based vertex indices as in OBJ files
+  
+  @staticmethod
+  def empty() -> "Object3D":
+    return Object3D(np.empty((0, 3)), np.empty((0, 4), dtype=np.int64))
+  
+  def to_obj(self, material: str | None = None) -> str:
+    lines = []
+    if material: lines.append(f"usemtl {material}\n")
+    for x, y, z in self.vertices.tolist():
+      lines.append("v {:.5f} {:.5f} {:.5f}\n".format(x, y, z))
+    for p in self.polygons.tolist():
+      lines.append("f " + " ".join(str(i) for i in p) + "\n")
+    return "".join(lines)
   
   def export_obj(self, file: str, material: str | None = None):
     with open(file, "w") as f:
-      if material: f.write(f"usemtl {material}\n")
-      for v in self.vertices:
-        f.write("v ")
-        f.write("{:.5f} ".format(v.x))
-        f.write("{:.5f} ".format(v.y))
-        f.write("{:.5f}\n".format(v.z))
-      for p in self.polygons:
-        f.write("f")
-        for i in p:
-          f.write(" " + str(i))
-        f.write("\n")
+      f.write(self.to_obj(material))
 
-@dataclass
-class Rect3D:
-  top_left: Vec3
-  top_right: Vec3
-  bottom_right: Vec3
-  bottom_left: Vec3
+# corners of a section's rectangle, relative to its start, in the order they are stored:
+# top left, bottom left, bottom right, top right
+RECT_CORNERS = [(-1, 1), (-1, -1), (1, -1), (1, 1)]
 
-@dataclass
-class SectionObject:
-  start: Vec3
-  end: Vec3
-  
-  tangent: Vec3 # points forward
-  normal: Vec3 # points up
-  binormal: Vec3 # tangent * normal, points rigt
-  
-  top: float # normal dot xyz = top
-  left: float # binormal dot xyz = left
-  bottom: float
-  right: float
-  
-  start_rect: Rect3D
-
-# one of (a, c) or (b, d) may be parallel
-#def compute_intersection(a: Vec3, b: Vec3, c: Vec3, d: Vec3, x: float, y: float, z: float, w: float, default: Vec3):
-#  try:
-#    mat = [a.as_arr(), b.as_arr(), c.as_arr()]
-#    rhs = [x, y, z]
-#    return solve_matrix(mat, rhs)
-#  except:
-#    try:
-#      mat = [a.as_arr(), b.as_arr(), d.as_arr()]
-#      rhs = [y, z, w]
-#      return solve_matrix(mat, rhs)
-#    except:
-#      return default
-
-def make_section_obj(prev_sec: SectionObject | None, p1: Vec3, p2: Vec3) -> SectionObject:
-  tangent = (p2 - p1).normalize()
-  normal = (p1 + p2).normalize()
-  normal = normal - tangent * tangent.dot(normal)
-  binormal = tangent.cross(normal)
-
-  top_left_point = p1 - binormal * WIDTH + normal * HEIGHT
-  top_right_point = p1 + binormal * WIDTH + normal * HEIGHT
-  bottom_right_point = p1 + binormal * WIDTH - normal * HEIGHT
-  bottom_left_point = p1 - binormal * WIDTH - normal * HEIGHT
-  
-  top = top_left_point.dot(normal)
-  left = top_left_point.dot(binormal)
-  right = bottom_right_point.dot(binormal)
-  bottom = bottom_right_point.dot(normal)
-  
-  # Was previously trying to do something fancier, but it didn't work out
-  return SectionObject(
-    p1, p2, tangent, normal, binormal, top, left, bottom, right, 
-    Rect3D(top_left_point, top_right_point, bottom_right_point, bottom_left_point))
-
-def build_3d(leg_points: list[tuple[Leg, list[PathPoint]]]):
-  # leg, (sections, previous leg's end rectangle, current leg's end point)
-  objs: list[tuple[Leg, tuple[list[SectionObject], Rect3D | None, PathPoint]]] = []
-  
-  prev: PathPoint | None = None
-  for leg, points in leg_points:
-    sections: list[SectionObject] = []
-    for p in points:
-      if prev is None:
-        prev = p
-        continue
-      
-      # note: I had to extract these to make pylance shut up
-      lat, lon = prev.latlon()
-      prev_xyz = to_xyz_earth(lat, lon, prev.altitude)
-      xyz = to_xyz_earth(*p.latlon(), p.altitude)
-      
-      # TODO
-      if sections:
-        prev_sec = sections[-1]
-      else:
-        prev_sec = None
-      
-      if (prev_xyz - xyz).mag2() < 0.000001:
-        prev = p
-        continue
-      
-      section = make_section_obj(None, prev_xyz, xyz)
-      sections.append(section)
-      
-      prev = p
-    assert prev
-    end_pt = points[-1] if points else prev
-    if not sections:
-      objs.append((leg, (sections, None, end_pt)))
-      continue
-    
-    # endpoint
-    last = sections[-1]
-    tl = last.end - last.binormal * WIDTH + last.normal * HEIGHT
-    tr = last.end + last.binormal * WIDTH + last.normal * HEIGHT
-    br = last.end + last.binormal * WIDTH - last.normal * HEIGHT
-    bl = last.end - last.binormal * WIDTH - last.normal * HEIGHT
-    
-    objs.append((leg, (sections, Rect3D(tl, tr, br, bl), end_pt)))
+# the 4 sides of the tube between rectangle i and rectangle i + 1, as offsets from 4 * i
+TUBE_SIDES = np.array([
+  [4, 0, 3, 7], # top
+  [4, 5, 1, 0], # left
+  [5, 6, 2, 1], # bottom
+  [3, 2, 6, 7], # right
+])
+
+def dot_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+  return a[:, 0] * b[:, 0] + a[:, 1] * b[:, 1] + a[:, 2] * b[:, 2]
+
+# Builds a rectangular tube along the path of every leg.
+# There is a section between every two consecutive points that are not at the same place,
+# with a rectangle at its start that is perpendicular to it. Each leg's tube goes through
+# the rectangles of its sections, and ends with the last section's rectangle moved to its end.
+# The frames of all sections are computed at once, and every rectangle is shared by the two
+# sections on either side of it.
+def build_3d(leg_points: list[tuple[Leg, PathArray]]) -> list[tuple[Leg, Object3D, PathPoint]]:
+  all_points = PathArray.concat(points for _, points in leg_points)
+  xyz = vecmath.to_xyz_earth(all_points.lat, all_points.lon, all_points.altitude).reshape(-1, 3)
+  
+  # a section ends at every point that is not within 0.001 nm of the point before it
+  diff = xyz[1:] - xyz[:-1]
+  ends = np.flatnonzero(dot_rows(diff, diff) >= 0.000001) + 1
+  start = xyz[ends - 1]
+  end = xyz[ends]
+  
+  # same operations as Vec3, so that the result does not depend on the implementation
+  tangent = end - start
+  tangent *= (1 / np.sqrt(dot_rows(tangent, tangent)))[:, None]
+  normal = start + end
+  normal *= (1 / np.sqrt(dot_rows(normal, normal)))[:, None]
+  normal -= tangent * dot_rows(tangent, normal)[:, None]
+  binormal = np.cross(tangent, normal)
+  
+  # the rectangles at the start and at the end of every section, (sections, 4, 3)
+  width = (binormal * WIDTH)[:, None]
+  height = (normal * HEIGHT)[:, None]
+  corner_w = np.array([w for w, _ in RECT_CORNERS])[None, :, None]
+  corner_h = np.array([h for _, h in RECT_CORNERS])[None, :, None]
+  start_rects = (start[:, None] + corner_w * width) + corner_h * height
+  end_rects = (end[:, None] + corner_w * width) + corner_h * height
   
   ret: list[tuple[Leg, Object3D, PathPoint]] = []
   
-  for leg, (sections, last, endpt) in objs:
-    if not last:
-      ret.append((leg, Object3D([], []), endpt))
-      continue
-    
-    assert (len(sections) >= 1)
+  first_point = 0
+  end_pt: PathPoint | None = None
+  for leg, points in leg_points:
+    # the sections that end at one of this leg's points
+    s0, s1 = np.searchsorted(ends, [first_point, first_point + len(points)])
+    first_point += len(points)
+    if points: end_pt = points[-1]
+    assert end_pt
     
-    obj = Object3D([], [])
-    for i in range(len(sections)):
-      s = sections[i]
-      obj.vertices += [s.start_rect.top_left, s.start_rect.bottom_left, s.start_rect.bottom_right, s.start_rect.top_right]
-      tl, bl, br, tr = 4*i + 1, 4*i + 2, 4*i + 3, 4*i + 4
-      tln, bln, brn, trn = tl + 4, bl + 4, br + 4, tr + 4
-      if i == 0:
-        obj.polygons.append([tl, bl, br, tr])
-      
-      obj.polygons.append([tln, tl, tr, trn]) # top
-      obj.polygons.append([tln, bln, bl, tl]) # left
-      obj.polygons.append([bln, brn, br, bl]) # bottom
-      obj.polygons.append([tr, br, brn, trn]) # right
+    n = s1 - s0
+    if n == 0:
+      ret.append((leg, Object3D.empty(), end_pt))
+      continue
     
-    n = len(sections)
-    tl, bl, br, tr = 4*n + 1, 4*n + 2, 4*n + 3, 4*n + 4
+    # the rectangle at the start of every section, then at the end of the last one
+    vertices = np.empty((n + 1, 4, 3))
+    vertices[:n] = start_rects[s0:s1]
+    vertices[n] = end_rects[s1 - 1]
     
-    obj.vertices += [last.top_left, last.bottom_left, last.bottom_right, last.top_right]
-    obj.polygons.append([tl, tr, br, bl])
+    polygons = np.empty((4 * n + 2, 4), dtype=np.int64)
+    polygons[0] = [1, 2, 3, 4]
+    polygons[1:-1] = (TUBE_SIDES + 4 * np.arange(n)[:, None, None] + 1).reshape(-1, 4)
+    polygons[-1] = np.array([1, 4, 3, 2]) + 4 * n
     
-    ret.append((leg, obj, endpt))
+    ret.append((leg, Object3D(vertices.reshape(-1, 3), polygons), end_pt))
   
   return ret
 
@@ -180,8 +142,12 @@ class BuiltProc:
   tiles: list[tuple[int, int]]
   objects: list[tuple[Leg, Object3D, PathPoint]]
   initial_point: PathPoint
+  lod: int = 0 # the level of detail of the objects
   
-def build_proc(proc: SID | STAR | Approach, config: AircraftConfig, runway: str | None, transition: str | None, start_alt: int):
+# `checkpoints` lets builds that start with the same legs share them, see PointCheckpoints
+# The objects are built at the level of detail `lod`, see LOD_TOLERANCES.
+def build_proc(proc: SID | STAR | Approach, config: AircraftConfig, runway: str | None, transition: str | None, start_alt: int,
+    checkpoints: PointCheckpoints | None = None, lod: int = 0):
   match proc:
     case SID(_, airport, rwys, _, _):
       if not runway:
@@ -195,7 +161,7 @@ def build_proc(proc: SID | STAR | Approach, config: AircraftConfig, runway: str
       legs = proc.rwys[runway]
       if transition: legs = legs + get_transition(proc, transition)
       
-      leg_points, _ = build_points(legs, config, start.to_rad(), False, None, start_alt, True, True)
+      leg_points, _ = build_points(legs, config, start.to_rad(), False, None, start_alt, True, True, checkpoints)
       
     case STAR(_, airport, rwys, _, _):
       if not runway:
@@ -208,7 +174,7 @@ def build_proc(proc: SID | STAR | Approach, config: AircraftConfig, runway: str
       legs = proc.rwys[runway]
       if transition: legs = get_transition(proc, transition) + legs
       
-      leg_points, _ = build_points(legs, config, None, False, None, start_alt, False, False)
+      leg_points, _ = build_points(legs, config, None, False, None, start_alt, False, False, checkpoints)
     
     case Approach(_, airport, rwy, legs, _):
       if runway != rwy:
@@ -227,22 +193,130 @@ def build_proc(proc: SID | STAR | Approach, config: AircraftConfig, runway: str
       
       if transition: legs = get_transition(proc, transition) + legs
       
-      appch_leg_points, appch_all_points = build_points(legs, config, None, False, None, 0, False, False)
+      appch_leg_points, appch_all_points = build_points(legs, config, None, False, None, 0, False, False, checkpoints)
       if not appch_all_points: raise Exception("Procedure contains only one point.")
       
       end = appch_all_points[-1]
       
-      map_leg_points, _ = build_points(map_legs, config, end.latlon(), True, end.course, end.altitude, True, True)
+      map_leg_points, _ = build_points(map_legs, config, end.latlon(), True, end.course, end.altitude, True, True, checkpoints)
       
       leg_points = appch_leg_points + map_leg_points
   
   # make the list of required tiles
-  req_tiles: set[tuple[int, int]] = set()
-  for _, ps in leg_points:
-    for p in ps:
-      req_tiles.add((floor(p.lat * 180 / pi), floor(p.lon * 180 / pi)))
+  all_points = PathArray.concat(points for _, points in leg_points)
+  tile_lats = np.floor(np.array(all_points.lat) * 180 / pi).astype(int).tolist()
+  tile_lons = np.floor(np.array(all_points.lon) * 180 / pi).astype(int).tolist()
+  req_tiles: set[tuple[int, int]] = set(zip(tile_lats, tile_lons))
   
   first_point = leg_points[0][1][0]
-  return BuiltProc(list(req_tiles), build_3d(leg_points), first_point)
+  if lod: leg_points, = simplify_levels(leg_points, [LOD_TOLERANCES[lod]])
+  return BuiltProc(list(req_tiles), build_3d(leg_points), first_point, lod)
   
       
+
+# Every (kind, procedure, runway, transition) that can be built for an airport.
+# Combinations that start with the same legs come one after the other: SIDs by runway,
+# STARs by transition, approaches by transition.
+def iter_combinations(sids: dict[str, SID], stars: dict[str, STAR], appches: dict[str, Approach]):
+  for sid in sids.values():
+    for rwy in sid.rwys:
+      for trans in [None] + list(sid.transitions):
+        yield ("sid", sid, rwy, trans)
+  
+  for star in stars.values():
+    for trans in [None] + list(star.transitions):
+      for rwy in star.rwys:
+        yield ("star", star, rwy, trans)
+  
+  for appch in appches.values():
+    for trans in [None] + list(appch.transitions):
+      yield ("approach", appch, appch.rwy, trans)
+
+@dataclass
+class CombinationBuild:
+  kind: str # sid, star or approach
+  proc: SID | STAR | Approach
+  runway: str | None
+  transition: str | None
+  built: object # what `build` returned, None if it raised
+  error: Exception | None
+  seconds: float
+
+# Builds every combination of every procedure of an airport with `build(kind, proc, runway, transition)`,
+# e.g. a build_proc that shares its checkpoints between the combinations, see iter_combinations.
+# A combination that cannot be built is yielded with the error instead of stopping the batch.
+def build_airport(airport: str, build: Callable[[str, SID | STAR | Approach, str | None, str | None], object]):
+  data = get_navdata().get_airport_data(airport)
+  if data is None:
+    raise KeyError(f"No procedures for airport `{airport}`.")
+  
+  for kind, proc, runway, transition in iter_combinations(*data):
+    start = time.perf_counter()
+    try:
+      built, error = build(kind, proc, runway, transition), None
+    except Exception as e:
+      built, error = None, e
+    yield CombinationBuild(kind, proc, runway, transition, built, error, time.perf_counter() - start)
+
+# digest of everything the output of build_proc depends on
+def build_key(proc: SID | STAR | Approach, config: AircraftConfig, runway: str | None, transition: str | None, start_alt: int,
+    lod: int = 0) -> str:
+  navdata = get_navdata()
+  match proc:
+    case SID(_, airport, rwys, _, _) | STAR(_, airport, rwys, _, _):
+      legs = rwys.get(runway)
+    case Approach(_, airport):
+      legs = proc.legs
+  
+  trans_legs = proc.transitions.get(transition) if transition else None
+  
+  key = (
+    BUILDER_VERSION,
+    # the cycle and files of the navdata, and the CIFP file of the airport
+    artifacts.artifact_key(navdata, airport),
+    year, # of the magnetic model
+    type(proc).__name__,
+    proc.ident,
+    runway,
+    transition,
+    legs,
+    trans_legs,
+    config,
+    start_alt,
+    lod
+  )
+  return hashlib.sha256(repr(key).encode()).hexdigest()
+
+# the files served for a built procedure, by name
+# a coarser level of detail only has its path mesh
+def export_files(built: BuiltProc) -> dict[str, bytes]:
+  mesh = encode_mesh([(f"{l.info.qual}{l.info.seq}", obj.vertices, obj.polygons) for l, obj, _ in built.objects])
+  if built.lod: return {"path.mesh": mesh}
+  
+  files: dict[str, bytes] = {}
+  for l, obj, _ in built.objects:
+    files[f"{l.info.qual}{l.info.seq}.obj"] = obj.to_obj("Path").encode()
+  files["path.mesh"] = mesh
+  
+  files["tiles.json"] = json.dumps(built.tiles).encode()
+  
+  initial = built.initial_point
+  points = {}
+  points["initialLatLon"] = (initial.lat * 180 / pi, initial.lon * 180 / pi)
+  points["initialAlt"] = initial.altitude
+  legPointsList = []
+  points["legPoints"] = legPointsList
+  
+  # the end point of every leg
+  ends = PathArray(point for _, _, point in built.objects)
+  lats = (np.array(ends.lat) * 180 / pi).tolist()
+  lons = (np.array(ends.lon) * 180 / pi).tolist()
+  xyzs = vecmath.to_xyz_earth(ends.lat, ends.lon, ends.altitude).reshape(-1, 3).tolist()
+  for (l, _, _), lat, lon, xyz in zip(built.objects, lats, lons, xyzs):
+    cur = {}
+    cur["legId"] = l.info.qual + str(l.info.seq)
+    cur["latLon"] = (lat, lon)
+    cur["xyz"] = tuple(xyz)
+    legPointsList.append(cur)
+  files["points.json"] = json.dumps(points).encode()
+  return files
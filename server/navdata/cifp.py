@@ -0,0 +1,81 @@
+# Tokenizer for the CIFP airport files (navdata/CIFP/<ICAO>.dat).
+# Each file is a list of `KIND:field,field,...;` records. The file is read in one pass:
+# runway records are decoded right away and procedure leg records are split into fields,
+# so that legs can be built afterwards, once all runway waypoints are known.
+from dataclasses import dataclass
+from server.navdata.defns import ProcKind
+
+# Fields of a SID/STAR/APPCH record that are read when building legs.
+# Field 8 (the waypoint description) is not stripped, since the position of each character matters.
+LEG_FIELDS = (0, 1, 2, 3, 4, 5, 9, 11, 13, 14, 18, 19, 20, 21, 22, 23, 24, 26, 27, 28, 30, 31)
+LEG_FIELD_COUNT = LEG_FIELDS[-1] + 1
+
+PROC_KINDS = {
+  "SID": ProcKind.SID,
+  "STAR": ProcKind.STAR,
+  "APPCH": ProcKind.APPCH,
+}
+
+@dataclass(slots=True)
+class RunwayRecord:
+  ident: str
+  ils_ident: str
+  lat: float | None # decimal degrees
+  lon: float | None
+
+@dataclass(slots=True)
+class CIFPRecords:
+  runways: list[RunwayRecord]
+  # the fields of every leg record; only the ones in LEG_FIELDS are stripped
+  legs: list[tuple[ProcKind, list[str]]]
+
+def parse_lat(lat: str) -> float:
+  sign = 1 if lat[0] == "N" else -1
+  return sign * (int(lat[1:3]) + int(lat[3:5]) / 60 + int(lat[5:]) / 360000)
+
+def parse_lon(lon: str) -> float:
+  sign = 1 if lon[0] == "E" else -1
+  return sign * (int(lon[1:4]) + int(lon[4:6]) / 60 + int(lon[6:]) / 360000)
+
+def tokenize_runway(record: str) -> RunwayRecord:
+  spl = record.split(";")
+  parts = spl[0].split(",")
+
+  rwy = parts[0].strip()
+  ils_ident = parts[5].strip()
+
+  if len(spl) == 1: # missing lat lon
+    return RunwayRecord(rwy, ils_ident, None, None)
+
+  opt = spl[1].split(",")
+  return RunwayRecord(rwy, ils_ident, parse_lat(opt[0]), parse_lon(opt[1]))
+
+def tokenize_leg(record: str) -> list[str]:
+  fields = record.split(",")
+  if len(fields) < LEG_FIELD_COUNT:
+    fields += [""] * (LEG_FIELD_COUNT - len(fields))
+  for i in LEG_FIELDS:
+    fields[i] = fields[i].strip()
+  return fields
+
+def tokenize(text: str) -> CIFPRecords:
+  runways: list[RunwayRecord] = []
+  legs: list[tuple[ProcKind, list[str]]] = []
+
+  for record in text.split(";\n"):
+    record = record.strip()
+    if not record: continue
+    kind, _, record = record.partition(":")
+
+    if kind == "RWY":
+      runways.append(tokenize_runway(record))
+    elif kind == "PRDAT":
+      continue
+    else:
+      legs.append((PROC_KINDS.get(kind, ProcKind.APPCH), tokenize_leg(record)))
+
+  return CIFPRecords(runways, legs)
+
+def tokenize_file(path: str) -> CIFPRecords:
+  with open(path) as f:
+    return tokenize(f.read())
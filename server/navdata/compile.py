@@ -0,0 +1,87 @@
+# Builds the navdata snapshot ahead of time so that the server does not
+# have to parse the X-Plane .dat files when it starts.
+# With --precompile, also parses every CIFP file into a procedure artifact
+# so that the first request for an airport does not have to parse it.
+#
+# Usage: python -m server.navdata.compile [data_dir] [--precompile] [--workers N]
+import os
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from server.navdata.loader import NavDatabase
+import server.navdata.snapshot as snapshot
+import server.navdata.artifacts as artifacts
+
+logger = logging.getLogger("cifp-viewer")
+logging.basicConfig(format='[%(asctime)s] %(name)s (%(levelname)s): %(message)s')
+logger.setLevel(logging.INFO)
+
+REPORT_PATH = artifacts.ARTIFACT_DIR + "/report.tsv"
+
+def compile_snapshot(dir: str) -> NavDatabase:
+  start = time.perf_counter()
+  navdata = NavDatabase(dir, use_snapshot=False)
+  logger.info(f"Parsed navdata from {dir} in {time.perf_counter() - start:.2f}s.")
+
+  snapshot.save_snapshot(dir, navdata.snapshot_state())
+  logger.info(f"Wrote navdata snapshot to {snapshot.SNAPSHOT_PATH}.")
+  return navdata
+
+# each worker process loads the navdata once, from the snapshot
+worker_navdata: NavDatabase
+
+def init_worker(dir: str):
+  global worker_navdata
+  worker_navdata = NavDatabase(dir)
+
+def precompile_airport(airport: str) -> tuple[str, float, list[str]]:
+  start = time.perf_counter()
+  try:
+    procs = worker_navdata.parse_airport(airport)
+    artifacts.save_artifact(worker_navdata, airport, procs)
+    errors = procs.errors
+  except Exception as e:
+    errors = [f"{type(e).__name__}: {e}"]
+  return (airport, time.perf_counter() - start, errors)
+
+def precompile_procedures(navdata: NavDatabase, workers: int | None):
+  airports = [x for x in navdata.airports if os.path.exists(navdata.cifp_path(x))]
+  logger.info(f"Precompiling procedures for {len(airports)} airports.")
+
+  start = time.perf_counter()
+  results: list[tuple[str, float, list[str]]] = []
+  with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(navdata.dir,)) as pool:
+    for res in pool.map(precompile_airport, airports, chunksize=16):
+      results.append(res)
+  elapsed = time.perf_counter() - start
+
+  os.makedirs(artifacts.ARTIFACT_DIR, exist_ok=True)
+  with open(REPORT_PATH, "w") as f:
+    f.write("airport\tparse_ms\terrors\n")
+    for airport, t, errors in results:
+      f.write(f"{airport}\t{t * 1000:.2f}\t{'; '.join(errors)}\n")
+
+  failures = [x for x in results if x[2]]
+  for airport, _, errors in failures:
+    logger.warning(f"{airport}: {'; '.join(errors)}")
+
+  slowest = sorted(results, key=lambda x: x[1], reverse=True)[:10]
+  logger.info("Slowest airports: " + ", ".join(f"{a} ({t * 1000:.0f}ms)" for a, t, _ in slowest))
+  logger.info(
+    f"Precompiled {len(results) - len(failures)}/{len(results)} airports in {elapsed:.2f}s "
+    f"({len(failures)} with errors). Per-airport timings written to {REPORT_PATH}.")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog="python -m server.navdata.compile")
+  parser.add_argument("data_dir", nargs="?", default="navdata")
+  parser.add_argument("--precompile", action="store_true", help="also precompile every CIFP airport file")
+  parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per CPU)")
+  args = parser.parse_args()
+
+  dir = args.data_dir
+  if dir.endswith("/"): dir = dir[:-1]
+
+  navdata = compile_snapshot(dir)
+  if args.precompile:
+    precompile_procedures(navdata, args.workers)
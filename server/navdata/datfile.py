@@ -0,0 +1,36 @@
+# Streaming reader for the X-Plane earth_*.dat files.
+# All of them share the same layout: a 3 line header, then one record per line,
+# terminated by a line containing only "99".
+
+CHUNK_SIZE = 1 << 16
+HEADER_LINES = 3
+SENTINEL = "99"
+
+def iter_dat_lines(path: str, chunk_size: int = CHUNK_SIZE):
+  with open(path) as f:
+    to_skip = HEADER_LINES
+    tail = ""
+    while True:
+      chunk = f.read(chunk_size)
+      if not chunk:
+        lines = [tail]
+      else:
+        lines = (tail + chunk).split("\n")
+        # the last line might continue in the next chunk
+        tail = lines.pop()
+
+      for ln in lines:
+        if to_skip:
+          to_skip -= 1
+          continue
+        ln = ln.strip()
+        if ln == SENTINEL: return
+        if not ln: continue
+        yield ln
+
+      if not chunk: return
+
+# yields the whitespace separated fields of every record
+def iter_dat_records(path: str, chunk_size: int = CHUNK_SIZE):
+  for ln in iter_dat_lines(path, chunk_size):
+    yield ln.split()
@@ -0,0 +1,122 @@
+import os
+import atexit
+import hashlib
+import logging
+from array import array
+from math import floor, isnan
+from threading import Lock
+
+logger = logging.getLogger("cifp-viewer")
+
+DECLINATION_DIR = "cache/declination"
+
+# bump this whenever the layout of the grid file changes
+GRID_VERSION = 1
+
+# cells whose corners differ by more than this (in degrees) are too close to
+# a magnetic pole to be interpolated, so the model is evaluated directly instead
+MAX_CELL_SPREAD = 2.0
+
+# the grid is written back to disk after this many new nodes
+SAVE_INTERVAL = 512
+
+# Declination at sea level on a regular lat/lon grid, interpolated bilinearly.
+# Evaluating the spherical harmonic model takes a few milliseconds, and there are
+# (180 / res + 1) * (360 / res + 1) nodes, so nodes are only evaluated the first
+# time a cell that uses them is looked up. Evaluated nodes are kept in a file under
+# DECLINATION_DIR so that they survive restarts, keyed by a hash of the model's coefficients
+# file, so that a new model does not use the nodes of the previous one.
+class DeclinationGrid:
+  def __init__(self, geo_mag, year: float, res: float = 0.25, persist: bool = True, model_file: str | None = None):
+    self.geo_mag = geo_mag
+    self.year = year
+    self.res = res
+    self.model_key = "default"
+    if model_file:
+      with open(model_file, "rb") as f:
+        self.model_key = hashlib.sha256(f.read()).hexdigest()[:16]
+    self.rows = round(180 / res) + 1
+    self.cols = round(360 / res) + 1
+    self.persist = persist
+
+    self.values: array | None = None # degrees, nan if not evaluated yet
+    self.dirty = 0
+    self.lock = Lock()
+
+  def path(self) -> str:
+    return f"{DECLINATION_DIR}/v{GRID_VERSION}-{self.model_key}-{self.year}-{self.res}.bin"
+
+  def load(self) -> array:
+    n = self.rows * self.cols
+    values = array("f")
+    if self.persist and os.path.exists(self.path()):
+      try:
+        with open(self.path(), "rb") as f:
+          values.fromfile(f, n)
+      except (OSError, EOFError) as e:
+        logger.warning(f"Could not read declination grid {self.path()}: {e}")
+        values = array("f")
+
+    if len(values) != n:
+      values = array("f", [float("nan")]) * n
+
+    if self.persist: atexit.register(self.save)
+    return values
+
+  def save(self):
+    with self.lock:
+      if self.values is None or not self.dirty: return
+
+      os.makedirs(DECLINATION_DIR, exist_ok=True)
+      path = self.path()
+      tmp = f"{path}.{os.getpid()}.tmp"
+      try:
+        with open(tmp, "wb") as f:
+          self.values.tofile(f)
+        self.dirty = 0
+        os.replace(tmp, path)
+      except OSError as e:
+        logger.warning(f"Could not write declination grid: {e}")
+
+  def calculate(self, lat: float, lon: float) -> float:
+    return self.geo_mag.calculate(glat=lat, glon=lon, alt=0, time=self.year).d
+
+  # the value is always read back from the grid, so that it is rounded to float32
+  # the same way whether or not the node was evaluated before
+  def node(self, row: int, col: int) -> float:
+    i = row * self.cols + col
+    val = self.values[i]
+    if not isnan(val): return val
+
+    with self.lock:
+      if isnan(self.values[i]):
+        self.values[i] = self.calculate(row * self.res - 90, col * self.res - 180)
+        self.dirty += 1
+      val = self.values[i]
+      save = self.persist and self.dirty >= SAVE_INTERVAL
+    if save: self.save()
+    return val
+
+  # declination in degrees at (lat, lon), in decimal degrees
+  def get(self, lat: float, lon: float) -> float:
+    if self.values is None:
+      with self.lock:
+        if self.values is None: self.values = self.load()
+
+    lon = (lon + 180) % 360 - 180
+    y = min(max((lat + 90) / self.res, 0), self.rows - 1)
+    x = (lon + 180) / self.res
+    row = min(floor(y), self.rows - 2)
+    col = min(floor(x), self.cols - 2)
+    fy = y - row
+    fx = x - col
+
+    d00 = self.node(row, col)
+    d01 = self.node(row, col + 1)
+    d10 = self.node(row + 1, col)
+    d11 = self.node(row + 1, col + 1)
+
+    if max(d00, d01, d10, d11) - min(d00, d01, d10, d11) > MAX_CELL_SPREAD:
+      return self.calculate(lat, lon)
+
+    return (d00 * (1 - fx) + d01 * fx) * (1 - fy) + (d10 * (1 - fx) + d11 * fx) * fy
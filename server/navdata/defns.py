@@ -2,6 +2,8 @@ from dataclasses import dataclass, field
 from enum import Enum
 from math import pi
 from collections import OrderedDict
+from array import array
+from typing import Iterable
 
 @dataclass
 class AircraftConfig:
@@ -22,12 +24,97 @@ class PathPoint:
   def print_deg(self):
     print(f"PathPoint(lat={self.lat * 180 / pi}, lon={self.lon * 180 / pi}, course={self.course * 180 / pi}, altitude={self.altitude})")
 
+# The points of a path, with one growable array of floats per field of PathPoint.
+# Indexing gives a copy of a point as a PathPoint, so fields are set through the arrays.
+class PathArray:
+  __slots__ = ("lat", "lon", "course", "altitude")
+  
+  def __init__(self, points: Iterable[PathPoint] = ()):
+    self.lat = array("d")
+    self.lon = array("d")
+    self.course = array("d")
+    self.altitude = array("d")
+    self.extend(points)
+  
+  # from contiguous buffers of float64, such as numpy arrays, with the altitude not known yet if it is None
+  @staticmethod
+  def from_buffers(lat, lon, course, altitude = None) -> "PathArray":
+    ret = PathArray()
+    ret.lat.frombytes(memoryview(lat).cast("B"))
+    ret.lon.frombytes(memoryview(lon).cast("B"))
+    ret.course.frombytes(memoryview(course).cast("B"))
+    if altitude is None:
+      ret.altitude = array("d", [float('-inf')]) * len(ret.lat)
+    else:
+      ret.altitude.frombytes(memoryview(altitude).cast("B"))
+    return ret
+  
+  # from a contiguous buffer of float64 with an altitude for every point
+  def set_altitude(self, altitude):
+    self.altitude = array("d")
+    self.altitude.frombytes(memoryview(altitude).cast("B"))
+  
+  def __len__(self):
+    return len(self.lat)
+  
+  def __getitem__(self, i: int | slice):
+    if isinstance(i, slice):
+      ret = PathArray()
+      ret.lat = self.lat[i]
+      ret.lon = self.lon[i]
+      ret.course = self.course[i]
+      ret.altitude = self.altitude[i]
+      return ret
+    return PathPoint(self.lat[i], self.lon[i], self.course[i], self.altitude[i])
+  
+  def __iter__(self):
+    for x in zip(self.lat, self.lon, self.course, self.altitude):
+      yield PathPoint(*x)
+  
+  def __iadd__(self, other: "PathArray | Iterable[PathPoint]"):
+    self.extend(other)
+    return self
+  
+  def latlon(self, i: int) -> tuple[float, float]:
+    return (self.lat[i], self.lon[i])
+  
+  def append(self, p: PathPoint):
+    self.lat.append(p.lat)
+    self.lon.append(p.lon)
+    self.course.append(p.course)
+    self.altitude.append(p.altitude)
+  
+  def extend(self, other: "PathArray | Iterable[PathPoint]"):
+    if isinstance(other, PathArray):
+      self.lat.extend(other.lat)
+      self.lon.extend(other.lon)
+      self.course.extend(other.course)
+      self.altitude.extend(other.altitude)
+    else:
+      for p in other: self.append(p)
+  
+  @staticmethod
+  def concat(arrays: Iterable["PathArray"]) -> "PathArray":
+    ret = PathArray()
+    for x in arrays: ret.extend(x)
+    return ret
+  
+  # the points at the given indices
+  def take(self, indices: Iterable[int]) -> "PathArray":
+    ret = PathArray()
+    for i in indices:
+      ret.lat.append(self.lat[i])
+      ret.lon.append(self.lon[i])
+      ret.course.append(self.course[i])
+      ret.altitude.append(self.altitude[i])
+    return ret
+
 class ProcKind(Enum):
   SID = 0
   STAR = 1
   APPCH = 2
 
-@dataclass
+@dataclass(frozen=True)
 class Course:
   val: float
   truenorth: bool
@@ -37,12 +124,15 @@ class Course:
     suffix = "°T" if self.truenorth else "°"
     return str(round(self.val)) + suffix
   
-@dataclass
+@dataclass(frozen=True)
 class DistOrTime:
   val: float
   is_dist: float
 
-@dataclass
+# Fixes are stored column-wise in WaypointStore, and these records are
+# created on demand, so keep them as small as possible.
+# Waypoints, courses and restrictions are shared between legs, so they are immutable.
+@dataclass(slots=True, frozen=True)
 class Waypoint:
   name: str
   lat: float # decimal degrees
@@ -60,14 +150,14 @@ class SpeedRestr:
   def pretty_print(self) -> str: raise NotImplementedError
 
 # @
-@dataclass
+@dataclass(frozen=True)
 class AtSpeed(SpeedRestr):
   speed: int
   def pretty_print(self) -> str:
     return f"At {self.speed}kt"
 
 # =+, -
-@dataclass
+@dataclass(frozen=True)
 class SpeedRange(SpeedRestr):
   speed: int
   above: bool
@@ -76,13 +166,13 @@ class SpeedRange(SpeedRestr):
     return f"{qual}{self.speed}kt"
 
 # @
-@dataclass
+@dataclass(frozen=True)
 class AtAlt(AltRestr):
   at: int
   def pretty_print(self) -> str: return "At " + str(self.at)
 
 # +, -, B, C
-@dataclass
+@dataclass(frozen=True)
 class AltRange(AltRestr):
   above: int | None
   below: int | None
@@ -101,7 +191,7 @@ class AltRange(AltRestr):
     return ret
       
 # G, H
-@dataclass
+@dataclass(frozen=True)
 class GlideslopeAlt(AltRestr):
   msl: int
   alt: int
@@ -112,7 +202,7 @@ class GlideslopeAlt(AltRestr):
     return f"{qual}{self.alt}, GS{self.msl}" 
 
 # I, J
-@dataclass
+@dataclass(frozen=True)
 class GlideslopeIntc(AltRestr):
   intc: int
   alt: int
@@ -122,7 +212,7 @@ class GlideslopeIntc(AltRestr):
     qual = "A" if self.above else "At "
     return f"{qual}{self.alt}, GS Intercept {self.intc}" 
 # V, Y
-@dataclass
+@dataclass(frozen=True)
 class StepDownAboveBelow(AltRestr):
   alt: int
   valt: int
@@ -132,7 +222,7 @@ class StepDownAboveBelow(AltRestr):
     qual = "A" if self.above_below else "B"
     return f"{qual}{self.alt}, Glide {self.valt}" 
 # X
-@dataclass
+@dataclass(frozen=True)
 class StepDownAt(AltRestr):
   alt: int
   valt: int
@@ -140,18 +230,18 @@ class StepDownAt(AltRestr):
   def pretty_print(self) -> str:
     return f"At {self.alt}, Glide {self.valt}" 
 
-@dataclass
+@dataclass(frozen=True)
 class RadialDME:
   fix: Waypoint
   rad: Course
   dist: float
   
-@dataclass
+@dataclass(frozen=True)
 class Radial:
   fix: Waypoint
   rad: Course
   
-@dataclass
+@dataclass(frozen=True)
 class LegInfo:
   seq: int
   kind: ProcKind
@@ -172,7 +262,7 @@ class LegInfo:
   speed: SpeedRestr | None
   glide_angle: float | None
 
-@dataclass
+@dataclass(frozen=True)
 class Leg:
   def type_str(self) -> str:
     raise NotImplementedError("Not implemented")
@@ -182,7 +272,7 @@ class Leg:
     raise NotImplementedError
   info: LegInfo
 
-@dataclass
+@dataclass(frozen=True)
 class InitialFix(Leg):
   def type_str(self): return "IF"
   fix: Waypoint
@@ -193,7 +283,7 @@ class InitialFix(Leg):
     return "Initial Fix"
     
 
-@dataclass
+@dataclass(frozen=True)
 class TrackToFix(Leg):
   def type_str(self): return "TF"
   fix: Waypoint
@@ -202,7 +292,7 @@ class TrackToFix(Leg):
   def title(self) -> str:
     return "Track to Fix"
 
-@dataclass
+@dataclass(frozen=True)
 class CourseToFix(Leg):
   def type_str(self): return "CF"
   
@@ -215,7 +305,7 @@ class CourseToFix(Leg):
   def title(self) -> str:
     return f"Course {self.course.pretty_print()} to Fix"
 
-@dataclass
+@dataclass(frozen=True)
 class DirectToFix(Leg):
   def type_str(self): return "DF"
   
@@ -228,7 +318,7 @@ class DirectToFix(Leg):
   def title(self) -> str:
     return "Direct to Fix"
 
-@dataclass
+@dataclass(frozen=True)
 class FixToAltitude(Leg):
   def type_str(self): return "FA"
   
@@ -244,7 +334,7 @@ class FixToAltitude(Leg):
   def title(self) -> str:
     return "Fix to Altitude"
 
-@dataclass
+@dataclass(frozen=True)
 class FixToDistance(Leg):
   def type_str(self): return "FC"
   
@@ -258,7 +348,7 @@ class FixToDistance(Leg):
   def fix_name(self) -> str:
     return f"{self.start.name}/{self.dist}NM/{self.course.pretty_print()}"
 
-@dataclass
+@dataclass(frozen=True)
 class FixToDME(Leg):
   def type_str(self): return "FD"
   
@@ -273,7 +363,7 @@ class FixToDME(Leg):
   def title(self) -> str:
     return "Fix to DME"
   
-@dataclass
+@dataclass(frozen=True)
 class FixToManual(Leg):
   def type_str(self): return "FM"
   
@@ -287,7 +377,7 @@ class FixToManual(Leg):
   def title(self) -> str:
     return "Fix to Manual"
 
-@dataclass
+@dataclass(frozen=True)
 class CourseToAlt(Leg):
   def type_str(self): return "CA"
   
@@ -300,7 +390,7 @@ class CourseToAlt(Leg):
   def title(self) -> str:
     return f"Course {self.course.pretty_print()} to Altitude" 
 
-@dataclass
+@dataclass(frozen=True)
 class CourseToDME(Leg):
   def type_str(self): return "CD"
   
@@ -315,7 +405,7 @@ class CourseToDME(Leg):
     return f"Course {self.course.pretty_print()} to DME"
   
   
-@dataclass
+@dataclass(frozen=True)
 class CourseToIntercept(Leg):
   def type_str(self): return "CI"
   
@@ -328,7 +418,7 @@ class CourseToIntercept(Leg):
   def title(self) -> str:
     return f"Course {self.course.pretty_print()} to Intercept"
 
-@dataclass
+@dataclass(frozen=True)
 class CourseToRadial(Leg):
   def type_str(self): return "CR"
   
@@ -341,7 +431,7 @@ class CourseToRadial(Leg):
   def title(self) -> str:
     return f"Course {self.course.pretty_print()} to Radial"
   
-@dataclass
+@dataclass(frozen=True)
 class RadiusArc(Leg):
   def type_str(self): return "RF"
 
@@ -355,7 +445,7 @@ class RadiusArc(Leg):
   def title(self) -> str:
     return "Constant Radius Arc"
   
-@dataclass
+@dataclass(frozen=True)
 class ArcToFix(Leg):
   def type_str(self): return "AF"
   
@@ -368,7 +458,7 @@ class ArcToFix(Leg):
   def title(self) -> str:
     return "Arc to Fix"
   
-@dataclass
+@dataclass(frozen=True)
 class HeadingToAlt(Leg):
   def type_str(self): return "VA"
 
@@ -381,7 +471,7 @@ class HeadingToAlt(Leg):
   def title(self) -> str:
     return f"Heading {self.heading.pretty_print()} to Altitude"
   
-@dataclass
+@dataclass(frozen=True)
 class HeadingToDME(Leg):
   def type_str(self): return "VD"
   
@@ -395,7 +485,7 @@ class HeadingToDME(Leg):
   def title(self) -> str:
     return f"Heading {self.heading.pretty_print()} to DME"
   
-@dataclass
+@dataclass(frozen=True)
 class HeadingToIntercept(Leg):
   def type_str(self): return "VI"
 
@@ -408,7 +498,7 @@ class HeadingToIntercept(Leg):
   def title(self) -> str:
     return f"Heading {self.heading.pretty_print()} to Intercept"
   
-@dataclass
+@dataclass(frozen=True)
 class HeadingToManual(Leg):
   def type_str(self): return "VM"
   
@@ -422,7 +512,7 @@ class HeadingToManual(Leg):
   def title(self) -> str:
     return f"Heading {self.heading.pretty_print()} to Manual"
   
-@dataclass
+@dataclass(frozen=True)
 class HeadingToRadial(Leg):
   def type_str(self): return "VR"
   
@@ -435,7 +525,7 @@ class HeadingToRadial(Leg):
   def title(self) -> str:
     return "Heading to Radial"
 # Course reversal
-@dataclass
+@dataclass(frozen=True)
 class ProcTurn(Leg):
   def type_str(self): return "PI"
   
@@ -451,7 +541,7 @@ class ProcTurn(Leg):
     return "Procedure Turn"
 
 # terminates at an altitude
-@dataclass
+@dataclass(frozen=True)
 class HoldAlt(Leg):
   def type_str(self): return "HA"
   
@@ -467,7 +557,7 @@ class HoldAlt(Leg):
     return "Hold to altitude"
   
 # terminates after one orbit
-@dataclass
+@dataclass(frozen=True)
 class HoldFix(Leg):
   def type_str(self): return "HF"
   
@@ -481,7 +571,7 @@ class HoldFix(Leg):
   def title(self) -> str:
     return "Hold once"
   
-@dataclass
+@dataclass(frozen=True)
 class HoldToManual(Leg):
   def type_str(self): return "HM"
 
@@ -529,3 +619,14 @@ class Approach:
   rwy: str | None = None
   transitions: dict[str, list[Leg]] = field(default_factory=OrderedDict)
   legs: list[Leg] = field(default_factory=list)
+
+# everything that is parsed from an airport's CIFP file
+@dataclass
+class AirportProcedures:
+  runways: list[str]
+  runway_waypoints: dict[str, Waypoint]
+  sids: dict[str, SID]
+  stars: dict[str, STAR]
+  appches: dict[str, Approach]
+  errors: list[str] = field(default_factory=list)
+  runway_index: "RunwayIndex | None" = None
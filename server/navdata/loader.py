@@ -1,8 +1,29 @@
 from server.navdata.defns import *
 from collections import defaultdict
 from server.util import querydict
+import server.navdata.snapshot as snapshot
+import server.navdata.artifacts as artifacts
+import server.navdata.cifp as cifp
+from server.navdata.datfile import iter_dat_records
+from server.navdata.waypoints import WaypointStore
+from server.navdata.spatial import SpatialIndex
+from server.navdata.proccache import ProcedureCache
+from server.navdata.runways import RunwayIndex, opposite_runway
+from array import array
+from threading import Lock
 import os
 import functools
+import logging
+from typing import Callable
+
+# leg qualifiers of the runway transitions and of the enroute transitions
+# "V" is listed for both SID kinds; it is treated as a runway transition
+SID_RWY_QUALS = frozenset(["0", "1", "2", "4", "5", "F", "M", "T", "V"])
+SID_TRANS_QUALS = frozenset(["3", "6", "S", "V"])
+STAR_RWY_QUALS = frozenset(["2", "5", "3", "6", "8", "9", "M", "S"])
+STAR_TRANS_QUALS = frozenset(["1", "4", "7", "F"])
+
+logger = logging.getLogger("cifp-viewer")
 
 def parse_alt(data: str) -> int:
   if data.startswith("FL"): return int(data[2:]) * 100
@@ -16,35 +37,73 @@ def parse_course(crs: str) -> Course:
   return Course(int(crs) / 10, truenorth)
   
   
+# Memoizes a NavDatabase.process_* helper in the `tables` passed to it.
+# `key` maps the helper's arguments to the fields that its result depends on.
+def interned(key: Callable[..., tuple]):
+  def decorator(fn):
+    @functools.wraps(fn)
+    def wrapper(self, *args, tables: dict | None = None):
+      if tables is None: return fn(self, *args, tables=tables)
+      k = (fn.__name__,) + key(*args)
+      if k in tables: return tables[k]
+      val = fn(self, *args, tables=tables)
+      tables[k] = val
+      return val
+    return wrapper
+  return decorator
+  
 class NavDatabase:
   
-  waypoints: dict[tuple[str, str], dict[str, Waypoint]] = defaultdict(lambda: {})
+  waypoints: WaypointStore
   runway_waypoints: dict[str, dict[str, Waypoint]] = defaultdict(lambda: {})
   airports: dict[str, AirportInfo] = {}
   
-  def __init__(self, dir: str):
+  def __init__(self, dir: str, use_snapshot: bool = True, cache_entries: int = 256, cache_bytes: int = 0):
     
     self.dir = dir
+    self.spatial_index: SpatialIndex | None = None
+    # built when the CIFP file of the airport is loaded
+    self.runway_indices: dict[str, RunwayIndex] = {}
+    # identifies the version of the .dat files that were loaded
+    self.source_key = snapshot.snapshot_key(dir)
+    
+    # parsed procedures, weighed by the size of their CIFP file
+    self.procedure_cache: ProcedureCache[str, tuple | None] = ProcedureCache(
+      self.load_airport_data,
+      cache_entries,
+      cache_bytes,
+      lambda airport, data: self.cifp_size(airport) if data else 0)
+    
+    if use_snapshot:
+      state = snapshot.load_snapshot(dir)
+      if not state is None:
+        self.restore_state(state)
+        return
+    
+    self.load_dat_files()
+    
+    if use_snapshot:
+      try:
+        snapshot.save_snapshot(dir, self.snapshot_state())
+      except OSError as e:
+        logger.warning(f"Could not write navdata snapshot: {e}")
+  
+  def load_dat_files(self):
+    dir = self.dir
+    
+    self.waypoints = WaypointStore()
     
     # load fixes
-    with open(dir + "/earth_fix.dat") as f:
-      data = f.read().split("\n")[3:]
-    for d in data:
-      if d == "99": break
-      d = d.strip()
-      lat, lon, name, airport, region = d.split()[:5]
+    for d in iter_dat_records(dir + "/earth_fix.dat"):
+      lat, lon, name, airport, region = d[:5]
       lat = float(lat)
       lon = float(lon)
       
-      self.waypoints[(region, airport)][name] = Waypoint(name, lat, lon, region, airport)
+      self.waypoints.add(name, lat, lon, region, airport)
       
     # load other navaids (NBD, VOR, DME)
-    with open(dir + "/earth_nav.dat") as f:
-      data = f.read().split("\n")[3:]
-    for d in data:
-      if d == "99": break
-      d = d.strip()
-      d = d.split()
+    for d in iter_dat_records(dir + "/earth_nav.dat"):
+      if not d[0] in ["2", "3", "4", "5", "12", "13"]: continue
       
       lat = float(d[1])
       lon = float(d[2])
@@ -52,21 +111,13 @@ class NavDatabase:
       airport = d[8]
       region = d[9]
       
-      if not d[0] in ["2", "3", "4", "5", "12", "13"]: continue
-      
       if d[0] == "4":
         self.runway_waypoints[airport][name] = Waypoint(name, lat, lon, region, airport)
       
-      self.waypoints[(region, airport)][name] = Waypoint(name, lat, lon, region, airport)
+      self.waypoints.add(name, lat, lon, region, airport)
       
     # load airports
-    with open(dir + "/earth_aptmeta.dat") as f:
-      data = f.read().split("\n")[3:]
-    for d in data:
-      if d == "99": break
-      d = d.strip()
-      d = d.split()
-      
+    for d in iter_dat_records(dir + "/earth_aptmeta.dat"):
       ident, region, lat, lon, elev, _, _, _, ta, tl = d 
       lat = float(lat)
       lon = float(lon)
@@ -74,24 +125,69 @@ class NavDatabase:
       ta = int(ta)
       tl = parse_alt(tl)
       self.airports[ident] = AirportInfo(ident, lat, lon, region, elev, ta, tl)
+    
+    self.waypoints.finalize()
+  
+  # the snapshot only contains what is loaded from the .dat files;
+  # procedures are still loaded lazily from the CIFP folder
+  def snapshot_state(self) -> dict:
+    return {
+      "waypoints": self.waypoints,
+      "runway_waypoints": dict(self.runway_waypoints),
+      "airports": self.airports,
+    }
+  
+  def restore_state(self, state: dict):
+    self.waypoints = state["waypoints"]
+    self.runway_waypoints = defaultdict(lambda: {}, state["runway_waypoints"])
+    self.airports = state["airports"]
       
   
+  spatial_index_lock = Lock()
+  
+  # built lazily, since most requests never need it
+  def get_spatial_index(self) -> SpatialIndex:
+    with self.spatial_index_lock:
+      if self.spatial_index is None:
+        # ids [0, len(waypoints)) are waypoints, the rest are airports
+        self.spatial_airports = list(self.airports.values())
+        lats = array("d", self.waypoints.lats)
+        lons = array("d", self.waypoints.lons)
+        lats.extend(a.lat for a in self.spatial_airports)
+        lons.extend(a.lon for a in self.spatial_airports)
+        self.spatial_index = SpatialIndex(lats, lons)
+      return self.spatial_index
+  
+  def spatial_entry(self, id: int) -> Waypoint | AirportInfo:
+    n = len(self.waypoints)
+    if id < n: return self.waypoints.get(id)
+    return self.spatial_airports[id - n]
+  
+  # the k closest fixes, navaids and airports to a point, closest first
+  def nearest(self, lat: float, lon: float, k: int) -> list[tuple[Waypoint | AirportInfo, float]]:
+    found = self.get_spatial_index().nearest(lat, lon, k)
+    return [(self.spatial_entry(i), d) for i, d in found]
+  
+  # all fixes, navaids and airports within `nm` nautical miles of a point, closest first
+  def within_radius(self, lat: float, lon: float, nm: float) -> list[tuple[Waypoint | AirportInfo, float]]:
+    found = self.get_spatial_index().within_radius(lat, lon, nm)
+    return [(self.spatial_entry(i), d) for i, d in found]
+  
   def get_waypoint(self, name: str, region: str, airport: str) -> Waypoint:
     if not (region, airport) in self.waypoints:
       if not (region, "ENRT") in self.waypoints:
         raise KeyError(f"Region `{region}` not found.")  
       else:
-        r = self.waypoints[(region, "ENRT")]
-    else:
-      r = self.waypoints[(region, airport)]
-    if not name in r:
-      enrt = self.waypoints[(region, "ENRT")]
-      if not name in enrt:
+        airport = "ENRT"
+    idx = self.waypoints.find(name, region, airport)
+    if idx == -1:
+      idx = self.waypoints.find(name, region, "ENRT")
+      if idx == -1:
         raise KeyError("Waypoint `" + name + "` in region `" + region + "` not found.")
-      return enrt[name]
-    return r[name]
+    return self.waypoints.get(idx)
     
-  def process_alt_desc(self, data: list[str]) -> AltRestr | None:
+  @interned(lambda data: (data[22], data[23], data[24]))
+  def process_alt_desc(self, data: list[str], tables: dict | None = None) -> AltRestr | None:
     kind = data[22]
     alt1 = data[23]
     alt2 = data[24]
@@ -138,7 +234,8 @@ class NavDatabase:
     
     raise ValueError("Altitude description " + kind + " not recognized.")
     
-  def process_speed_desc(self, data: list[str]) -> SpeedRestr | None:
+  @interned(lambda data: (data[26], data[27]))
+  def process_speed_desc(self, data: list[str], tables: dict | None = None) -> SpeedRestr | None:
     kind = data[26]
     speed = data[27]
     if not speed: return None
@@ -152,15 +249,13 @@ class NavDatabase:
   
   def get_runway_waypoint(self, airport: str, rwy: str, opposite_end: bool = False):
     key = rwy
+    index = self.runway_indices.get(airport)
     if opposite_end:
-      rwy_no = int(rwy[2:4])
-      rwy_des = rwy[4] if len(rwy) == 5 else ""
-      rwy_no = (rwy_no + 18) % 36
-      if rwy_no == 0: rwy_no = 36
-      if rwy_des == "L": rwy_des = "R"
-      elif rwy_des == "R": rwy_des = "L"
-      key = "RW" + str(rwy_no).rjust(2, "0") + rwy_des
-
+      key = index.opposite.get(rwy) if index else None
+      if key is None: key = opposite_runway(rwy)
+    
+    if index and key in index.thresholds:
+      return index.thresholds[key]
     # runway or helipad waypoint
     if key in self.runway_waypoints[airport]:
       return self.runway_waypoints[airport][key]
@@ -168,7 +263,9 @@ class NavDatabase:
     arpt = self.airports[airport]
     return Waypoint(arpt.icao, arpt.lat, arpt.lon, arpt.region, arpt.icao)
   
-  def process_waypoint(self, data: list[str], airport: str, start_idx: int = 4) -> Waypoint:
+  # the description only matters for the fix in field 4
+  @interned(lambda data, airport, start_idx=4: (data[start_idx], data[start_idx + 1], start_idx == 4 and data[8][:1]))
+  def process_waypoint(self, data: list[str], airport: str, start_idx: int = 4, tables: dict | None = None) -> Waypoint:
     """
       4 = normal fix\n
       13 = recommended navaid\n
@@ -195,20 +292,23 @@ class NavDatabase:
           self.get_waypoint(fix, icao, airport)
     return self.get_waypoint(fix, icao, airport)
   
-  def process_course(self, data: list[str]) -> Course:
+  @interned(lambda data: (data[20],))
+  def process_course(self, data: list[str], tables: dict | None = None) -> Course:
     return parse_course(data[20])
   
   def process_dist(self, data: list[str]) -> float:
     return int(data[21]) / 10
   
-  def process_disttime(self, data: list[str]) -> DistOrTime: # minutes
+  @interned(lambda data: (data[21],))
+  def process_disttime(self, data: list[str], tables: dict | None = None) -> DistOrTime: # minutes
     t = data[21]
     if t[0] == "T":
       return DistOrTime(int(t[1:]) / 10, False)
     else:
       return DistOrTime(int(t) / 10, True)
   
-  def process_raddme(self, data: list[str], airport: str, waypoint_idx: int) -> RadialDME:
+  @interned(lambda data, airport, waypoint_idx: (data[waypoint_idx], data[waypoint_idx + 1], data[18], data[19]))
+  def process_raddme(self, data: list[str], airport: str, waypoint_idx: int, tables: dict | None = None) -> RadialDME:
     """
       4 = normal fix\n
       13 = recommended navaid\n
@@ -216,7 +316,7 @@ class NavDatabase:
     """
     if not data[waypoint_idx]: return None
     
-    waypoint = self.process_waypoint(data, airport, waypoint_idx)
+    waypoint = self.process_waypoint(data, airport, waypoint_idx, tables=tables)
     
     if not data[18] or not data[19]: return None
     
@@ -224,7 +324,8 @@ class NavDatabase:
     rho = int(data[19]) / 10
     return RadialDME(waypoint, theta, rho)
   
-  def process_rad(self, data: list[str], airport: str, waypoint_idx: int) -> Radial:
+  @interned(lambda data, airport, waypoint_idx: (data[waypoint_idx], data[waypoint_idx + 1], data[18]))
+  def process_rad(self, data: list[str], airport: str, waypoint_idx: int, tables: dict | None = None) -> Radial:
     """
       4 = normal fix\n
       13 = recommended navaid\n
@@ -232,22 +333,25 @@ class NavDatabase:
     """
     if not data[waypoint_idx]: return None
     
-    waypoint = self.process_waypoint(data, airport, waypoint_idx)
+    waypoint = self.process_waypoint(data, airport, waypoint_idx, tables=tables)
     
     if not data[18]: return None
     
     theta = parse_course(data[18])
     return Radial(waypoint, theta)
   
-  def process_line(self, proc_kind: ProcKind, data: list[str], airport: str) -> Leg:
-    desc = data[8]
-    data = [x.strip() for x in data]
-    data[8] = desc # padding is important for this field
-    
+  # `data` is a leg record from cifp.tokenize_leg
+  # legs of the same airport should be processed with the same `tables`,
+  # so that they share identical fixes, courses and restrictions
+  def process_line(self, proc_kind: ProcKind, data: list[str], airport: str, tables: dict | None = None) -> Leg:
     seq = int(data[0])
     qual = data[1]
     ident = data[2]
     trans = data[3]
+    if not tables is None:
+      qual = tables.setdefault(qual, qual)
+      ident = tables.setdefault(ident, ident)
+      trans = tables.setdefault(trans, trans)
     
     desc = data[8]
     overfly = desc[1] == "Y"
@@ -256,8 +360,8 @@ class NavDatabase:
     faf = desc[3] == "D" or desc[3] == "I" or desc[3] == "F"
     mapt = desc[3] == "M"
     
-    alt = self.process_alt_desc(data)
-    speed = self.process_speed_desc(data)
+    alt = self.process_alt_desc(data, tables=tables)
+    speed = self.process_speed_desc(data, tables=tables)
     
     turn_dir = data[9]
     turn_dir = turn_dir == "R" if turn_dir else None
@@ -268,220 +372,217 @@ class NavDatabase:
     kind = data[11]
     
     if kind == "IF":
-      fix = self.process_waypoint(data, airport)
+      fix = self.process_waypoint(data, airport, tables=tables)
       return InitialFix(info, fix)
     
     if kind == "TF":
-      fix = self.process_waypoint(data, airport)
+      fix = self.process_waypoint(data, airport, tables=tables)
       return TrackToFix(info, fix)
     
     if kind == "CF":
-      fix = self.process_waypoint(data, airport)
-      course = self.process_course(data)
-      rcmd = self.process_raddme(data, airport, 13)
+      fix = self.process_waypoint(data, airport, tables=tables)
+      course = self.process_course(data, tables=tables)
+      rcmd = self.process_raddme(data, airport, 13, tables=tables)
       return CourseToFix(info, fix, course, rcmd)
     
     if kind == "DF":
-      fix = self.process_waypoint(data, airport)
-      rcmd = self.process_raddme(data, airport, 13)
+      fix = self.process_waypoint(data, airport, tables=tables)
+      rcmd = self.process_raddme(data, airport, 13, tables=tables)
       return DirectToFix(info, fix, rcmd)
     
     if kind == "FA":
-      start = self.process_waypoint(data, airport)
-      course = self.process_course(data)
+      start = self.process_waypoint(data, airport, tables=tables)
+      course = self.process_course(data, tables=tables)
       alt = parse_alt(data[23])
-      rcmd = self.process_raddme(data, airport, 13)
+      rcmd = self.process_raddme(data, airport, 13, tables=tables)
       return FixToAltitude(info, start, course, alt, rcmd)
     
     if kind == "FC":
-      start = self.process_waypoint(data, airport)
-      course = self.process_course(data)
+      start = self.process_waypoint(data, airport, tables=tables)
+      course = self.process_course(data, tables=tables)
       dist = self.process_dist(data)
       return FixToDistance(info, start, course, dist)
   
     if kind == "FD":
-      start = self.process_waypoint(data, airport)
-      course = self.process_course(data)
-      ref = self.process_waypoint(data, airport, 13)
+      start = self.process_waypoint(data, airport, tables=tables)
+      course = self.process_course(data, tables=tables)
+      ref = self.process_waypoint(data, airport, 13, tables=tables)
       dme = self.process_dist(data)
       return FixToDME(info, start, course, ref, dme)
 
     if kind == "FM":
-      start = self.process_waypoint(data, airport)
-      course = self.process_course(data)
-      rcmd = self.process_raddme(data, airport, 13)
+      start = self.process_waypoint(data, airport, tables=tables)
+      course = self.process_course(data, tables=tables)
+      rcmd = self.process_raddme(data, airport, 13, tables=tables)
       return FixToManual(info, start, course, rcmd)
     
     if kind == "CA":
-      course = self.process_course(data)
+      course = self.process_course(data, tables=tables)
       alt = parse_alt(data[23])
       return CourseToAlt(info, course, alt)
     
     if kind == "CD":
-      course = self.process_course(data)
-      to = self.process_waypoint(data, airport, 13)
+      course = self.process_course(data, tables=tables)
+      to = self.process_waypoint(data, airport, 13, tables=tables)
       dme = self.process_dist(data)
       return CourseToDME(info, course, to, dme)
     
     if kind == "CI":
-      course = self.process_course(data)
-      rcmd = self.process_waypoint(data, airport, 13) if data[13] else None
+      course = self.process_course(data, tables=tables)
+      rcmd = self.process_waypoint(data, airport, 13, tables=tables) if data[13] else None
       return CourseToIntercept(info, course, rcmd)
 
     if kind == "CR":
-      course = self.process_course(data)
-      radial = self.process_rad(data, airport, 13)
+      course = self.process_course(data, tables=tables)
+      radial = self.process_rad(data, airport, 13, tables=tables)
       return CourseToRadial(info, course, radial)
     
     if kind == "RF":
-      fix = self.process_waypoint(data, airport)
-      center = self.process_waypoint(data, airport, 30)
+      fix = self.process_waypoint(data, airport, tables=tables)
+      center = self.process_waypoint(data, airport, 30, tables=tables)
       dist = self.process_dist(data)
       return RadiusArc(info, fix, center, dist)
     
     if kind == "AF":
-      fix = self.process_waypoint(data, airport)
-      rcmd = self.process_raddme(data, airport, 13)
+      fix = self.process_waypoint(data, airport, tables=tables)
+      rcmd = self.process_raddme(data, airport, 13, tables=tables)
       return ArcToFix(info, fix, rcmd)
     
     if kind == "VA":
-      heading = self.process_course(data)
+      heading = self.process_course(data, tables=tables)
       alt = parse_alt(data[23])
       return HeadingToAlt(info, heading, alt)
     
     if kind == "VD":
-      heading = self.process_course(data)
-      to = self.process_waypoint(data, airport, 13)
+      heading = self.process_course(data, tables=tables)
+      to = self.process_waypoint(data, airport, 13, tables=tables)
       dme = self.process_dist(data)
       return HeadingToDME(info, heading, to, dme)
     
     if kind == "VI":
-      heading = self.process_course(data)
-      rcmd = self.process_waypoint(data, airport, 13) if data[13] else None
+      heading = self.process_course(data, tables=tables)
+      rcmd = self.process_waypoint(data, airport, 13, tables=tables) if data[13] else None
       return HeadingToIntercept(info, heading, rcmd)
 
     if kind == "VR":
-      heading = self.process_course(data)
-      radial = self.process_rad(data, airport, 13)
+      heading = self.process_course(data, tables=tables)
+      radial = self.process_rad(data, airport, 13, tables=tables)
       return HeadingToRadial(info, heading, radial)
     
     if kind == "VM":
-      fix = self.process_waypoint(data, airport) if data[4] else None
-      heading = self.process_course(data)
+      fix = self.process_waypoint(data, airport, tables=tables) if data[4] else None
+      heading = self.process_course(data, tables=tables)
       return HeadingToManual(info, fix, heading)
     
     if kind == "PI":
-      fix = self.process_waypoint(data, airport)
+      fix = self.process_waypoint(data, airport, tables=tables)
       alt = parse_alt(data[23])
-      course = self.process_course(data)
+      course = self.process_course(data, tables=tables)
       max_dist = self.process_dist(data)
       return ProcTurn(info, fix, alt, course, max_dist)
     
     if kind == "HA":
-      fix = self.process_waypoint(data, airport)
+      fix = self.process_waypoint(data, airport, tables=tables)
       alt = parse_alt(data[23])
-      course = self.process_course(data)
-      disttime = self.process_disttime(data)
+      course = self.process_course(data, tables=tables)
+      disttime = self.process_disttime(data, tables=tables)
       return HoldAlt(info, fix, alt, disttime, course)
     
     if kind == "HF":
-      fix = self.process_waypoint(data, airport)
-      course = self.process_course(data)
-      disttime = self.process_disttime(data)
+      fix = self.process_waypoint(data, airport, tables=tables)
+      course = self.process_course(data, tables=tables)
+      disttime = self.process_disttime(data, tables=tables)
       return HoldFix(info, fix, disttime, course)
     
     if kind == "HM":
-      fix = self.process_waypoint(data, airport)
-      course = self.process_course(data)
-      disttime = self.process_disttime(data)
+      fix = self.process_waypoint(data, airport, tables=tables)
+      course = self.process_course(data, tables=tables)
+      disttime = self.process_disttime(data, tables=tables)
       return HoldToManual(info, fix, disttime, course)
     
     raise ValueError("Leg type " + kind + " not recognized.")
   
-  @functools.cache
+  def cifp_path(self, airport: str) -> str:
+    return self.dir + "/CIFP/" + airport + ".dat"
+  
+  def cifp_size(self, airport: str) -> int:
+    try:
+      return os.path.getsize(self.cifp_path(airport))
+    except OSError:
+      return 0
+  
   def get_airport_data(self, airport: str):
+    return self.procedure_cache.get(airport)
+  
+  def load_airport_data(self, airport: str):
     if not airport in self.airports: return None
     
-    path = self.dir + "/CIFP/" + airport + ".dat"
+    if not os.path.exists(self.cifp_path(airport)): return None
     
-    if not os.path.exists(path): return None
+    procs = artifacts.load_artifact(self, airport)
+    if procs is None:
+      procs = self.parse_airport(airport)
+      try:
+        artifacts.save_artifact(self, airport, procs)
+      except OSError as e:
+        logger.warning(f"Could not write procedure artifact for `{airport}`: {e}")
+    else:
+      self.airports[airport].runways = list(procs.runways)
+      self.runway_waypoints[airport].update(procs.runway_waypoints)
+      self.runway_indices[airport] = procs.runway_index
     
-    with open(path) as f:
-      data = f.read().split(";\n")
+    return (procs.sids, procs.stars, procs.appches)
+  
+  # parses navdata/CIFP/<airport>.dat
+  # with `intern`, identical fixes, courses and restrictions are shared between legs
+  def parse_airport(self, airport: str, intern: bool = True) -> AirportProcedures:
+    path = self.cifp_path(airport)
+    errors: list[str] = []
     
-    # scan runway waypoints
-    for ln in data:
-      ln = ln.strip()
-      if not ln: continue
-      kind, ln = ln.split(":")
-      if kind != "RWY":
-        continue
-      
-      spl = ln.split(";")
-      parts = spl[0]
-      parts = parts.split(",")
-      
-      rwy = parts[0].strip()
-      
-      self.airports[airport].runways.append(rwy)
-      
-      if len(spl) == 1: # missing lat lon
+    records = cifp.tokenize_file(path)
+    
+    # the file may be parsed again after being evicted from the cache
+    runways = self.airports[airport].runways + [x.ident for x in records.runways]
+    self.airports[airport].runways = list(dict.fromkeys(runways))
+    
+    # runway waypoints
+    for rwy in records.runways:
+      if rwy.lat is None: # missing lat lon
         # try to recover by finding the associated ils waypoint
-        ils_ident = parts[5].strip()
-        if ils_ident in self.runway_waypoints[airport]:
-          self.runway_waypoints[airport][rwy] = self.runway_waypoints[airport][ils_ident]
+        if rwy.ils_ident in self.runway_waypoints[airport]:
+          self.runway_waypoints[airport][rwy.ident] = self.runway_waypoints[airport][rwy.ils_ident]
         continue
       
-      opt = spl[1]
-      opt = opt.split(",")
-      
-      lat = opt[0]
-      lon = opt[1]
-      
-      lats = 1 if lat[0] == "N" else -1
-      lons = 1 if lon[0] == "E" else -1
-      
-      lat = lats * (int(lat[1:3]) + int(lat[3:5]) / 60 + int(lat[5:]) / 360000)
-      lon = lons * (int(lon[1:4]) + int(lon[4:6]) / 60 + int(lon[6:]) / 360000)
-      
       region = self.airports[airport].region if airport in self.airports else ""
-      self.runway_waypoints[airport][rwy] = Waypoint(rwy, lat, lon, region, airport)
+      self.runway_waypoints[airport][rwy.ident] = Waypoint(rwy.ident, rwy.lat, rwy.lon, region, airport)
+    
+    index = RunwayIndex.build(self.airports[airport].runways, self.runway_waypoints[airport])
+    self.runway_indices[airport] = index
   
     # type, qual, proc ident, trans ident
     procedures: dict[tuple[ProcKind, str, str, str], list[Leg]] = defaultdict(lambda: [])
     
+    tables = {} if intern else None
     try:
-      for ln in data:
-        ln = ln.strip()
-        if not ln: continue
-        kind, ln = ln.split(":")
-        if kind == "RWY":
-          continue
-        elif kind == "PRDAT":
-          continue
-        else:
-          ln = ln.split(",")
-          kind_enum: ProcKind
-          if kind == "SID": kind_enum = ProcKind.SID
-          elif kind == "STAR": kind_enum = ProcKind.STAR
-          else: kind_enum = ProcKind.APPCH
-          
-          leg = self.process_line(kind_enum, ln, airport)
-          procedures[(leg.info.kind, leg.info.qual, leg.info.proc, leg.info.trans)].append(leg)
+      for kind, fields in records.legs:
+        leg = self.process_line(kind, fields, airport, tables)
+        procedures[(leg.info.kind, leg.info.qual, leg.info.proc, leg.info.trans)].append(leg)
           
     except KeyError as e:
       print(f"Error loading data for airport `{airport}`:")
       print(e.args[0])
-    
-    return self.sort_data(procedures, airport)
+      errors.append(e.args[0])
+    
+    sids, stars, appches = self.sort_data(procedures, airport)
+    return AirportProcedures(
+      list(self.airports[airport].runways),
+      dict(self.runway_waypoints[airport]),
+      dict(sids), dict(stars), dict(appches),
+      errors,
+      index)
   
   def parse_rwy(self, rwy: str, airport: str) -> list[str]:
-    if rwy == "ALL": return [x[2:] for x in self.airports[airport].runways]
-    if rwy[0:2] != "RW": return []
-    rwy = rwy[2:]
-    if rwy[-1] == "B":
-      return [x[2:] for x in list(filter(lambda x: x.startswith("RW" + rwy[:-1]), self.airports[airport].runways))]
-    return [rwy]
+    return self.runway_indices[airport].parse_rwy(rwy)
   
   def extract_rwy(self, proc: str) -> str | None:
     if not proc[1:3].isnumeric(): return None
@@ -498,23 +599,23 @@ class NavDatabase:
             
       if kind == ProcKind.SID:
         proc = sids[proc_id]
-        if qual in ["0", "1", "2", "4", "5", "F", "M", "T", "V"]:
+        if qual in SID_RWY_QUALS:
           if trans_id:
             rwys = self.parse_rwy(trans_id, airport)
             for r in rwys:
               proc.rwys[r] = legs
             proc.is_all_rwys = trans_id == "ALL"
-        elif qual in ["3", "6", "S", "V"]:
+        elif qual in SID_TRANS_QUALS:
           proc.transitions[trans_id] = legs
       elif kind == ProcKind.STAR:
         proc = stars[proc_id]
-        if qual in ["2", "5", "3", "6", "8", "9", "M", "S"]:
+        if qual in STAR_RWY_QUALS:
           if trans_id:
             rwys = self.parse_rwy(trans_id, airport)
             for r in rwys:
               proc.rwys[r] = legs
             proc.is_all_rwys = trans_id == "ALL"
-        elif qual in ["1", "4", "7", "F"]:
+        elif qual in STAR_TRANS_QUALS:
           proc.transitions[trans_id] = legs
       else: # kind = approach
         proc = appches[proc_id]
@@ -1,17 +1,32 @@
 from server.navdata.defns import *
+import os
+import pygeomag
 from pygeomag import GeoMag
+from server.navdata.declination import DeclinationGrid
 import datetime
 from math import cos, sin, asin, acos, atan2, sqrt, pi, ceil
-from typing import Self
+from typing import Self, Callable
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+import numpy as np
+import server.navdata.vecmath as vecmath
 
 NM_TO_FT = 6076.12
 
 # For calculating magnetic declination
-geo_mag = GeoMag(coefficients_file="wmm/WMMHR.COF", high_resolution=True)
+# pygeomag looks up the coefficients file relative to its package
+COEFFICIENTS_FILE = "wmm/WMMHR.COF"
+geo_mag = GeoMag(coefficients_file=COEFFICIENTS_FILE, high_resolution=True)
 year = datetime.date.today().year
+decl_grid = DeclinationGrid(geo_mag, year, model_file=os.path.join(os.path.dirname(pygeomag.__file__), COEFFICIENTS_FILE))
 def to_mag(latlon: tuple[float, float], course: Course, alt: float = 0):
   if course.truenorth: return course.as_rad()
   
+  # the grid is at sea level
+  if alt == 0:
+    return course.as_rad() + decl_grid.get(latlon[0] * 180 / pi, latlon[1] * 180 / pi) * pi / 180
+  
   decl = geo_mag.calculate(
     glat = latlon[0] * 180 / pi,
     glon = latlon[1] * 180 / pi,
@@ -190,7 +205,7 @@ def get_arc_between_points(
     end: tuple[float, float],
     points_density: int,
     turn_right: bool = False,
-    turning_circle: tuple[Vec3, Vec3, Vec3, Vec3] | None = None) -> list[PathPoint]:
+    turning_circle: tuple[Vec3, Vec3, Vec3, Vec3] | None = None) -> PathArray:
   center_ = to_xyz(*center)
   s = to_xyz(*start.latlon())
   e = to_xyz(*end)
@@ -255,7 +270,7 @@ def get_arc_points_angle(
     angle: float,
     points_density: int, # points per revolution per radius
     turn_right: bool = False,
-    turning_circle: tuple[Vec3, Vec3, Vec3, Vec3] | None = None) -> list[PathPoint]:
+    turning_circle: tuple[Vec3, Vec3, Vec3, Vec3] | None = None) -> PathArray:
   s = to_xyz(*start.latlon())
   
   if turning_circle is None:
@@ -269,61 +284,108 @@ def get_arc_points_angle(
 
   e_ang = angle
 
-  v2d = v2 * dist
-  v3d = v3 * dist
-  
   # now generate the points
-  points_xyz: list[PathPoint] = []
-  
   num_points = ceil(points_density * (e_ang / (2 * pi)) * radius * EARTH_RAD)
-  if num_points == 0: return []
+  if num_points == 0: return PathArray()
   
   step = e_ang / num_points
   
-  for i in range(num_points):
-    ang = step * (i + 1)
-    lat, lon = to_latlon(v2d * cos(ang) + v3d * sin(ang) + l)
-    tangent = -v2 * sin(ang) + v3 * cos(ang)
-    point = PathPoint(lat, lon, get_course((lat, lon), tangent)) # altitude populated later
-    points_xyz.append(point)
-  
-  return points_xyz
+  # all points of the arc are computed at once
+  lats, lons, courses = vecmath.arc_points(l, v2, v3, dist, step * np.arange(1, num_points + 1))
+  return PathArray.from_buffers(*map(np.ascontiguousarray, (lats, lons, courses))) # altitude populated later
 
-# note: this returns a fairly crude approximation
-def turn_towards(
-    start: PathPoint,
-    inbd_crs: float,
-    dest: tuple[float, float],
-    turn_radius: float,
-    points_density: int,
-    turn_right: bool) -> list[PathPoint]:
-  
-  if (to_xyz(*start.latlon()) - to_xyz(*dest)).mag2() < TOLERANCE * TOLERANCE: return [] 
+@dataclass
+class SolverStats:
+  calls: int = 0
+  iterations: int = 0
+  seconds: float = 0
+  
+  # counts a call and the time taken by it, including calls that raise
+  @contextmanager
+  def timed(self):
+    self.calls += 1
+    start = perf_counter()
+    try:
+      yield
+    finally:
+      self.seconds += perf_counter() - start
+
+# solver work done by each turn primitive, for profiling
+turn_stats: dict[str, SolverStats] = defaultdict(SolverStats)
+
+def reset_turn_stats():
+  turn_stats.clear()
+
+# Finds x in [low, high] where f(x) = 0, for an increasing f with f(low) <= 0 <= f(high).
+# Starting from `guess`, takes Newton steps using `slope` as the derivative, which is then
+# re-estimated from the last two iterates. Steps that would leave the bracket are replaced by
+# bisection steps, so this never does worse than bisecting.
+# returns (x, f(x))
+def solve_increasing(
+    f: Callable[[float], float],
+    low: float,
+    high: float,
+    guess: float,
+    slope: float,
+    tol: float,
+    max_iterations: int,
+    stats: SolverStats) -> tuple[float, float]:
+  x = min(max(guess, low), high)
+  fx = f(x)
+  for _ in range(max_iterations):
+    stats.iterations += 1
+    if abs(fx) < tol: break
+    if fx < 0: low = x
+    else: high = x
+    # the root is at the end of the bracket
+    if low >= high: break
+    
+    nx = x - fx / slope
+    if not low < nx < high: nx = (low + high) / 2
+    nfx = f(nx)
+    if nx != x:
+      secant = (nfx - fx) / (nx - x)
+      if secant > 0: slope = secant
+    x, fx = nx, nfx
+  return (x, fx)
+
+# true course after turning `turn_ang` radians on the circle (l, v2, v3) of radius `dist`
+def course_on_circle(l: Vec3, v2: Vec3, v3: Vec3, dist: float, turn_ang: float) -> float:
+  e = v2 * cos(turn_ang) * dist + v3 * sin(turn_ang) * dist + l
+  # the tangent line at the point is v2 * -sin(e_ang) + v3 * cos(e_ang)
+  tangent = -v2 * sin(turn_ang) + v3 * cos(turn_ang)
+  return get_course(to_latlon(e), tangent)
+
+# turn angle on the circle (l, v2, v3) of radius `dist` after which the aircraft faces `dest`
+# the point after turning t radians is p(t) = l + dist * (v2 cos(t) + v3 sin(t)), with tangent
+# T(t) = -v2 sin(t) + v3 cos(t). The great circle leaving p(t) along T(t) goes through `dest` iff
+# dest . (p(t) x T(t)) = 0, and expanding the cross product gives
+#   dest . (l x v3) cos(t) - dest . (l x v2) sin(t) + dist * dest . (v2 x v3) = 0
+# which is solved like k cos(t - c) = rhs. Of the two solutions, the one where dest is ahead of
+# the aircraft (dest . T(t) > 0) is the one we want.
+# returns None if `dest` is inside the circle
+def turn_towards_angle(l: Vec3, v2: Vec3, v3: Vec3, dist: float, dest: Vec3) -> float | None:
+  a = dest.dot(l.cross(v3))
+  b = -dest.dot(l.cross(v2))
+  rhs = -dist * dest.dot(v2.cross(v3))
+  
+  k = sqrt(a * a + b * b)
+  if k == 0 or abs(rhs) > k * (1 + 1e-9): return None
+  c = atan2(b, a)
+  d = acos(min(1, max(-1, rhs / k)))
+  
+  best = None
+  for t in ((c + d) % (2 * pi), (c - d) % (2 * pi)):
+    # a turn of (almost) a whole circle means we are already facing dest
+    if t > 2 * pi - 2 * pi / 360: t = 0
+    
+    tangent = -v2 * sin(t) + v3 * cos(t)
+    if dest.dot(tangent) <= 0: continue
+    if best is None or t < best: best = t
+  return best
 
-  # just make sure the two things are not too close to each other
-  circ_dist = circle_distance(start.latlon(), dest)
-  if circ_dist < 2 * turn_radius / EARTH_RAD:
-    turn_radius = circ_dist / 2 * EARTH_RAD
-  
-  to_point = to_xyz(*start.latlon())
-  tangent = get_sphere_tangent(start.latlon(), inbd_crs)
-  v3 = to_point.cross(tangent)
-  if turn_right: v3 = -v3
-  
-  # the turning circle's center can be found by moving (turn_radius / EARTH_RAD) radians
-  # on the circle defined by (to_point, v3)
-  angle = turn_radius / EARTH_RAD
-  center = to_latlon(to_point * cos(angle) + v3 * sin(angle))
-  
-  l, v1, v2, v3 = get_turning_cirle(center, start.latlon(), turn_right)
-  
-  # calculate how much we need to turn to directly face the destination
-  # done using bisection
-  s = to_xyz(*start.latlon())
-  dist = sqrt((s - l).mag2())
-  
-  # assert(abs(inbd_crs - get_course(start.latlon(), v3)) < TOLERANCE)
-  
+# reference implementation for turn_towards_angle, which tries every half degree
+def turn_towards_sweep(l: Vec3, v2: Vec3, v3: Vec3, dist: float, dest: tuple[float, float]) -> float | None:
   # cur course = a
   # target course = b
   def angle_between(a: float, b: float):
@@ -366,61 +428,108 @@ def turn_towards(
 
   # one degree of tolerance
   if best > 2 * pi / 360 or best_ang == -1:
-    return [] # just give up and fly directly to the dest
-  
-  return get_arc_points_angle(to_latlon(l), start, best_ang, points_density, turn_right, (l, v1, v2, v3))
+    return None
+  return best_ang
 
-def turn_to_course_towards(
+# with `sweep`, the turn is found by trying every half degree instead of solving for it
+def turn_towards(
     start: PathPoint,
     inbd_crs: float,
     dest: tuple[float, float],
-    course: float,
-    min_radius: float,
+    turn_radius: float,
     points_density: int,
-    turn_right: bool
-) -> list[PathPoint]:
-  # The turning circle intersects the radial if and only if
-  # min_dist(circle center, radial) <= radius
-  # Furthermore, radius - min_dist(circle center, radial) is increasing
-  # So we can bisect
+    turn_right: bool,
+    sweep: bool = False) -> PathArray:
+  
+  if (to_xyz(*start.latlon()) - to_xyz(*dest)).mag2() < TOLERANCE * TOLERANCE: return PathArray()
+
+  # just make sure the two things are not too close to each other
+  circ_dist = circle_distance(start.latlon(), dest)
+  if circ_dist < 2 * turn_radius / EARTH_RAD:
+    turn_radius = circ_dist / 2 * EARTH_RAD
   
   to_point = to_xyz(*start.latlon())
   tangent = get_sphere_tangent(start.latlon(), inbd_crs)
   v3 = to_point.cross(tangent)
   if turn_right: v3 = -v3
   
-  # Bisect the smallest radius required
-  low = min(4, min_radius) / EARTH_RAD
-  high = -1
-  ITERATIONS = 60
-  step = 1 / EARTH_RAD
-  for i in range(10): # 1024 nautical miles should be more than enough
-    radius = low + step * (2**i)
-    center = to_latlon(to_point * cos(radius) + v3 * sin(radius))
-    dist = point_dist_to_line(center, dest, course)
-    diff = radius - dist
-    if diff >= 0:
-      high = radius
-      low = radius / 2
-      break
-  if high == -1: raise Exception("Could not find a large enough circle")
+  # the turning circle's center can be found by moving (turn_radius / EARTH_RAD) radians
+  # on the circle defined by (to_point, v3)
+  angle = turn_radius / EARTH_RAD
+  center = to_latlon(to_point * cos(angle) + v3 * sin(angle))
   
-  TOL = 0.0000000000001
-  ans = -1
-  diff = -1
-  for i in range(ITERATIONS):
-    radius = (low + high) / 2
-    center = to_latlon(to_point * cos(radius) + v3 * sin(radius))
-    dist = point_dist_to_line(center, dest, course)
-    diff = radius - dist
-    if abs(diff) < TOL:
-      ans = radius
-      break
-    if diff < 0: # no intersection, need to increase radius
-      low = radius
+  l, v1, v2, v3 = get_turning_cirle(center, start.latlon(), turn_right)
+  
+  # calculate how much we need to turn to directly face the destination
+  s = to_xyz(*start.latlon())
+  dist = sqrt((s - l).mag2())
+  
+  # assert(abs(inbd_crs - get_course(start.latlon(), v3)) < TOLERANCE)
+  
+  if sweep:
+    turn = turn_towards_sweep(l, v2, v3, dist, dest)
+  else:
+    turn = turn_towards_angle(l, v2, v3, dist, to_xyz(*dest))
+  
+  if turn is None:
+    return PathArray() # just give up and fly directly to the dest
+  
+  return get_arc_points_angle(to_latlon(l), start, turn, points_density, turn_right, (l, v1, v2, v3))
+
+# in nm, the largest turning circle that turn_to_course_towards tries
+MAX_TURN_RADIUS = 512
+
+def turn_to_course_towards(
+    start: PathPoint,
+    inbd_crs: float,
+    dest: tuple[float, float],
+    course: float,
+    min_radius: float,
+    points_density: int,
+    turn_right: bool
+) -> PathArray:
+  stats = turn_stats["turn_to_course_towards"]
+  with stats.timed():
+    # The turning circle intersects the radial if and only if
+    # min_dist(circle center, radial) <= radius
+    # Furthermore, radius - min_dist(circle center, radial) is increasing
+    
+    to_point = to_xyz(*start.latlon())
+    tangent = get_sphere_tangent(start.latlon(), inbd_crs)
+    v3 = to_point.cross(tangent)
+    if turn_right: v3 = -v3
+    
+    # normal of the radial's great circle
+    dest_xyz = to_xyz(*dest)
+    norm = dest_xyz.cross(get_sphere_tangent(dest, course))
+    
+    # the center of a circle of radius r is to_point * cos(r) + v3 * sin(r),
+    # which is asin(center . norm) away from the radial
+    def calc_diff(radius: float):
+      center = to_point * cos(radius) + v3 * sin(radius)
+      return radius - abs(asin(center.dot(norm)))
+    
+    # The circle touches the radial when sin(r) = |a cos(r) + b sin(r)|,
+    # i.e. when tan(r) = a / (1 - b) or tan(r) = -a / (1 + b)
+    a = to_point.dot(norm)
+    b = v3.dot(norm)
+    touching = min(atan2(a, 1 - b) % pi, atan2(-a, 1 + b) % pi)
+    
+    # the smallest circle that is flown, and the largest that is tried
+    smallest = min(4, min_radius) / EARTH_RAD
+    largest = MAX_TURN_RADIUS / EARTH_RAD
+    if touching > largest: raise ValueError("Could not find a large enough circle")
+    
+    TOL = 0.0000000000001
+    ITERATIONS = 60
+    if touching < smallest:
+      # even the smallest circle reaches past the radial, so it is flown until it crosses it
+      ans, diff = smallest, calc_diff(smallest)
     else:
-      high = radius
-  ans = (low + high) / 2
+      # touching is the root up to rounding, which the solver only refines
+      low = max(smallest, touching / 2)
+      high = min(largest, touching * 2)
+      ans, diff = solve_increasing(calc_diff, low, high, touching, 1, TOL, ITERATIONS, stats)
 
   center = to_point * cos(ans) + v3 * sin(ans)
   center_l = to_latlon(center)
@@ -446,10 +555,6 @@ def turn_to_course_towards(
     # ksin(a + c) for some k, c, which gives
     # sin(a + c) = (-l dot norm) / k
     
-    dest_xyz = to_xyz(*dest)
-    dest_tan = get_sphere_tangent(dest, course)
-    norm = dest_xyz.cross(dest_tan)
-    
     v2n = v2d.dot(norm)
     v3n = v3d.dot(norm)
 
@@ -467,7 +572,7 @@ def turn_to_course_towards(
     return get_arc_points_angle(center_l, start, ans, points_density, turn_right, (l, v1, v2, v3))
   else:
     # just fly direct
-    return []
+    return PathArray()
 
 def go_dist_from(start: tuple[float, float], course: float, dist: float):
   dist /= EARTH_RAD
@@ -517,75 +622,57 @@ def turn_from(
     turn_radius: float,
     points_density: int,
     turn_right: bool):
-  # observation: when turning at a constant rate from a point, the center of the turning circle
-  # will always be at a right angle to the current course, so we can find this center easily
-  # by walking perpencidular to the current course, at a distance of the turning radius
-  to_point = to_xyz(*start.latlon())
-  tangent = get_sphere_tangent(start.latlon(), inbd_crs)
-  v3 = to_point.cross(tangent)
-  if turn_right: v3 = -v3
-  
-  # the center of the turning circle lies in v3's direction
-  
-  # the turning circle's center can be found by moving (turn_radius / EARTH_RAD) radians
-  # on the circle defined by (to_point, v3)
-  angle = turn_radius / EARTH_RAD
-  center = to_latlon(to_point * cos(angle) + v3 * sin(angle))
-  
-  # calculate how much we need to turn
-  turn_amount = inbd_crs - outbd_crs
-  if turn_right: turn_amount *= -1
-  if turn_amount < 0: turn_amount += 2 * pi
-  
-  # sems we have no choice but to try and bisect how much we have to turn;
-  # it seems it's not possible to find an inverse formula for the course
-  # after turning some amount on a circle
-  
-  # note that v3 is exactly the inbound tangent vector
-  l, v1, v2, v3 = get_turning_cirle(center, start.latlon(), turn_right)
-  
-  s = to_xyz(*start.latlon())
-  dist = sqrt((s - l).mag2())
-  
-  assert(abs(inbd_crs - get_course(start.latlon(), v3)) < TOLERANCE)
-  
-  def shift_angle(angle: float):
-    if turn_right and 0 <= angle < inbd_crs: angle += 2 * pi
-    if not turn_right and inbd_crs < angle <= 2 * pi: angle -= 2 * pi
-    if not turn_right: angle *= -1
-    return angle
-  
-  def calc_angle(turn_ang: float):
-    e = v2 * cos(turn_ang) * dist + v3 * sin(turn_ang) * dist + l
-    end = to_latlon(e)
-    # calculate the outbound tangent line (after flying the arc)
-    # tangent line at the point is v2 * -sin(e_ang) + v3 * cos(e_ang) 
-    tangent = -v2 * sin(turn_ang) + v3 * cos(turn_ang)
+  stats = turn_stats["turn_from"]
+  with stats.timed():
+    # observation: when turning at a constant rate from a point, the center of the turning circle
+    # will always be at a right angle to the current course, so we can find this center easily
+    # by walking perpencidular to the current course, at a distance of the turning radius
+    to_point = to_xyz(*start.latlon())
+    tangent = get_sphere_tangent(start.latlon(), inbd_crs)
+    v3 = to_point.cross(tangent)
+    if turn_right: v3 = -v3
+    
+    # the center of the turning circle lies in v3's direction
+    
+    # the turning circle's center can be found by moving (turn_radius / EARTH_RAD) radians
+    # on the circle defined by (to_point, v3)
+    angle = turn_radius / EARTH_RAD
+    center = to_latlon(to_point * cos(angle) + v3 * sin(angle))
+    
+    # calculate how much we need to turn
+    turn_amount = inbd_crs - outbd_crs
+    if turn_right: turn_amount *= -1
+    if turn_amount < 0: turn_amount += 2 * pi
+    
+    # there is no inverse formula for the course after turning some amount on a circle,
+    # so we solve for the amount to turn
+    
+    # note that v3 is exactly the inbound tangent vector
+    l, v1, v2, v3 = get_turning_cirle(center, start.latlon(), turn_right)
+    
+    s = to_xyz(*start.latlon())
+    dist = sqrt((s - l).mag2())
+    
+    assert(abs(inbd_crs - get_course(start.latlon(), v3)) < TOLERANCE)
+    
+    def shift_angle(angle: float):
+      if turn_right and 0 <= angle < inbd_crs: angle += 2 * pi
+      if not turn_right and inbd_crs < angle <= 2 * pi: angle -= 2 * pi
+      if not turn_right: angle *= -1
+      return angle
     
     # we want this function to be monotone increasing and continuous in turn_ang
     # if we are turning left and the course is between inbd and 2pi, we subtract 2pi
     # otherwise, if it is between 0 and inbd, we add 2pi
     # if we are turning left, also multiply by -1 to make it increasing
-    return shift_angle(get_course(end, tangent))
-  
-  # set up binary search
-  # bisect how much to turn
-  ITERATIONS = 50
-  TOL = 0.0000000000001
-  target = shift_angle(outbd_crs)
-  low = 0
-  high = 2 * pi
-  ans = -1
-  for _ in range(ITERATIONS):
-    mid = (low + high) / 2
-    crs = calc_angle(mid)
-    if abs(crs - target) < TOL:
-      ans = mid
-      break
-    if target < crs: high = mid
-    else: low = mid
-  if ans == -1:
-    ans = (low + high) / 2
+    target = shift_angle(outbd_crs)
+    def calc_diff(turn_ang: float):
+      return shift_angle(course_on_circle(l, v2, v3, dist, turn_ang)) - target
+    
+    # on a flat earth, the course changes by exactly as much as we turn
+    ITERATIONS = 50
+    TOL = 0.0000000000001
+    ans, _ = solve_increasing(calc_diff, 0, 2 * pi, turn_amount, 1, TOL, ITERATIONS, stats)
 
   return get_arc_points_angle(center, start, ans, points_density, turn_right, (l, v1, v2, v3))
 
@@ -0,0 +1,66 @@
+import struct
+import numpy as np
+
+# Binary path meshes: the meshes of every leg of a built procedure in one file, laid out so
+# that the viewer can use the buffers directly as the attributes of a BufferGeometry.
+#
+# <header><leg table><float32 vertices, xyz><uint32 triangle indices>
+# Each leg's indices start at 0 at its first vertex. Everything is little endian and
+# every section is 4-byte aligned, so it can be viewed with typed arrays without copying.
+
+MESH_MAGIC = b"PMSH"
+MESH_VERSION = 1
+
+# magic, version, number of legs, number of vertices, number of indices
+MESH_HEADER = struct.Struct("<4sIIII")
+# leg id, first vertex, number of vertices, first index, number of indices
+MESH_LEG = struct.Struct("<8sIIII")
+MESH_LEG_ID_BYTES = 8
+
+# polygons are OBJ faces: 1-based and wound counter-clockwise, all with the same number of sides
+# they are split into triangles the same way the OBJ loader does
+def triangulate(polygons: np.ndarray) -> np.ndarray:
+  sides = polygons.shape[1]
+  fan = [(0, i, i + 1) for i in range(1, sides - 1)]
+  return (polygons[:, np.ravel(fan)].reshape(-1) - 1).astype("<u4")
+
+# legs are (leg id, (n, 3) vertices, polygons)
+def encode_mesh(legs: list[tuple[str, np.ndarray, np.ndarray]]) -> bytes:
+  table = []
+  vertex_bufs = []
+  index_bufs = []
+  vertex_count = 0
+  index_count = 0
+  for leg_id, vertices, polygons in legs:
+    # struct would cut a longer id short without an error
+    id_bytes = leg_id.encode()
+    if len(id_bytes) > MESH_LEG_ID_BYTES:
+      raise ValueError(f"Leg id {leg_id} does not fit in {MESH_LEG_ID_BYTES} bytes.")
+    xyz = vertices.astype("<f4")
+    indices = triangulate(polygons)
+    table.append(MESH_LEG.pack(id_bytes, vertex_count, len(xyz), index_count, len(indices)))
+    vertex_bufs.append(xyz.tobytes())
+    index_bufs.append(indices.tobytes())
+    vertex_count += len(xyz)
+    index_count += len(indices)
+
+  header = MESH_HEADER.pack(MESH_MAGIC, MESH_VERSION, len(legs), vertex_count, index_count)
+  return b"".join([header] + table + vertex_bufs + index_bufs)
+
+# {leg id: (vertices as an (n, 3) array, triangle indices)}
+def decode_mesh(data: bytes) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+  magic, version, leg_count, vertex_count, index_count = MESH_HEADER.unpack_from(data)
+  if magic != MESH_MAGIC or version != MESH_VERSION:
+    raise ValueError(f"Not a version {MESH_VERSION} path mesh.")
+
+  vertex_start = MESH_HEADER.size + leg_count * MESH_LEG.size
+  vertices = np.frombuffer(data, "<f4", vertex_count * 3, vertex_start).reshape(-1, 3)
+  indices = np.frombuffer(data, "<u4", index_count, vertex_start + vertex_count * 12)
+
+  ret = {}
+  for i in range(leg_count):
+    leg_id, first_vertex, n_vertices, first_index, n_indices = MESH_LEG.unpack_from(data, MESH_HEADER.size + i * MESH_LEG.size)
+    ret[leg_id.rstrip(b"\0").decode()] = (
+      vertices[first_vertex:first_vertex + n_vertices],
+      indices[first_index:first_index + n_indices])
+  return ret
@@ -1,62 +1,46 @@
 from server.navdata.defns import *
 from math import pi, tan
+from collections import OrderedDict
+from threading import Lock
+from dataclasses import astuple
 from server.navdata.mathhelpers import *
+import numpy as np
+import server.navdata.vecmath as vecmath
 
+# the lowest and highest altitude that the restriction of a single leg allows,
+# with None for a side that it does not restrict
+def alt_window(restr: AltRestr | None) -> tuple[float | None, float | None]:
+  match restr:
+    case AtAlt(at) | StepDownAt(at):
+      return (at, at)
+    case AltRange(above, below):
+      return (above, below)
+    case GlideslopeAlt(_, alt, _) | GlideslopeIntc(_, alt, _):
+      return (alt, None)
+    case StepDownAboveBelow(alt, _, is_above):
+      return (alt, None) if is_above else (None, alt)
+    case _:
+      return (None, None)
+
+# the last altitude that is not None at or before every index, going backwards if not `forwards`
+def carry_alts(alts: list[float | None], initial: float, forwards: bool) -> list[float]:
+  ret = [initial] * len(alts)
+  cur = initial
+  for i in (range(len(alts)) if forwards else reversed(range(len(alts)))):
+    if not alts[i] is None: cur = alts[i]
+    ret[i] = cur
+  return ret
+
+# the (above, below) window of every leg: the last minimum altitude in the direction
+# that the aircraft climbs, and the last maximum altitude in the direction that it descends
 def build_alt_constr(legs: list[Leg], ascending: bool):
-  aboves: list[float] = [-float('inf')] * len(legs)
-  belows: list[float] = [float('inf')] * len(legs)
-  
-  cur_min: float = -float('inf')
-  
-  above_iter = legs if ascending else reversed(legs)
-  below_iter = reversed(legs) if ascending else legs
+  windows = [alt_window(leg.info.alt) for leg in legs]
+  aboves = carry_alts([a for a, _ in windows], -float('inf'), ascending)
+  belows = carry_alts([b for _, b in windows], float('inf'), not ascending)
   
-  for i, leg in enumerate(above_iter):
-    match leg.info.alt:
-      case None: pass
-      case AtAlt(at) | StepDownAt(at):
-        cur_min = at
-      case AltRange(above, below):
-        if not above is None: cur_min = above
-      case GlideslopeAlt(_, alt, is_above) | GlideslopeIntc(_, alt, is_above):
-        cur_min = alt
-      case StepDownAboveBelow(alt, _, is_above):
-        if is_above:
-          cur_min = alt
-      case AltRestr(): pass
-    
-    if ascending:
-      aboves[i] = cur_min
-    else:
-      aboves[len(legs) - i - 1] = cur_min
-    
-    cur_max: float = float('inf')
-    
-    for i, leg in enumerate(below_iter):
-      match leg.info.alt:
-        case None: pass
-        case AtAlt(at) | StepDownAt(at):
-          cur_max = at
-        case AltRange(above, below):
-          if not below is None: cur_max = below
-        case StepDownAboveBelow(alt, _, is_above):
-          if not is_above:
-            cur_max = alt
-        case AltRestr(): pass
-      
-      if ascending:
-        belows[len(legs) - i - 1] = cur_max
-      else:
-        belows[i] = cur_max
-  
-  cstrs = list(zip(aboves, belows))
-  for i in range(len(cstrs)):
-    a, b = cstrs[i]
-    # some procedures are super weird and have an ascending leg
-    # in this case just give up and let the "above" altitude take over
-    cstrs[i] = (a, max(a, b))
-  
-  return cstrs
+  # some procedures are super weird and have an ascending leg
+  # in this case just give up and let the "above" altitude take over
+  return [(a, max(a, b)) for a, b in zip(aboves, belows)]
 
 # points per revolution per radius
 # i.e. a full revolution with radius 1nm will have POINT_DENSITY points
@@ -68,11 +52,102 @@ MAX_INTC_DISTANCE = 128
 # the radius used when turning due to a CI or VI leg
 CI_RADIUS = 2
 
-def points_dist(points: list[PathPoint]):
-  sm = 0
-  for i in range(len(points) - 1):
-    sm += earth_distance(points[i].latlon(), points[i + 1].latlon())
-  return sm
+# The state of build_points between two legs, after all of the legs before have been added.
+# The points are shared with the build that made the checkpoint, which only appends to them,
+# so only their lengths at the checkpoint are kept.
+@dataclass
+class PointCheckpoint:
+  leg_points: list[tuple[Leg, PathArray]]
+  num_leg_points: int
+  all_points: PathArray
+  num_all_points: int
+  cur_course: float
+  cur_alt: float
+  overfly: bool
+
+# The key of the checkpoint after a prefix of the legs: the key of the prefix one leg shorter
+# (or of the start of the path), and the last leg with its altitude constraints.
+# Legs are compared by value, so the same legs loaded again still find their checkpoints.
+# The hash is computed once, from the parent's, so the keys of every prefix take one hash per leg.
+class PrefixKey:
+  __slots__ = ("parent", "leg", "cstr", "hash")
+
+  def __init__(self, parent: "PrefixKey | tuple", leg: Leg, cstr: tuple[float, float]):
+    self.parent = parent
+    self.leg = leg
+    self.cstr = cstr
+    self.hash = hash((parent, leg, cstr))
+
+  def __hash__(self) -> int:
+    return self.hash
+
+  def __eq__(self, other) -> bool:
+    return isinstance(other, PrefixKey) and self.hash == other.hash and self.cstr == other.cstr \
+      and self.leg == other.leg and self.parent == other.parent
+
+# Checkpoints of build_points, so that combinations that start with the same legs, such as
+# the transitions of a SID, do not all build the shared legs again.
+# The key of a checkpoint is everything the state after a prefix of the legs depends on:
+# the start of the path, the aircraft, the prefix itself and its altitude constraints,
+# which also depend on the legs after it.
+# The least recently used checkpoints are evicted once they hold more than `max_points` points.
+# The points up to a checkpoint count towards each checkpoint of the build that holds them,
+# so this bounds the memory from above.
+class PointCheckpoints:
+  def __init__(self, max_points: int = 1000000):
+    self.max_points = max_points
+    self.lock = Lock()
+    self.entries: OrderedDict[PrefixKey, PointCheckpoint] = OrderedDict()
+    self.points = 0
+
+    self.hits = 0
+    self.misses = 0
+    self.legs_reused = 0
+    self.evictions = 0
+
+  # the checkpoint after the longest prefix of the legs, and its length
+  def lookup(self, keys: list[PrefixKey]) -> tuple[PointCheckpoint | None, int]:
+    with self.lock:
+      for n in range(len(keys), 0, -1):
+        checkpoint = self.entries.get(keys[n - 1])
+        if not checkpoint is None:
+          self.entries.move_to_end(keys[n - 1])
+          self.hits += 1
+          self.legs_reused += n
+          return (checkpoint, n)
+      self.misses += 1
+      return (None, 0)
+
+  def put(self, key: PrefixKey, checkpoint: PointCheckpoint):
+    with self.lock:
+      # another build of the same legs may have put it first
+      replaced = self.entries.pop(key, None)
+      if not replaced is None: self.points -= replaced.num_all_points
+      self.entries[key] = checkpoint
+      self.points += checkpoint.num_all_points
+      while self.points > self.max_points:
+        _, evicted = self.entries.popitem(last=False)
+        self.points -= evicted.num_all_points
+        self.evictions += 1
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.points = 0
+
+  def stats(self) -> dict[str, int]:
+    with self.lock:
+      return {
+        "entries": len(self.entries),
+        "points": self.points,
+        "hits": self.hits,
+        "misses": self.misses,
+        "legs_reused": self.legs_reused,
+        "evictions": self.evictions,
+      }
+
+def points_dist(points: PathArray):
+  return vecmath.path_length(points.lat, points.lon)
 
 def build_points(
     legs: list[Leg],
@@ -82,13 +157,25 @@ def build_points(
     start_course: float | None,
     start_alt: float,
     force_start_alt: bool,
-    ascending: bool):
+    ascending: bool,
+    checkpoints: PointCheckpoints | None = None):
   
-  leg_points: list[tuple[Leg, list[PathPoint]]] = []
-  all_points: list[PathPoint] = []
+  leg_points: list[tuple[Leg, PathArray]] = []
+  all_points = PathArray()
   
   cstrs = build_alt_constr(legs, ascending)
   
+  # key of the checkpoint after each leg
+  if checkpoints:
+    key = (start_point, overfly_start, start_course, start_alt, force_start_alt, ascending, astuple(config))
+    keys: list[PrefixKey] = []
+    for leg, cstr in zip(legs, cstrs):
+      key = PrefixKey(key, leg, cstr)
+      keys.append(key)
+    checkpoint, resume_at = checkpoints.lookup(keys)
+  else:
+    checkpoint, resume_at = None, 0
+  
   if not force_start_alt:
     match legs[0]:
       case CourseToAlt() | HeadingToAlt() | FixToAltitude(): pass
@@ -106,7 +193,7 @@ def build_points(
   
   overfly = overfly_start
   
-  points: list[PathPoint] = []
+  points = PathArray()
   
   def turn_dir(leg: Leg, target_course: float):
     if leg.info.turndir is None:
@@ -144,13 +231,13 @@ def build_points(
   def cur_latlon():
     return last_point().latlon()
   
-  def to_fix_track(leg: Leg, start: Waypoint, crs: float) -> list[PathPoint]:
-    def giveup() -> list[PathPoint]:
-      if not overfly: return []
+  def to_fix_track(leg: Leg, start: Waypoint, crs: float) -> PathArray:
+    def giveup() -> PathArray:
+      if not overfly: return PathArray()
       # give up: just take the shortest route to the radial
       p = point_bisect_line(cur_latlon(), start.to_rad(), crs)
       req_crs = get_course_between(cur_latlon(), p)
-      return [PathPoint(*p, req_crs)]
+      return PathArray([PathPoint(*p, req_crs)])
     
     course_diff = course_between(cur_course, crs)
     if cur_course == -1: return giveup()
@@ -159,7 +246,7 @@ def build_points(
     dist_to = point_dist_to_line(cur_latlon(), start.to_rad(), crs)
     
     # If a turn requires less than 2 degrees, don't bother
-    if dist_to <= TOLERANCE and (not overfly or course_diff <= 2 * pi / 180): return []
+    if dist_to <= TOLERANCE and (not overfly or course_diff <= 2 * pi / 180): return PathArray()
 
     # Try to fly direct to the intersection
     intc = get_intersection(cur_latlon(), cur_course, start.to_rad(), crs)
@@ -170,7 +257,7 @@ def build_points(
     
     if can_intc:
       # we can intersect
-      return [PathPoint(*intc, cur_course)]
+      return PathArray([PathPoint(*intc, cur_course)])
     else:
       # try to turn
       td = turn_dir(leg, crs)
@@ -202,21 +289,21 @@ def build_points(
   def course_between(c1: float, c2: float):
     return min(abs(c1 - c2), abs((c2 - c1)))
     
-  def turn_to_crs(leg: Leg, crs: float) -> list[PathPoint]:
-    if cur_course == -1: return []
+  def turn_to_crs(leg: Leg, crs: float) -> PathArray:
+    if cur_course == -1: return PathArray()
     
     td = turn_dir(leg, crs)
     if course_between(cur_course, crs) >= 2 * pi / 180:
       new_p = turn_from(last_point(), cur_course, crs, CI_RADIUS, POINT_DENSITY, td)
       return new_p
-    return []
+    return PathArray()
   
   def append_leg(idx: int):
     nonlocal leg_points, intercepting, points, all_points, cur_alt
     
     leg = legs[idx]
     
-    if points and points[-1].altitude == float('-inf'):
+    if points and points.altitude[-1] == float('-inf'):
       above, below = cstrs[idx]
       if leg.info.glide_angle is None:
         if ascending: grad = config.climb_grad
@@ -225,16 +312,13 @@ def build_points(
         grad = tan(leg.info.glide_angle * pi / 180)
       
       
-      if all_points and points:
-        try:
-          initial_dist = earth_distance(all_points[-1].latlon(), points[0].latlon())
-        except:
-          initial_dist = 0
+      # the distance flown to every point of the leg, from the end of the legs before it
+      if all_points:
+        dists = vecmath.cumulative_length(all_points.lat[-1:] + points.lat, all_points.lon[-1:] + points.lon)[1:]
       else:
-        initial_dist = 0
+        dists = vecmath.cumulative_length(points.lat, points.lon)
       
-      dist = initial_dist
-      total_dist = points_dist(points) + dist
+      total_dist = float(dists[-1])
       target_alt = min(below, max(above, cur_alt + grad * total_dist * NM_TO_FT))
       
       if total_dist < TOLERANCE: grad = 0
@@ -244,20 +328,16 @@ def build_points(
         else:
           grad = min(grad, (target_alt - cur_alt) / (total_dist * NM_TO_FT))
       
-      for i, p in enumerate(points):
-        if i > 0:
-          dist += earth_distance(points[i - 1].latlon(), points[i].latlon())
-        if ascending:
-          alt = min(below, cur_alt + grad * dist * NM_TO_FT)
-        else:
-          alt = max(above, cur_alt + grad * dist * NM_TO_FT)
-        p.altitude = alt
+      alts = cur_alt + grad * dists * NM_TO_FT
+      if ascending: alts = np.minimum(below, alts)
+      else: alts = np.maximum(above, alts)
+      points.set_altitude(alts)
       
       cur_alt = target_alt
     
     leg_points.append((leg, points))
     all_points += points
-    points = []
+    points = PathArray()
   
   intc_idx = -1
   
@@ -295,7 +375,16 @@ def build_points(
     points.append(pnt)
     all_points.append(pnt)
   
+  if checkpoint:
+    leg_points = checkpoint.leg_points[:checkpoint.num_leg_points]
+    all_points = checkpoint.all_points[:checkpoint.num_all_points]
+    points = PathArray()
+    cur_course = checkpoint.cur_course
+    cur_alt = checkpoint.cur_alt
+    overfly = checkpoint.overfly
+  
   for i, leg in enumerate(legs):
+    if i < resume_at: continue
     match leg:
       case InitialFix(info, fix):
         if not intercepting:
@@ -583,4 +672,7 @@ def build_points(
     
     if not intercepting:
       append_leg(i)
+      if checkpoints:
+        checkpoints.put(keys[i], PointCheckpoint(
+          leg_points, len(leg_points), all_points, len(all_points), cur_course, cur_alt, overfly))
   return (leg_points, all_points)
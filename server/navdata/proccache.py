@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import TypeVar, Callable, Generic, Hashable
+from server.util.singleflight import SingleFlight
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+# Bounded least-recently-used cache for parsed airport procedures.
+# Entries are evicted once there are more than `max_entries` of them, or once their total
+# weight (as given by `weigh`) exceeds `max_weight`. A limit of 0 means no limit.
+# Concurrent misses for the same key only load it once.
+class ProcedureCache(Generic[K, V]):
+  def __init__(
+      self,
+      load: Callable[[K], V],
+      max_entries: int = 0,
+      max_weight: int = 0,
+      weigh: Callable[[K, V], int] = lambda k, v: 1):
+    self.load = load
+    self.max_entries = max_entries
+    self.max_weight = max_weight
+    self.weigh = weigh
+
+    self.lock = Lock()
+    self.entries: OrderedDict[K, tuple[V, int]] = OrderedDict()
+    self.weight = 0
+    self.flight: SingleFlight[V] = SingleFlight()
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, key: K) -> V:
+    with self.lock:
+      entry = self.entries.get(key)
+      if not entry is None:
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+      self.misses += 1
+
+    return self.flight.do(key, lambda: self.load_entry(key))
+
+  def load_entry(self, key: K) -> V:
+    # another thread could have finished loading while we were waiting for the lock
+    with self.lock:
+      entry = self.entries.get(key)
+      if not entry is None: return entry[0]
+
+    value = self.load(key)
+    weight = self.weigh(key, value)
+
+    with self.lock:
+      self.entries[key] = (value, weight)
+      self.weight += weight
+      self.evict()
+    return value
+
+  def evict(self):
+    # always keep the entry that was just added
+    while len(self.entries) > 1 and (
+        (self.max_entries and len(self.entries) > self.max_entries)
+        or (self.max_weight and self.weight > self.max_weight)):
+      _, (_, weight) = self.entries.popitem(last=False)
+      self.weight -= weight
+      self.evictions += 1
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.weight = 0
+
+  def stats(self) -> dict[str, int]:
+    with self.lock:
+      return {
+        "entries": len(self.entries),
+        "weight": self.weight,
+        "hits": self.hits,
+        "misses": self.misses,
+        "evictions": self.evictions,
+        "loading": self.flight.in_flight(),
+      }
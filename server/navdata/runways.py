@@ -0,0 +1,47 @@
+from dataclasses import dataclass, field
+from server.navdata.defns import Waypoint
+
+# "RW01L" -> "RW19R"
+def opposite_runway(rwy: str) -> str:
+  rwy_no = int(rwy[2:4])
+  rwy_des = rwy[4] if len(rwy) == 5 else ""
+  rwy_no = (rwy_no + 18) % 36
+  if rwy_no == 0: rwy_no = 36
+  if rwy_des == "L": rwy_des = "R"
+  elif rwy_des == "R": rwy_des = "L"
+  return "RW" + str(rwy_no).rjust(2, "0") + rwy_des
+
+# Built once per airport when its CIFP file is loaded
+@dataclass
+class RunwayIndex:
+  runways: list[str] = field(default_factory=list) # e.g. RW01L, without duplicates
+  # runway number -> every runway with that number, e.g. RW01 -> [RW01L, RW01R]
+  variants: dict[str, list[str]] = field(default_factory=dict)
+  # RW01L -> RW19R
+  opposite: dict[str, str] = field(default_factory=dict)
+  thresholds: dict[str, Waypoint] = field(default_factory=dict)
+
+  @staticmethod
+  def build(runways: list[str], runway_waypoints: dict[str, Waypoint]) -> "RunwayIndex":
+    index = RunwayIndex()
+    for rwy in dict.fromkeys(runways):
+      index.runways.append(rwy)
+      index.variants.setdefault(rwy[:4], []).append(rwy)
+      try:
+        index.opposite[rwy] = opposite_runway(rwy)
+      except ValueError:
+        pass # not numbered, e.g. a helipad
+      if rwy in runway_waypoints:
+        index.thresholds[rwy] = runway_waypoints[rwy]
+    return index
+
+  # expands the runway transition of a SID or STAR into runway numbers, e.g. RW01B -> [01L, 01R]
+  def parse_rwy(self, rwy: str) -> list[str]:
+    if rwy == "ALL": return [x[2:] for x in self.runways]
+    if rwy[0:2] != "RW": return []
+    if rwy[-1] == "B":
+      prefix = rwy[:-1]
+      if len(prefix) == 4:
+        return [x[2:] for x in self.variants.get(prefix, [])]
+      return [x[2:] for x in self.runways if x.startswith(prefix)]
+    return [rwy[2:]]
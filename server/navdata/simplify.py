@@ -0,0 +1,94 @@
+# Douglas-Peucker simplification of procedure paths on the sphere, for the levels of detail
+# of the path meshes. A point is dropped when the path without it stays within the tolerance,
+# measured across the great circle between the points that are kept and in altitude.
+import numpy as np
+import server.navdata.mathhelpers as mh
+import server.navdata.vecmath as vecmath
+from server.navdata.defns import PathArray, Leg
+
+# distance in nm between unit vectors
+def arc_length(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+  chord = np.sqrt(np.sum((a - b) ** 2, axis=-1))
+  return 2 * np.arcsin(np.minimum(chord / 2, 1)) * mh.EARTH_RAD
+
+# distance in nm of points p from the paths that go straight from a to b,
+# along a great circle while climbing or descending evenly
+def path_errors(p: np.ndarray, alt_p: np.ndarray, a: np.ndarray, alt_a: np.ndarray, b: np.ndarray, alt_b: np.ndarray) -> np.ndarray:
+  normal = np.cross(a, b)
+  length = np.sqrt(np.sum(normal ** 2, axis=-1))
+  # where both ends are at the same place, e.g. around a hold, the distance is to that place
+  same = length < 1e-12
+  normal /= np.where(same, 1, length)[:, None]
+
+  total = np.arctan2(length, np.sum(a * b, axis=-1))
+  along = np.arctan2(np.sum(p * np.cross(normal, a), axis=-1), np.sum(p * a, axis=-1))
+  fraction = np.where(same, 0, along / np.where(same, 1, total))
+  across = np.abs(np.arcsin(np.clip(np.sum(p * normal, axis=-1), -1, 1))) * mh.EARTH_RAD
+  # beyond either end, the distance is to that end
+  horizontal = np.where(same | (fraction < 0), arc_length(p, a), np.where(fraction > 1, arc_length(p, b), across))
+  fraction = np.clip(fraction, 0, 1)
+
+  vertical = (alt_p - (alt_a + fraction * (alt_b - alt_a))) / mh.NM_TO_FT
+  return np.hypot(horizontal, vertical)
+
+# Douglas-Peucker down to a tolerance in nm, where the first and last point of every run in
+# `ends` are always kept. Every level of the recursion is done at once for every segment.
+# Returns the significance of every point: it is kept with any tolerance below its significance.
+# With a larger tolerance the recursion stops earlier but splits the same segments,
+# so one pass with the smallest tolerance gives every level of detail.
+def significance(xyz: np.ndarray, alt: np.ndarray, tolerance: float, ends: np.ndarray) -> np.ndarray:
+  sig = np.zeros(len(xyz))
+  sig[ends] = np.inf
+  done = sig > 0 # kept, or dropped because its segment is within the tolerance
+
+  while True:
+    candidates = np.flatnonzero(~done)
+    if len(candidates) == 0: break
+    kept = np.flatnonzero(sig > 0)
+
+    # the kept points before and after each candidate are the ends of its segment
+    segment = np.searchsorted(kept, candidates)
+    first = kept[segment - 1]
+    last = kept[segment]
+    errors = path_errors(xyz[candidates], alt[candidates], xyz[first], alt[first], xyz[last], alt[last])
+
+    # the point furthest from each segment, the first one if there are several
+    new_group = np.diff(segment, prepend=-1) != 0
+    group = np.cumsum(new_group) - 1
+    worst = np.maximum.reduceat(errors, np.flatnonzero(new_group))
+    is_worst = errors == worst[group]
+    _, first_worst = np.unique(group[is_worst], return_index=True)
+    furthest = np.flatnonzero(is_worst)[first_worst]
+
+    split = worst > tolerance
+    at = furthest[split]
+    # a segment only exists while both of its ends are kept
+    sig[candidates[at]] = np.minimum(worst[split], np.minimum(sig[first[at]], sig[last[at]]))
+    done[candidates[at]] = True
+    # segments within the tolerance lose all of their points
+    done[candidates[~split[group]]] = True
+  return sig
+
+# simplifies the points of every leg on its own with each tolerance in feet,
+# so that every leg keeps its end points
+def simplify_levels(leg_points: list[tuple[Leg, PathArray]], tolerances_ft: list[float]) -> list[list[tuple[Leg, PathArray]]]:
+  all_points = PathArray.concat(points for _, points in leg_points)
+  xyz = vecmath.to_xyz(all_points.lat, all_points.lon).reshape(-1, 3)
+  alt = np.array(all_points.altitude, dtype=np.float64)
+
+  counts = np.array([len(points) for _, points in leg_points], dtype=np.int64)
+  last = np.cumsum(counts) - 1
+  first = last - counts + 1
+  nonempty = counts > 0
+  ends = np.concatenate([first[nonempty], last[nonempty]])
+  sig = significance(xyz, alt, min(tolerances_ft) / mh.NM_TO_FT, ends)
+
+  ret = []
+  for tolerance_ft in tolerances_ft:
+    kept = np.flatnonzero(sig > tolerance_ft / mh.NM_TO_FT)
+    level = []
+    for (leg, points), start, n in zip(leg_points, first.tolist(), counts.tolist()):
+      i, j = np.searchsorted(kept, [start, start + n])
+      level.append((leg, points.take((kept[i:j] - start).tolist())))
+    ret.append(level)
+  return ret
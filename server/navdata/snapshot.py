@@ -0,0 +1,68 @@
+import os
+import re
+import gc
+import pickle
+import logging
+
+logger = logging.getLogger("cifp-viewer")
+
+# bump this whenever the layout of the snapshot changes
+SNAPSHOT_VERSION = 3
+
+SNAPSHOT_DIR = "cache/navdata"
+SNAPSHOT_PATH = SNAPSHOT_DIR + "/snapshot.pkl"
+
+# the files that the snapshot is built from
+SOURCE_FILES = ["earth_fix.dat", "earth_nav.dat", "earth_aptmeta.dat"]
+
+def read_cycle(path: str) -> str:
+  # the second line of each X-Plane .dat file looks like
+  # 1200 Version - data cycle 2406, build 20251002, ...
+  with open(path) as f:
+    f.readline()
+    header = f.readline()
+  match = re.search(r"data cycle (\d+)", header)
+  return match.group(1) if match else ""
+
+def snapshot_key(dir: str) -> tuple:
+  files = []
+  for name in SOURCE_FILES:
+    path = dir + "/" + name
+    st = os.stat(path)
+    files.append((name, read_cycle(path), st.st_mtime_ns, st.st_size))
+  return (SNAPSHOT_VERSION, os.path.abspath(dir), tuple(files))
+
+def load_snapshot(dir: str, path: str = SNAPSHOT_PATH) -> dict | None:
+  if not os.path.exists(path): return None
+
+  try:
+    key = snapshot_key(dir)
+  except OSError:
+    return None
+
+  # the snapshot is hundreds of thousands of small objects, none of which form cycles,
+  # so don't let the garbage collector rescan them while they are being loaded
+  gc.disable()
+  try:
+    with open(path, "rb") as f:
+      snapshot_key_ = pickle.load(f)
+      if snapshot_key_ != key:
+        logger.info("Navdata snapshot is out of date, rebuilding.")
+        return None
+      return pickle.load(f)
+  except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+    logger.warning(f"Could not read navdata snapshot {path}: {e}")
+    return None
+  finally:
+    gc.enable()
+
+def save_snapshot(dir: str, state: dict, path: str = SNAPSHOT_PATH):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+
+  # write to a temporary file first so that a concurrently starting server
+  # never sees a half-written snapshot
+  tmp = f"{path}.{os.getpid()}.tmp"
+  with open(tmp, "wb") as f:
+    pickle.dump(snapshot_key(dir), f, protocol=pickle.HIGHEST_PROTOCOL)
+    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+  os.replace(tmp, path)
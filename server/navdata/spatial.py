@@ -0,0 +1,89 @@
+from array import array
+from math import radians, degrees, sin, cos, asin, sqrt, floor, ceil, pi
+
+from server.navdata.mathhelpers import EARTH_RAD
+
+# the largest possible distance between two points, in nm
+MAX_DIST = pi * EARTH_RAD
+
+# Uniform lat/lon grid over the sphere.
+# Each cell holds the ids of the points inside it, so radius queries only need to
+# look at the cells that overlap the query's bounding box.
+class SpatialIndex:
+  def __init__(self, lats: array, lons: array, cell_size: float = 1.0):
+    self.lats = lats # decimal degrees
+    self.lons = lons # decimal degrees
+    self.cell_size = cell_size
+    self.cols = ceil(360 / cell_size)
+
+    self.cells: dict[tuple[int, int], array] = {}
+    for i in range(len(lats)):
+      key = self.cell_of(lats[i], lons[i])
+      cell = self.cells.get(key)
+      if cell is None:
+        cell = array("I")
+        self.cells[key] = cell
+      cell.append(i)
+
+  def __len__(self):
+    return len(self.lats)
+
+  def cell_of(self, lat: float, lon: float) -> tuple[int, int]:
+    row = floor((lat + 90) / self.cell_size)
+    col = floor(((lon + 180) % 360) / self.cell_size)
+    return (row, col)
+
+  def distance(self, i: int, lat: float, lon: float) -> float:
+    # haversine, in nautical miles
+    lat1 = radians(lat)
+    lat2 = radians(self.lats[i])
+    dlat = lat2 - lat1
+    dlon = radians(self.lons[i] - lon)
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RAD * asin(min(1, sqrt(a)))
+
+  def candidate_cells(self, lat: float, lon: float, nm: float):
+    dlat = degrees(nm / EARTH_RAD)
+    lat_low = max(-90, lat - dlat)
+    lat_high = min(90, lat + dlat)
+
+    row_low = floor((lat_low + 90) / self.cell_size)
+    row_high = floor((lat_high + 90) / self.cell_size)
+
+    # the longitude span grows as we get closer to the poles
+    max_lat = max(abs(lat_low), abs(lat_high))
+    if max_lat >= 90 or cos(radians(max_lat)) * 180 <= dlat:
+      cols = range(self.cols)
+    else:
+      dlon = dlat / cos(radians(max_lat))
+      col_low = floor(((lon - dlon + 180) % 360) / self.cell_size)
+      n = floor(2 * dlon / self.cell_size) + 2
+      cols = [(col_low + j) % self.cols for j in range(min(n, self.cols))]
+
+    for row in range(row_low, row_high + 1):
+      for col in cols:
+        cell = self.cells.get((row, col))
+        if cell: yield cell
+
+  # returns (id, distance in nm) for every point within `nm` of (lat, lon), closest first
+  def within_radius(self, lat: float, lon: float, nm: float) -> list[tuple[int, float]]:
+    ret = []
+    for cell in self.candidate_cells(lat, lon, nm):
+      for i in cell:
+        d = self.distance(i, lat, lon)
+        if d <= nm: ret.append((i, d))
+    ret.sort(key=lambda x: x[1])
+    return ret
+
+  # returns (id, distance in nm) for the `k` closest points to (lat, lon), closest first
+  def nearest(self, lat: float, lon: float, k: int) -> list[tuple[int, float]]:
+    if k <= 0 or len(self) == 0: return []
+
+    # grow the search radius until it contains at least k points;
+    # everything outside the radius is then guaranteed to be further away
+    nm = self.cell_size * 60
+    while True:
+      found = self.within_radius(lat, lon, nm)
+      if len(found) >= k or nm >= MAX_DIST:
+        return found[:k]
+      nm *= 2
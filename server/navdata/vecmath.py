@@ -0,0 +1,91 @@
+# Batched versions of the spherical geometry helpers in mathhelpers.
+# Every function takes numpy arrays (or anything numpy can broadcast) of lat/lon in radians,
+# and xyz coordinates as arrays of shape (n, 3), so that a whole list of points
+# is converted in one call instead of allocating a Vec3 per operation.
+import numpy as np
+import server.navdata.mathhelpers as mh
+
+def as_xyz(v) -> np.ndarray:
+  if isinstance(v, mh.Vec3): return np.array(v.as_arr())
+  return np.asarray(v, dtype=np.float64)
+
+def to_xyz(lat, lon) -> np.ndarray:
+  lat = np.asarray(lat, dtype=np.float64)
+  lon = np.asarray(lon, dtype=np.float64)
+  cos_lat = np.cos(lat)
+  return np.stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)), axis=-1)
+
+def to_xyz_earth(lat, lon, altitude) -> np.ndarray:
+  lat = np.asarray(lat, dtype=np.float64)
+  lon = np.asarray(lon, dtype=np.float64)
+  radius = mh.EARTH_RAD + np.asarray(altitude, dtype=np.float64) / mh.NM_TO_FT
+  # same axes as mathhelpers.to_xyz_earth, for threejs
+  cos_lat = radius * np.cos(lat)
+  return np.stack((cos_lat * np.cos(lon), radius * np.sin(lat), -cos_lat * np.sin(lon)), axis=-1)
+
+def to_latlon(xyz) -> tuple[np.ndarray, np.ndarray]:
+  xyz = as_xyz(xyz)
+  return (np.arcsin(np.clip(xyz[..., 2], -1, 1)), np.arctan2(xyz[..., 1], xyz[..., 0]))
+
+def get_sphere_tangent(lat, lon, course) -> np.ndarray:
+  lat = np.asarray(lat, dtype=np.float64)
+  lon = np.asarray(lon, dtype=np.float64)
+  course = np.asarray(course, dtype=np.float64)
+  outward = to_xyz(lat, lon)
+  sin_lat = np.sin(lat)
+  to_north = np.stack((-sin_lat * np.cos(lon), -sin_lat * np.sin(lon), np.cos(lat)), axis=-1)
+  east = np.cross(to_north, outward)
+  return to_north * np.cos(course)[..., None] + east * np.sin(course)[..., None]
+
+# true course of each unit `tangent` at (lat, lon)
+def get_course(lat, lon, tangent) -> np.ndarray:
+  lat = np.asarray(lat, dtype=np.float64)
+  lon = np.asarray(lon, dtype=np.float64)
+  tangent = as_xyz(tangent)
+  sin_lat = np.sin(lat)
+  north = np.stack((-sin_lat * np.cos(lon), -sin_lat * np.sin(lon), np.cos(lat)), axis=-1)
+
+  crs = np.arccos(np.clip(np.sum(north * tangent, axis=-1), -1, 1))
+  clockwise = np.sum(np.cross(north, tangent) * to_xyz(lat, lon), axis=-1) > 0
+  return np.where(clockwise, 2 * np.pi - crs, crs)
+
+def circle_distance(a_lat, a_lon, b_lat, b_lon) -> np.ndarray:
+  arg = np.sum(to_xyz(a_lat, a_lon) * to_xyz(b_lat, b_lon), axis=-1)
+  return np.abs(np.arccos(np.clip(arg, -1, 1)))
+
+def earth_distance(a_lat, a_lon, b_lat, b_lon) -> np.ndarray:
+  return mh.EARTH_RAD * circle_distance(a_lat, a_lon, b_lat, b_lon)
+
+# total length in nm of the path going through every point in order
+def path_length(lat, lon) -> float:
+  xyz = to_xyz(lat, lon)
+  if len(xyz) < 2: return 0
+  arg = np.sum(xyz[:-1] * xyz[1:], axis=-1)
+  return float(mh.EARTH_RAD * np.sum(np.arccos(np.clip(arg, -1, 1))))
+
+# distance in nm along the path from its first point to every point
+def cumulative_length(lat, lon) -> np.ndarray:
+  xyz = to_xyz(lat, lon)
+  arg = np.sum(xyz[:-1] * xyz[1:], axis=-1)
+  return mh.EARTH_RAD * np.concatenate(([0.0], np.cumsum(np.arccos(np.clip(arg, -1, 1)))))
+
+def go_dist_from(lat, lon, course, dist) -> tuple[np.ndarray, np.ndarray]:
+  dist = np.asarray(dist, dtype=np.float64) / mh.EARTH_RAD
+  start = to_xyz(lat, lon)
+  tangent = get_sphere_tangent(lat, lon, course)
+  return to_latlon(start * np.cos(dist)[..., None] + tangent * np.sin(dist)[..., None])
+
+# points after turning each of `angles` on the turning circle (l, v2, v3) of mathhelpers.get_turning_cirle,
+# where `dist` is the radius of the circle in xyz coordinates
+# returns (lat, lon, course) arrays
+def arc_points(l, v2, v3, dist: float, angles) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+  l = as_xyz(l)
+  v2 = as_xyz(v2)
+  v3 = as_xyz(v3)
+  angles = np.asarray(angles, dtype=np.float64)
+  cos_a = np.cos(angles)[:, None]
+  sin_a = np.sin(angles)[:, None]
+
+  lat, lon = to_latlon(v2 * dist * cos_a + v3 * dist * sin_a + l)
+  tangent = -v2 * sin_a + v3 * cos_a
+  return (lat, lon, get_course(lat, lon, tangent))
@@ -0,0 +1,113 @@
+from array import array
+from bisect import bisect_left
+from server.navdata.defns import Waypoint
+
+# Columnar storage for all fixes and navaids.
+# Instead of keeping one Waypoint object per fix alive, the names and coordinates
+# are kept in flat columns sorted by (region, airport, name), and a Waypoint is only
+# created when one is requested.
+#
+# Waypoints are added with `add`, after which `finalize` must be called before any lookups.
+class WaypointStore:
+  def __init__(self):
+    self.names: list[str] = []
+    self.lats = array("d")
+    self.lons = array("d")
+    # regions and airports repeat a lot, so store them as indices into a table
+    self.region_ids = array("I")
+    self.airport_ids = array("I")
+    self.strings: list[str] = []
+
+    # (region, airport) -> (start, end) range of the columns
+    self.groups: dict[tuple[str, str], tuple[int, int]] = {}
+
+    # only used while loading
+    self.string_ids: dict[str, int] = {}
+    self.name_ids: dict[str, str] = {}
+
+  def __len__(self):
+    return len(self.names)
+
+  def __contains__(self, key: tuple[str, str]):
+    return key in self.groups
+
+  def string_id(self, s: str) -> int:
+    if s in self.string_ids: return self.string_ids[s]
+    id = len(self.strings)
+    self.strings.append(s)
+    self.string_ids[s] = id
+    return id
+
+  def add(self, name: str, lat: float, lon: float, region: str, airport: str):
+    # share identical names between regions
+    name = self.name_ids.setdefault(name, name)
+    self.names.append(name)
+    self.lats.append(lat)
+    self.lons.append(lon)
+    self.region_ids.append(self.string_id(region))
+    self.airport_ids.append(self.string_id(airport))
+
+  def finalize(self):
+    strings = self.strings
+    order = sorted(
+      range(len(self.names)),
+      key=lambda i: (strings[self.region_ids[i]], strings[self.airport_ids[i]], self.names[i]))
+
+    # if a name appears twice in the same group, the one added last wins
+    keep: list[int] = []
+    for i in order:
+      if keep:
+        j = keep[-1]
+        if self.names[i] == self.names[j] \
+            and self.region_ids[i] == self.region_ids[j] \
+            and self.airport_ids[i] == self.airport_ids[j]:
+          keep[-1] = max(i, j)
+          continue
+      keep.append(i)
+
+    self.names = [self.names[i] for i in keep]
+    self.lats = array("d", (self.lats[i] for i in keep))
+    self.lons = array("d", (self.lons[i] for i in keep))
+    self.region_ids = array("I", (self.region_ids[i] for i in keep))
+    self.airport_ids = array("I", (self.airport_ids[i] for i in keep))
+
+    self.string_ids = {}
+    self.name_ids = {}
+    self.build_groups()
+
+  def build_groups(self):
+    self.groups = {}
+    n = len(self.names)
+    start = 0
+    for i in range(1, n + 1):
+      if i == n or self.region_ids[i] != self.region_ids[start] or self.airport_ids[i] != self.airport_ids[start]:
+        key = (self.strings[self.region_ids[start]], self.strings[self.airport_ids[start]])
+        self.groups[key] = (start, i)
+        start = i
+
+  # returns the index of the waypoint, or -1 if it does not exist
+  def find(self, name: str, region: str, airport: str) -> int:
+    rng = self.groups.get((region, airport))
+    if rng is None: return -1
+    start, end = rng
+    idx = bisect_left(self.names, name, start, end)
+    if idx < end and self.names[idx] == name: return idx
+    return -1
+
+  def get(self, idx: int) -> Waypoint:
+    return Waypoint(
+      self.names[idx],
+      self.lats[idx],
+      self.lons[idx],
+      self.strings[self.region_ids[idx]],
+      self.strings[self.airport_ids[idx]])
+
+  def __getstate__(self):
+    # the groups can be rebuilt from the columns
+    state = self.__dict__.copy()
+    del state["groups"]
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.build_groups()
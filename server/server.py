@@ -5,11 +5,14 @@ from threading import Lock
 from server.jobs import *
 from server.navdata.defns import *
 from server.navdata.loader import NavDatabase
+from server.navdata.buildcache import BuildCache, BuildArtifact
+from server.navdata.point_builder import PointCheckpoints
+from server.util.singleflight import SingleFlight
 import server.navdata.builder as builder
+import server.buildpool as buildpool
 import json
-from urllib.parse import urlparse
-
-from server.navdata.mathhelpers import to_xyz_earth
+import time
+from urllib.parse import urlparse, parse_qs
 
 logger = logging.getLogger("cifp-viewer")
 
@@ -21,12 +24,31 @@ def set_navdata(data: NavDatabase):
   global navdata
   navdata = data
 
+build_cache: BuildCache
+
+def set_build_cache(cache: BuildCache):
+  global build_cache
+  build_cache = cache
+
+# builds in worker processes when set, otherwise in the request's thread
+build_pool: "buildpool.BuildPool | None" = None
+
+def set_build_pool(pool: "buildpool.BuildPool | None"):
+  global build_pool
+  build_pool = pool
+
+# shared by the builds of this process, each build worker has its own
+point_checkpoints = PointCheckpoints()
+
 config: dict[str, str]
 def set_config(cfg: dict[str, str]):
   global config
   config = cfg
   
 def get_config(): return config
+
+# how long a batch build waits before trying again when the build pool is full
+BATCH_RETRY_SECONDS = 0.05
   
 def validate_tile(lat: int, lon: int):
   return (-85 <= lat < 85) and (-180 <= lon < 180)
@@ -62,6 +84,11 @@ class CIFPServer(BaseHTTPRequestHandler):
   def send_404(self):
     self.send_response(404)
     self.end_headers()
+  
+  def send_busy(self):
+    self.send_response(503)
+    self.send_header("Retry-After", "1")
+    self.end_headers()
       
   def img_job_done(self, job: Job):
     with self.img_jobs_lock:
@@ -143,27 +170,27 @@ class CIFPServer(BaseHTTPRequestHandler):
     
     # NOTE: we MUST check if the job exists first
     # the file could exist but the job could still be running!
-    
+    # a new job is added under the same lock, so that only one request dispatches it
     path = f"cache/tileimg/Z{zl}-{lat}-{lon}.jpg"
+    job = None
     with self.img_jobs_lock:
-      working = path in self.img_jobs
-      if working: cur_job = self.img_jobs[path]
+      cur_job = self.img_jobs.get(path)
+      if cur_job is None and not os.path.exists(path):
+        KEY = "old_image_processing"
+        use_old = config[KEY] != "0" if KEY in config else False
+        if use_old:
+          job = CreateImageJob(self.img_job_done, tiler.Tile(lat, lon), zl, path)
+        else:
+          job = CreateImageJobNew(self.img_job_done, tiler.Tile(lat, lon), zl, path)
+        self.img_jobs[path] = job
     
-    if working:
+    if not cur_job is None:
       self.send_response(202)
       self.send_header("Content-type", "text/plain")
       self.end_headers()
       self.wfile.write(bytes(cur_job.progress(), "UTF-8"))
-    elif not os.path.exists(path):
+    elif not job is None:
       logger.info(f"Dispatching job to create image {lat}/{lon}/{zl}.jpg.")
-      # create job
-      KEY = "old_image_processing"
-      use_old = config[KEY] != "0" if KEY in config else False
-      if use_old:
-        job = CreateImageJob(self.img_job_done, tiler.Tile(lat, lon), zl, path)
-      else:
-        job = CreateImageJobNew(self.img_job_done, tiler.Tile(lat, lon), zl, path)
-      self.img_jobs[path] = job
       job.perform()
       
       self.send_response(202)
@@ -200,21 +227,21 @@ class CIFPServer(BaseHTTPRequestHandler):
     tile = tiler.Tile(lat, lon)
     filename = tiler.get_vfp_file(tile).split("/")[-1]
     path = f"cache/demzip/{filename}.zip"
+    job = None
     with self.zip_jobs_lock:
-      working = path in self.zip_jobs
-      if working: cur_job = self.zip_jobs[path]
+      cur_job = self.zip_jobs.get(path)
+      if cur_job is None and not os.path.exists(path):
+        job = DownloadDemJob(self.zip_job_done, tiler.Tile(lat, lon), path)
+        self.zip_jobs[path] = job
     
-    if working:
+    if not cur_job is None:
       self.send_response(202)
       self.send_header("Content-type", "text/plain")
       self.end_headers()
       self.wfile.write(bytes(cur_job.progress(), "UTF-8"))
       return
-    elif not os.path.exists(path):
+    elif not job is None:
       logger.info(f"Dispatching job to download {path}.zip")
-      # create job
-      job = DownloadDemJob(self.zip_job_done, tiler.Tile(lat, lon), path)
-      self.zip_jobs[path] = job
       job.perform()
       
       self.send_response(202)
@@ -225,21 +252,21 @@ class CIFPServer(BaseHTTPRequestHandler):
     
     # 2. create mesh
     path = f"cache/tilemesh/DEM_{lat}_{lon}.obj"
+    job = None
     with self.terr_jobs_lock:
-      working = path in self.terr_jobs
-      if working: cur_job = self.terr_jobs[path]
+      cur_job = self.terr_jobs.get(path)
+      if cur_job is None and not os.path.exists(path):
+        job = MakeMeshJob(self.terr_job_done, tiler.Tile(lat, lon), path)
+        self.terr_jobs[path] = job
     
-    if working:
+    if not cur_job is None:
       self.send_response(202)
       self.send_header("Content-type", "text/plain")
       self.end_headers()
       self.wfile.write(bytes(cur_job.progress(), "UTF-8"))
       return
-    elif not os.path.exists(path):
+    elif not job is None:
       logger.info(f"Dispatching job to create {path}")
-      # create job
-      job = MakeMeshJob(self.terr_job_done, tiler.Tile(lat, lon), path)
-      self.terr_jobs[path] = job
       job.perform()
       
       self.send_response(202)
@@ -308,11 +335,110 @@ class CIFPServer(BaseHTTPRequestHandler):
     self.end_headers()
     self.wfile.write(bytes(payload, "UTF-8"))
   
-  # proc sig -> altitude
-  proc_cache_info: dict[str, int] = {}
-  proc_cache_lock = Lock()
+  MAX_NEARBY_RADIUS = 250 # nm
+  MAX_NEARBY_RESULTS = 500
+  
+  def handle_nearby(self, values: list[str]):
+    if len(values) != 3:
+      self.send_malformed("Usage: nearby/lat/lon/radius")
+      return
+    try:
+      lat, lon, radius = [float(x) for x in values]
+    except ValueError:
+      self.send_malformed("Usage: nearby/lat/lon/radius")
+      return
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+      self.send_malformed("Latitude and longitude out of range.")
+      return
+    if not 0 < radius <= self.MAX_NEARBY_RADIUS:
+      self.send_malformed(f"Radius must be between 0 and {self.MAX_NEARBY_RADIUS}nm.")
+      return
+    
+    ret = []
+    for entry, dist in navdata.within_radius(lat, lon, radius)[:self.MAX_NEARBY_RESULTS]:
+      data = {}
+      match entry:
+        case Waypoint(name, wp_lat, wp_lon, region, airport):
+          data["kind"] = "fix"
+          data["name"] = name
+          data["airport"] = airport
+        case AirportInfo(icao, wp_lat, wp_lon, region):
+          data["kind"] = "airport"
+          data["name"] = icao
+      data["region"] = region
+      data["latLon"] = (wp_lat, wp_lon)
+      data["dist"] = dist
+      ret.append(data)
+    
+    payload = json.dumps(ret)
+    self.send_response(200)
+    self.send_header("Content-type", "application/json")
+    self.end_headers()
+    self.wfile.write(bytes(payload, "UTF-8"))
+  
+  # concurrent requests for the same build wait for the first one to finish it
+  proc_builds: SingleFlight[BuildArtifact] = SingleFlight()
+  
+  # the build of a procedure, from the build cache or built and added to it
+  # each level of detail is a build of its own, see builder.LOD_TOLERANCES
+  def get_build(self, proc_type: str, proc: SID | STAR | Approach, runway: str | None, transition: str | None,
+      altitude: int, config: AircraftConfig, lod: int = 0) -> BuildArtifact:
+    digest = builder.build_key(proc, config, runway, transition, altitude, lod)
+    
+    def build() -> BuildArtifact:
+      artifact = build_cache.get(digest)
+      if artifact is None:
+        if build_pool:
+          files = build_pool.build((proc.airport, proc_type, proc.ident, runway, transition, altitude, config, lod))
+        else:
+          files = builder.export_files(builder.build_proc(proc, config, runway, transition, altitude, point_checkpoints, lod))
+        artifact = build_cache.put(digest, files)
+      return artifact
+    
+    return self.proc_builds.do(digest, build)
+  
+  # Builds every procedure of an airport with every runway and transition, and streams one
+  # line of JSON per combination with how long it took, or why it could not be built.
+  # The builds go to the build cache, so their files can then be fetched through /proc/.
+  def handle_procs(self, values: list[str]):
+    if len(values) != 1:
+      self.send_malformed("Usage: procs/ICAO")
+      return
+    data = navdata.get_airport_data(values[0])
+    if data is None:
+      self.send_404()
+      return
+    
+    self.send_response(200)
+    self.send_header("Content-type", "application/x-ndjson")
+    self.end_headers()
+    
+    config = AircraftConfig()
+    # from the build cache, or built in the pool, which sends a procedure's combinations to
+    # the same worker so that they share their legs
+    def build(proc_type: str, proc: SID | STAR | Approach, runway: str | None, transition: str | None) -> BuildArtifact:
+      while True:
+        try:
+          return self.get_build(proc_type, proc, runway, transition, builder.START_ALT, config)
+        except buildpool.BuildPoolFull:
+          # a batch waits for the pool instead of failing
+          time.sleep(BATCH_RETRY_SECONDS)
+    
+    for b in builder.build_airport(values[0], build):
+      ret = {}
+      ret["kind"] = b.kind
+      ret["id"] = b.proc.ident
+      ret["runway"] = b.runway
+      ret["transition"] = b.transition
+      if b.error is None:
+        ret["files"] = {name: length for name, (_, length) in b.built.index.items()}
+      else:
+        ret["error"] = f"{type(b.error).__name__}: {b.error}"
+      ret["ms"] = round(b.seconds * 1000, 3)
+      
+      self.wfile.write(bytes(json.dumps(ret) + "\n", "UTF-8"))
   
-  def handle_proc(self, values: list[str]):
+  def handle_proc(self, values: list[str], query: dict[str, list[str]]):
     if len(values) != 5 and len(values) != 6:
       return self.send_malformed(
         "Usage: proc/ICAO/<sid,star,approach>/ident/<transition,\"none\">/<runway, \"none\"> or proc/ICAO/<sid,star,approach>/ident/<transition,\"none\">/<runway,\"none\">/legId.obj")
@@ -387,83 +513,71 @@ class CIFPServer(BaseHTTPRequestHandler):
       self.wfile.write(bytes(payload, "UTF-8"))
       
     else:
-      with self.proc_cache_lock:
-        # build the data
-        assert runway
-        
-        if runway == "none": runway = None
-        if transition == "none": transition = None
-        
+      # build the data
+      assert runway
+      
+      if runway == "none": runway = None
+      if transition == "none": transition = None
+      
+      if fileName.endswith(".json"):
+        content_type = "application/json"
+      elif fileName.endswith(".obj"):
+        content_type = "model/obj"
+      elif fileName.endswith(".mesh"):
+        content_type = "application/octet-stream"
+      else:
+        self.send_404()
+        return
+      
+      # the paths can be requested at a lower level of detail with ?lod=<level>
+      try:
+        lod = int(query.get("lod", ["0"])[-1])
+      except ValueError:
+        lod = -1
+      if not 0 <= lod < len(builder.LOD_TOLERANCES):
+        self.send_malformed(f"The level of detail must be between 0 and {len(builder.LOD_TOLERANCES) - 1}.")
+        return
+      if lod and fileName != "path.mesh":
+        self.send_malformed("Only path.mesh has levels of detail.")
+        return
+      
+      config = AircraftConfig()
+      
+      try:
+        artifact = self.get_build(proc_type, proc, runway, transition, builder.START_ALT, config, lod)
+      except ValueError as e:
+        self.send_malformed(e.args[0])
+        return
+      except KeyError as e:
+        self.send_404()
+        return
+      except (buildpool.BuildPoolFull, buildpool.BuildPoolBroken):
+        # a broken pool has been replaced, so the build can be tried again
+        self.send_busy()
+        return
+      
+      location = artifact.locate(fileName)
+      if location is None:
         proc_sig = builder.make_proc_sig(airport_nme, ident, runway, transition)
-        
-        altitude = 10000 # todo
-        
-        filepath = f"cache/flightpaths/{proc_sig}_{fileName}"
-        
-        def serve_file():
-          if not os.path.exists(filepath):
-            logger.warn(f"Tried to serve file {filepath} but it does not exist. Sending an empty file.")
-            content = bytes("", encoding="UTF-8")
-          else:
-            content = get_file_bytes(filepath)
-          
-          self.send_response(200)
-          if fileName.endswith(".json"):
-            self.send_header("Content-type", "application/json")
-          elif fileName.endswith(".obj"):
-            self.send_header("Content-type", "model/obj")
-          else:
-            self.send_404()
-            return
-          
-          self.end_headers()
-          self.wfile.write(content)
-          return
-        
-        if proc_sig in self.proc_cache_info \
-            and self.proc_cache_info[proc_sig] == altitude \
-            and os.path.exists(filepath):
-          serve_file()
-          return
-        
-        try:
-          ret = builder.build_proc(proc, AircraftConfig(), runway, transition, altitude)
-          req_tiles, objs, initial = ret.tiles, ret.objects, ret.initial_point
-        except ValueError as e:
-          self.send_malformed(e.args[0])
-          return
-        except KeyError as e:
-          self.send_404()
-          return
-        
-        if not os.path.exists("cache"):
-          os.mkdir("cache")
-        if not os.path.exists("cache/flightpaths"):
-          os.mkdir("cache/flightpaths")
-        for l, obj, _ in objs:
-          filename = f"cache/flightpaths/{proc_sig}_{l.info.qual}{l.info.seq}.obj"
-          obj.export_obj(filename, "Path")
-        with open(f"cache/flightpaths/{proc_sig}_tiles.json", "w") as f:
-          f.write(json.dumps(req_tiles))
-        points = {}
-        points["initialLatLon"] = (initial.lat * 180 / pi, initial.lon * 180 / pi)
-        points["initialAlt"] = initial.altitude
-        legPointsList = []
-        points["legPoints"] = legPointsList
-        for l, _, point in objs:
-          cur = {}
-          cur["legId"] = l.info.qual + str(l.info.seq)
-          xyz = to_xyz_earth(*point.latlon(), point.altitude)
-          cur["latLon"] = (point.lat * 180 / pi, point.lon * 180 / pi)
-          cur["xyz"] = (xyz.x, xyz.y, xyz.z)
-          legPointsList.append(cur)
-        with open(f"cache/flightpaths/{proc_sig}_points.json", "w") as f:
-          f.write(json.dumps(points))
-        
-        self.proc_cache_info[proc_sig] = altitude
+        logger.warning(f"Tried to serve file {fileName} of {proc_sig} but it does not exist. Sending an empty file.")
+        location = (0, 0)
+      offset, length = location
       
-        serve_file()
+      try:
+        f = open(artifact.path, "rb")
+      except FileNotFoundError:
+        # evicted since it was looked up, it is built again on the next request
+        self.send_busy()
+        return
       
+      with f:
+        self.send_response(200)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+        # straight from the artifact file to the socket
+        if length: self.connection.sendfile(f, offset, length)
+    
   def redirect_to_index(self, from_viewer: bool = False):
     self.send_response(301)
     if from_viewer:
@@ -500,6 +614,10 @@ class CIFPServer(BaseHTTPRequestHandler):
     elif head == "airport":
       self.handle_airport(values)
     elif head == "proc":
-      self.handle_proc(values)
+      self.handle_proc(values, parse_qs(parsed.query))
+    elif head == "procs":
+      self.handle_procs(values)
+    elif head == "nearby":
+      self.handle_nearby(values)
     else:
        self.send_404()
@@ -0,0 +1,39 @@
+from http.server import HTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+SERVER_MODES = ["single", "threaded"]
+
+# Handles each request on one of a fixed number of worker threads, so that a slow build or a
+# large transfer does not hold up every other client. Connections that arrive while all
+# workers are busy wait in the pool's queue.
+class PooledHTTPServer(HTTPServer):
+  # the default backlog of 5 refuses connections as soon as a handful of clients connect at once
+  request_queue_size = 128
+
+  def __init__(self, server_address, handler_class, workers: int = 16):
+    super().__init__(server_address, handler_class)
+    self.workers = workers
+    self.pool = ThreadPoolExecutor(workers, thread_name_prefix="http")
+
+  def process_request(self, request, client_address):
+    self.pool.submit(self.process_request_thread, request, client_address)
+
+  # same as socketserver.ThreadingMixIn
+  def process_request_thread(self, request, client_address):
+    try:
+      self.finish_request(request, client_address)
+    except Exception:
+      self.handle_error(request, client_address)
+    finally:
+      self.shutdown_request(request)
+
+  def server_close(self):
+    super().server_close()
+    self.pool.shutdown(wait=False, cancel_futures=True)
+
+def make_server(mode: str, server_address, handler_class, workers: int = 16) -> HTTPServer:
+  if mode == "single":
+    return HTTPServer(server_address, handler_class)
+  if mode == "threaded":
+    return PooledHTTPServer(server_address, handler_class, workers)
+  raise ValueError(f"Unknown server mode `{mode}`. Possible modes are: " + ", ".join(SERVER_MODES))
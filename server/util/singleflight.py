@@ -0,0 +1,45 @@
+from threading import Lock, Event
+from typing import TypeVar, Callable, Generic, Hashable
+
+V = TypeVar('V')
+
+class Call(Generic[V]):
+  def __init__(self):
+    self.done = Event()
+    self.result: V | None = None
+    self.error: BaseException | None = None
+
+# Makes sure that concurrent calls with the same key only run the function once.
+# Everyone else waits for the first call to finish and gets its result (or exception).
+class SingleFlight(Generic[V]):
+  def __init__(self):
+    self.lock = Lock()
+    self.calls: dict[Hashable, Call[V]] = {}
+
+  def do(self, key: Hashable, fn: Callable[[], V]) -> V:
+    with self.lock:
+      call = self.calls.get(key)
+      leader = call is None
+      if leader:
+        call = Call()
+        self.calls[key] = call
+
+    if not leader:
+      call.done.wait()
+      if call.error: raise call.error
+      return call.result
+
+    try:
+      call.result = fn()
+      return call.result
+    except BaseException as e:
+      call.error = e
+      raise
+    finally:
+      with self.lock:
+        del self.calls[key]
+      call.done.set()
+
+  def in_flight(self) -> int:
+    with self.lock:
+      return len(self.calls)
@@ -73,35 +73,77 @@ async function do_debug() {
     // submit_icao("VHHH")
 }
 
-function loadObj(id, file, mtlFile) {
-    console.log("loading " + file)
+let pathMaterials = {};
+
+// the material of the path meshes, from an mtl file
+function loadMaterial(mtlFile) {
+    if (!pathMaterials[mtlFile]) {
+        pathMaterials[mtlFile] = new Promise((resolve, reject) => {
+            let mtl = new MTLLoader();
+            mtl.load(
+                mtlFile,
+                function (materials) {
+                    materials.preload();
+                    let material = materials.create("Path");
+                    // faces do not share normals, same as the OBJ files
+                    material.flatShading = true;
+                    resolve(material);
+                },
+                undefined,
+                reject
+            )
+        });
+    }
+    return pathMaterials[mtlFile];
+}
 
-    return new Promise((resolve, reject) => {
-        let mtl = new MTLLoader();
-        mtl.load(
-            mtlFile,
-            function (materials) {
-                materials.preload();
-                const loader = new OBJLoader();
-                loader.setMaterials(materials);
-                loader.load(
-                    file,
-                    function (object) {
-                        scene.add(object);
-                        resolve([id, object]);
-                    },
-                    (xhr) => {
-                        console.log((xhr.loaded / xhr.total) * 100 + '% loaded');
-                    },
-                    (error) => {
-                        console.log(error);
-                        reject(error);
-                    }
-                )
-            }
-        )
-    })
+// see server/navdata/mesh.py for the layout
+const MESH_HEADER_SIZE = 20;
+const MESH_LEG_SIZE = 24;
 
+function parseMesh(buffer) {
+    let view = new DataView(buffer);
+    let magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic != "PMSH" || view.getUint32(4, true) != 1) {
+        throw new Error("Not a path mesh");
+    }
+    let legCount = view.getUint32(8, true);
+    let vertexCount = view.getUint32(12, true);
+    let indexCount = view.getUint32(16, true);
+
+    let vertexStart = MESH_HEADER_SIZE + legCount * MESH_LEG_SIZE;
+    let vertices = new Float32Array(buffer, vertexStart, vertexCount * 3);
+    let indices = new Uint32Array(buffer, vertexStart + vertexCount * 12, indexCount);
+
+    let decoder = new TextDecoder();
+    let legs = {};
+    for (let i = 0; i < legCount; ++i) {
+        let offset = MESH_HEADER_SIZE + i * MESH_LEG_SIZE;
+        let id = decoder.decode(new Uint8Array(buffer, offset, 8)).replace(/\0+$/, "");
+        let firstVertex = view.getUint32(offset + 8, true);
+        let numVertices = view.getUint32(offset + 12, true);
+        let firstIndex = view.getUint32(offset + 16, true);
+        let numIndices = view.getUint32(offset + 20, true);
+        legs[id] = [
+            vertices.subarray(firstVertex * 3, (firstVertex + numVertices) * 3),
+            indices.subarray(firstIndex, firstIndex + numIndices)
+        ];
+    }
+    return legs;
+}
+
+async function loadMesh(file) {
+    console.log("loading " + file)
+    let res = await fetch(file);
+    if (!res.ok) throw new Error("Could not load " + file);
+    return parseMesh(await res.arrayBuffer());
+}
+
+function makeLegMesh(vertices, indices, material) {
+    let geometry = new THREE.BufferGeometry();
+    geometry.setAttribute("position", new THREE.BufferAttribute(vertices, 3));
+    geometry.setIndex(new THREE.BufferAttribute(indices, 1));
+    return new THREE.Mesh(geometry, material);
 }
 
 function go_to_pos(lat, lon, altitude) {
@@ -506,6 +548,7 @@ let airportSidebarArea = $("sidebar-airport-area");
 let legsSidebarArea = $("sidebar-legs-area");
 let rwySel = $("runway-selection");
 let transSel = $("transition-selection");
+let detailSel = $("detail-selection");
 
 let initingProc = false;
 async function initProc(proc) {
@@ -627,6 +670,10 @@ function registerLegKeyListeners(legId, prevLeg, nextLeg) {
     }
 }
 
+// level of detail of the paths, 0 is the full path (see LOD_TOLERANCES in server/navdata/builder.py)
+// chosen with the detail selection, whose options are the tolerance of each level
+let pathLod = 0;
+
 let legsArea = $("legs-area");
 let loadingProc = false;
 async function loadProc() {
@@ -643,6 +690,7 @@ async function loadProc() {
 
     rwySel.disabled = true;
     transSel.disabled = true;
+    detailSel.disabled = true;
 
     loadingProc = true;
 
@@ -658,7 +706,7 @@ async function loadProc() {
 
     legsArea.replaceChildren([]);
 
-    let promises = [];
+    let legMtls = [];
     
     let isMap = false;
     
@@ -699,9 +747,9 @@ async function loadProc() {
         if (i != data.length - 1) nextLeg = data[i + 1]["legId"];
         registerLegKeyListeners(leg["legId"], prevLeg, nextLeg);
         
-        let mtl = isMap ? "mappath.mtl" : "path.mtl"; 
-        promises.push(loadObj(leg["legId"], prefix + "/" + leg["legId"] + ".obj", mtl));
+        legMtls.push([leg["legId"], isMap ? "mappath.mtl" : "path.mtl"]);
     }
+    let meshPromise = loadMesh(prefix + "/path.mesh" + (pathLod ? "?lod=" + pathLod : ""));
 
     let points = await (await fetch(prefix + "/points.json")).json();
     let latlon = points["initialLatLon"];
@@ -711,15 +759,20 @@ async function loadProc() {
         go_to_pos(latlon[0] - 0.1, latlon[1], alt + 4000);
     }
 
-    let vals = await Promise.all(promises);
+    let meshes = await meshPromise;
     curObjs = {};
-    for (let i = 0; i < vals.length; ++i) {
-        let [id, obj] = vals[i];
+    for (let i = 0; i < legMtls.length; ++i) {
+        let [id, mtl] = legMtls[i];
+        let [vertices, indices] = meshes[id];
+        // each leg gets its own material, so that it can be highlighted on its own
+        let obj = makeLegMesh(vertices, indices, (await loadMaterial(mtl)).clone());
+        scene.add(obj);
         curObjs[id] = obj;
     }
 
     rwySel.disabled = false;
     transSel.disabled = false;
+    detailSel.disabled = false;
 
     loadingProc = false;
 
@@ -757,6 +810,11 @@ transSel.addEventListener("change", (e) => {
     loadProc();
 });
 
+detailSel.addEventListener("change", (e) => {
+    pathLod = parseInt(detailSel.options[detailSel.selectedIndex].value);
+    loadProc();
+});
+
 function registerProcClickListener(node, proc) {
     node.addEventListener("click", () => initProc(proc));
 }